@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from search_index import SearchIndex
+from synthetic_corpus import generate_corpus, generate_queries
+
+# Пакетный поиск (одно умножение разреженных матриц на пачку запросов)
+# против вызова search() на каждый запрос: с MaxScore и полным перебором.
+# Длинные списки пакет, как и MaxScore, не сливает целиком, а ограничивает
+# их вклад сверху; первый пакет включает разовую проверку списков и
+# построение ключей (IndexData.postings_cover_matrix, term_keys).
+# Результаты обязаны совпадать.
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--vocab', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--terms', type=int, default=3)
+    parser.add_argument('--head', type=int, default=20, help="добавлять в запрос один из head самых частых терминов")
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--chunk', type=int, default=1024, help="запросов в одном умножении матриц")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    vocab, matrix, idf, index = generate_corpus(args.docs, args.vocab)
+    search_index = SearchIndex.from_matrix(vocab, matrix, idf, index)
+    print(f"Корпус: {args.docs} документов, {matrix.nnz} ненулевых весов, построен за {time.perf_counter() - start:.1f} с")
+
+    queries = generate_queries(args.vocab, args.queries, args.terms, head=args.head)
+    runs = (
+        ('По одному, MaxScore', lambda: [search_index.search(query, args.top) for query in queries]),
+        ('По одному, полный перебор', lambda: [search_index.search(query, args.top, exhaustive=True)
+                                               for query in queries]),
+        (f"Пакетами по {args.chunk}", lambda: search_index.search_batch(queries, args.top, batch_size=args.chunk)),
+    )
+    results = []
+    for title, fn in runs:
+        start = time.perf_counter()
+        results.append(fn())
+        seconds = time.perf_counter() - start
+        print(f"{title}: {seconds:.2f} с ({len(queries) / seconds:.0f} запросов/с)")
+
+    mismatches = sum(1 for a, b in zip(results[0], results[2]) if a != b)
+    mismatches += sum(1 for a, b in zip(results[1], results[2]) if a != b)
+    print(f"Расхождений с пакетным поиском: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from search_index import SearchIndex
+from quantization import report
+from synthetic_corpus import generate_corpus, generate_queries
+
+# Память и согласие выдачи для float32/float16/int8 против float64
+# на синтетическом корпусе (project/quantization.py)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--vocab', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--terms', type=int, default=3)
+    parser.add_argument('--head', type=int, default=20, help="добавлять в запрос один из head самых частых терминов")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    vocab, matrix, idf, index = generate_corpus(args.docs, args.vocab)
+    print(f"Корпус: {args.docs} документов, {matrix.nnz} ненулевых весов, построен за {time.perf_counter() - start:.1f} с")
+    queries = generate_queries(args.vocab, args.queries, args.terms, head=args.head)
+    report(lambda precision: SearchIndex.from_matrix(vocab, matrix, idf, index, precision), queries, args.top)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from search_index import (
+    SearchIndex, load_tfidf_vectors, load_inverted_index, find_candidates,
+    vectorize, get_document_vector, cosine_similarity,
+)
+
+# Сравнение старого пути (плотный вектор на каждый документ-кандидат)
+# с оценкой через разреженную матрицу и заранее посчитанные нормы.
+
+def legacy_search(query_tokens, vocab, doc_vectors, idf_values, index, top_n=10):
+    query_vector = vectorize(query_tokens, vocab, idf_values)
+    scores = []
+    for doc_id in find_candidates(index, query_tokens):
+        doc_vector = get_document_vector(doc_vectors[doc_id], vocab)
+        score = cosine_similarity(query_vector, doc_vector)
+        if score > 0:
+            scores.append((doc_id, score))
+    scores.sort(key=lambda x: x[1], reverse=True)
+    return scores[:top_n]
+
+# Корпус размножается scale раз, чтобы увидеть зависимость от числа документов
+def replicate_corpus(doc_vectors, index, scale):
+    num_docs = len(doc_vectors)
+    doc_vectors = doc_vectors * scale
+    replicated = defaultdict(list)
+    for term, docs in index.items():
+        replicated[term] = [doc_id + copy * num_docs for copy in range(scale) for doc_id in docs]
+    return doc_vectors, replicated
+
+def time_queries(fn, queries):
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--terms', type=int, default=3)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    vocab, doc_vectors, idf_values = load_tfidf_vectors()
+    index = load_inverted_index()
+    doc_vectors, index = replicate_corpus(doc_vectors, index, args.scale)
+    search_index = SearchIndex.from_vectors(vocab, doc_vectors, idf_values, index)
+
+    rng = random.Random(args.seed)
+    terms = sorted(vocab)
+    queries = [rng.sample(terms, args.terms) for _ in range(args.queries)]
+
+    for query in queries:
+        expected = sorted(doc_id for doc_id, _ in legacy_search(query, vocab, doc_vectors, idf_values, index, top_n=len(doc_vectors)))
+        actual = sorted(doc_id for doc_id, _ in search_index.search(query, top_n=len(doc_vectors)))
+        assert expected == actual, f"Результаты расходятся для запроса {query}"
+
+    legacy_ms = time_queries(lambda q: legacy_search(q, vocab, doc_vectors, idf_values, index), queries)
+    sparse_ms = time_queries(lambda q: search_index.search(q), queries)
+
+    print(f"Документов: {len(doc_vectors)}, терминов: {len(vocab)}, запросов: {len(queries)}")
+    print(f"По документам (плотные векторы): {legacy_ms:.2f} мс/запрос")
+    print(f"Разреженная матрица (CSR):       {sparse_ms:.2f} мс/запрос")
+    print(f"Ускорение: x{legacy_ms / sparse_ms:.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from search_index import SearchIndex
+from synthetic_corpus import generate_corpus, generate_queries
+
+# Сравнение полного перебора кандидатов с top-k поиском (MaxScore)
+# на синтетическом корпусе. Результаты обязаны совпадать.
+
+def time_queries(fn, queries):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    mean_ms = sum(latencies) / len(latencies) * 1000
+    p99_ms = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return results, mean_ms, p99_ms
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=200000)
+    parser.add_argument('--vocab', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--terms', type=int, default=3)
+    parser.add_argument('--head', type=int, default=20, help="добавлять в запрос один из head самых частых терминов")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    vocab, matrix, idf, index = generate_corpus(args.docs, args.vocab)
+    search_index = SearchIndex.from_matrix(vocab, matrix, idf, index)
+    print(f"Корпус: {args.docs} документов, {matrix.nnz} ненулевых весов, построен за {time.perf_counter() - start:.1f} с")
+
+    queries = generate_queries(args.vocab, args.queries, args.terms, head=args.head)
+    exhaustive, exhaustive_mean, exhaustive_p99 = time_queries(
+        lambda q: search_index.search(q, args.top, exhaustive=True), queries)
+    maxscore, maxscore_mean, maxscore_p99 = time_queries(
+        lambda q: search_index.search(q, args.top), queries)
+
+    mismatches = sum(1 for a, b in zip(exhaustive, maxscore) if a != b)
+    print(f"Полный перебор: {exhaustive_mean:.2f} мс в среднем, p99 {exhaustive_p99:.2f} мс")
+    print(f"MaxScore top-{args.top}: {maxscore_mean:.2f} мс в среднем, p99 {maxscore_p99:.2f} мс")
+    print(f"Ускорение: x{exhaustive_mean / maxscore_mean:.1f}, расхождений: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
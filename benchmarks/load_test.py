@@ -0,0 +1,163 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(REPO, 'project'))
+from binary_index import resolve_index_path
+from search_index import INDEX_PATH, open_inverted_index
+
+# Нагрузочный тест project/serve.py: для каждого числа рабочих процессов
+# поднимается сервер, несколько клиентских потоков шлют запросы к
+# /api/search (или /api/search/batch) заданное время, считаются запросы в
+# секунду, p50/p99 задержки и память всего дерева процессов сервера (PSS —
+# общие страницы делятся между процессами, поэтому сумма PSS показывает
+# реальный расход). Запуск из папки над репозиторием:
+#   python information-search/benchmarks/load_test.py --workers 1,2,4 --duration 10
+
+def load_vocabulary():
+    index = open_inverted_index(resolve_index_path(INDEX_PATH))
+    return sorted(index.keys())
+
+def make_queries(vocabulary, count, max_terms, seed):
+    rng = random.Random(seed)
+    return [' '.join(rng.sample(vocabulary, rng.randint(1, max_terms))) for _ in range(count)]
+
+def process_tree(pid):
+    pids = [pid]
+    for child_pid in pids:
+        try:
+            with open(f'/proc/{child_pid}/task/{child_pid}/children') as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+def memory_kb(pid):
+    total = {'Rss': 0, 'Pss': 0}
+    for child_pid in process_tree(pid):
+        try:
+            with open(f'/proc/{child_pid}/smaps_rollup') as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    if key in total:
+                        total[key] += int(value.split()[0])
+        except OSError:
+            pass
+    return total
+
+def wait_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/cache')
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def client(port, queries, batch, deadline, latencies, errors, seed):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Content-Type': 'application/json'}
+    while time.monotonic() < deadline:
+        if batch > 1:
+            path, body = '/api/search/batch', {'queries': rng.sample(queries, batch)}
+        else:
+            path, body = '/api/search', {'query': rng.choice(queries)}
+        start = time.perf_counter()
+        try:
+            connection.request('POST', path, json.dumps(body), headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as error:
+            errors.append(str(error))
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+def run(workers, args, queries):
+    env = dict(os.environ)
+    if args.no_cache:
+        env['SEARCH_CACHE_SIZE'] = '0'
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(REPO, 'project', 'serve.py'), '--workers', str(workers),
+         '--threads', str(args.threads), '--port', str(args.port), '--server', args.server],
+        cwd=os.path.join(REPO, '..'), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_ready(args.port):
+            raise RuntimeError("сервер не поднялся")
+        memory_before = memory_kb(server.pid)
+        latencies = []
+        errors = []
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=client, args=(args.port, queries, args.batch, deadline, latencies, errors, i))
+                   for i in range(args.concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        memory_after = memory_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+    return {
+        'workers': workers,
+        'requests': len(latencies),
+        'queries_per_request': args.batch,
+        'errors': len(errors),
+        'rps': len(latencies) / elapsed,
+        'qps': len(latencies) * args.batch / elapsed,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'rss_mb': memory_after['Rss'] / 1024,
+        'pss_mb': memory_after['Pss'] / 1024,
+        'pss_idle_mb': memory_before['Pss'] / 1024,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест веб-поиска")
+    parser.add_argument('--workers', default='1,2,4', help="список чисел рабочих процессов через запятую")
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'prefork'), default='auto')
+    parser.add_argument('--concurrency', type=int, default=8, help="клиентских потоков")
+    parser.add_argument('--duration', type=float, default=10.0, help="секунд на каждое число рабочих")
+    parser.add_argument('--batch', type=int, default=1, help="запросов в одном обращении (>1 — /api/search/batch)")
+    parser.add_argument('--queries', type=int, default=1000, help="различных запросов")
+    parser.add_argument('--terms', type=int, default=3, help="наибольшее число слов в запросе")
+    parser.add_argument('--no-cache', action='store_true', help="отключить кэш результатов в сервере")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--json', help="записать результаты в файл")
+    args = parser.parse_args()
+
+    queries = make_queries(load_vocabulary(), args.queries, args.terms, seed=0)
+    reports = []
+    print(f"{'рабочих':>8} {'запр/с':>9} {'p50, мс':>9} {'p99, мс':>9} {'ошибок':>7} {'RSS, МБ':>9} {'PSS, МБ':>9}")
+    for workers in [int(w) for w in args.workers.split(',')]:
+        report = run(workers, args, queries)
+        reports.append(report)
+        print(f"{workers:>8} {report['rps']:>9.1f} {report['p50_ms']:>9.2f} {report['p99_ms']:>9.2f} "
+              f"{report['errors']:>7} {report['rss_mb']:>9.1f} {report['pss_mb']:>9.1f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
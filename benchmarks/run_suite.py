@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import scipy
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(REPO, 'project'))
+sys.path.insert(0, os.path.join(REPO, 'task_3'))
+sys.path.insert(0, os.path.join(REPO, 'task_4'))
+from lemma_cache import LemmaCache
+from search_index import SearchIndex
+from search_engine import BooleanSearchEngine, tokenize_and_clean
+from analyze import term_dictionary, document_frequencies, compute_idf, compute_tfidf
+from synthetic_corpus import (
+    default_vocabulary, generate_documents, generate_text_queries, generate_boolean_queries,
+)
+
+# Воспроизводимый набор замеров на синтетическом корпусе (Zipf):
+#   generate        генерация текстов
+#   preprocess      токенизация, фильтрация и лемматизация (как в task_2/task_3)
+#   boolean_build   построение BooleanSearchEngine (task_3)
+#   tfidf_build     DF/IDF/TF-IDF (task_4)
+#   boolean_query   p50/p99 булевых запросов
+#   vector_query    p50/p99 запросов SearchIndex (косинус TF-IDF, top-k)
+# Время меряется без трассировки памяти; пик памяти сборки — отдельным
+# прогоном под tracemalloc (--no-memory, чтобы пропустить). Отчёт пишется в
+# JSON, --compare печатает изменение относительно прошлого отчёта.
+#   python information-search/benchmarks/run_suite.py --docs 10000 --compare old.json
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def traced_peak_mb(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current / 2 ** 20, peak / 2 ** 20
+
+def latency_report(fn, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return {
+        'queries': len(queries),
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+def preprocess(documents):
+    lemma_cache = LemmaCache(path=None)
+    tokenize_seconds = 0.0
+    lemmatize_seconds = 0.0
+    tokens = []
+    lemmas = []
+    for text in documents:
+        start = time.perf_counter()
+        doc_tokens = sorted(tokenize_and_clean(text))
+        tokenize_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        token_lemmas = lemma_cache.lemmatize_batch(doc_tokens)
+        lemmatize_seconds += time.perf_counter() - start
+        tokens.append(doc_tokens)
+        lemmas.append([token_lemmas[token] for token in doc_tokens])
+    return tokens, lemmas, tokenize_seconds, lemmatize_seconds
+
+def build_tfidf(tokens):
+    terms, term_ids = term_dictionary(tokens)
+    df = document_frequencies(tokens, term_ids)
+    idf = compute_idf(df, len(tokens))
+    return term_ids, compute_tfidf(tokens, term_ids, idf), idf
+
+def git_commit():
+    try:
+        return subprocess.run(['git', '-C', REPO, 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(args):
+    stages = {}
+    vocabulary = default_vocabulary(args.vocab, seed=args.seed)
+
+    documents, seconds = timed(lambda: generate_documents(args.docs, vocabulary, args.doc_length,
+                                                          args.exponent, args.seed))
+    stages['generate'] = {'seconds': seconds}
+    print(f"generate: {args.docs} документов за {seconds:.2f} с")
+
+    (tokens, lemmas, tokenize_seconds, lemmatize_seconds), seconds = timed(lambda: preprocess(documents))
+    stages['preprocess'] = {
+        'seconds': seconds,
+        'docs_per_second': args.docs / seconds,
+        'tokenize_seconds': tokenize_seconds,
+        'lemmatize_seconds': lemmatize_seconds,
+        'distinct_lemmas': len({lemma for doc in lemmas for lemma in doc}),
+    }
+    print(f"preprocess: {seconds:.2f} с ({args.docs / seconds:.0f} док/с)")
+
+    engine, seconds = timed(lambda: BooleanSearchEngine(documents, index_path=None))
+    stages['boolean_build'] = {'seconds': seconds, 'terms': len(engine.index)}
+    print(f"boolean_build: {seconds:.2f} с, терминов {len(engine.index)}")
+
+    (term_ids, matrix, idf), seconds = timed(lambda: build_tfidf(tokens))
+    stages['tfidf_build'] = {'seconds': seconds, 'terms': len(term_ids), 'nnz': int(matrix.nnz)}
+    print(f"tfidf_build: {seconds:.2f} с, ненулевых весов {matrix.nnz}")
+
+    if args.memory:
+        for name, fn in (('preprocess', lambda: preprocess(documents)),
+                         ('boolean_build', lambda: BooleanSearchEngine(documents, index_path=None)),
+                         ('tfidf_build', lambda: build_tfidf(tokens))):
+            _, current, peak = traced_peak_mb(fn)
+            stages[name]['peak_mb'] = peak
+            stages[name]['retained_mb'] = current
+            print(f"{name}: пик памяти {peak:.1f} МБ")
+
+    boolean_queries = generate_boolean_queries(vocabulary, args.queries, seed=args.seed + 2)
+    stages['boolean_query'] = latency_report(engine.search, boolean_queries)
+
+    search_index = SearchIndex.from_matrix(term_ids, matrix, idf, engine.sorted_postings())
+    text_queries = generate_text_queries(vocabulary, args.queries, seed=args.seed + 1)
+    stages['vector_query'] = latency_report(lambda q: search_index.search(q, args.top), text_queries)
+    if args.memory:
+        _, _, peak = traced_peak_mb(lambda: SearchIndex.from_matrix(term_ids, matrix, idf, engine.sorted_postings()))
+        stages['vector_query']['index_build_peak_mb'] = peak
+    for name in ('boolean_query', 'vector_query'):
+        report = stages[name]
+        print(f"{name}: p50 {report['p50_ms']:.3f} мс, p99 {report['p99_ms']:.3f} мс")
+
+    return {
+        'config': vars(args),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'commit': git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': stages,
+    }
+
+# Меньше — лучше для всех метрик, кроме пропускной способности
+HIGHER_IS_BETTER = {'docs_per_second'}
+
+def compare(report, baseline):
+    print(f"\nСравнение с {baseline['environment'].get('created')} ({baseline['environment'].get('commit')}):")
+    for stage, metrics in report['stages'].items():
+        old_metrics = baseline['stages'].get(stage, {})
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+                continue
+            if not (metric.endswith(('seconds', '_ms', '_mb')) or metric in HIGHER_IS_BETTER):
+                continue
+            change = (value - old) / old
+            worse = change < 0 if metric in HIGHER_IS_BETTER else change > 0
+            mark = ' <- хуже' if worse and abs(change) > 0.1 else ''
+            print(f"  {stage}.{metric}: {old:.4g} -> {value:.4g} ({change:+.1%}){mark}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Набор замеров на синтетическом корпусе")
+    parser.add_argument('--docs', type=int, default=10000, help="документов (от 1e3 до 1e6)")
+    parser.add_argument('--vocab', type=int, default=20000, help="размер словаря")
+    parser.add_argument('--doc-length', type=int, default=120, help="средняя длина документа в словах")
+    parser.add_argument('--exponent', type=float, default=1.1, help="показатель Zipf")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="не мерить пик памяти")
+    parser.add_argument('--output', help="файл отчёта (по умолчанию benchmarks/results/suite_<docs>_<время>.json)")
+    parser.add_argument('--compare', help="отчёт прошлого запуска для сравнения")
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    output = args.output or os.path.join(REPO, 'benchmarks', 'results',
+                                         f"suite_{args.docs}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Отчёт: {output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import numpy as np
+from scipy import sparse
+
+# Синтетический корпус с Zipf-распределением терминов. Возвращает то же, что
+# SearchIndex получает из файлов task_3/task_4: словарь, CSR матрицу TF-IDF,
+# вектор IDF и инвертированный индекс (термин -> отсортированные doc id).
+
+def zipf_probabilities(vocab_size, exponent=1.1):
+    ranks = np.arange(1, vocab_size + 1, dtype=np.float64)
+    weights = 1.0 / ranks ** exponent
+    return weights / weights.sum()
+
+def generate_term_matrix(num_docs, vocab_size=50000, doc_length=120, exponent=1.1, seed=0):
+    rng = np.random.default_rng(seed)
+    probabilities = zipf_probabilities(vocab_size, exponent)
+    lengths = rng.poisson(doc_length, size=num_docs).clip(min=1)
+    doc_ids = np.repeat(np.arange(num_docs, dtype=np.int64), lengths)
+    term_ids = rng.choice(vocab_size, size=len(doc_ids), p=probabilities)
+    # Первый термин встречается в каждом документе, как "aa" в реальном корпусе
+    term_ids[np.concatenate(([0], np.cumsum(lengths)[:-1]))] = 0
+    counts = sparse.csr_matrix(
+        (np.ones(len(doc_ids)), (doc_ids, term_ids)), shape=(num_docs, vocab_size)
+    )
+    counts.sum_duplicates()
+    return counts, lengths
+
+def generate_corpus(num_docs, vocab_size=50000, doc_length=120, exponent=1.1, seed=0):
+    counts, lengths = generate_term_matrix(num_docs, vocab_size, doc_length, exponent, seed)
+    df = np.bincount(counts.indices, minlength=vocab_size)
+    idf = np.zeros(vocab_size)
+    idf[df > 0] = np.log(num_docs / df[df > 0])
+    rows = np.repeat(np.arange(num_docs), np.diff(counts.indptr))
+    # Нулевые веса (термины из всех документов) хранятся явно, как в файлах task_4
+    matrix = counts.copy()
+    matrix.data = counts.data / lengths[rows] * idf[counts.indices]
+    vocab = {f"t{i}": i for i in range(vocab_size)}
+    columns = counts.tocsc()
+    columns.sort_indices()
+    index = {
+        f"t{i}": columns.indices[columns.indptr[i]:columns.indptr[i + 1]].astype(np.int64)
+        for i in range(vocab_size) if columns.indptr[i + 1] > columns.indptr[i]
+    }
+    return vocab, matrix, idf, index
+
+def generate_queries(vocab_size, num_queries, terms_per_query=3, exponent=1.1, seed=1, head=0):
+    # head > 0 добавляет в каждый запрос один из самых частых терминов
+    rng = np.random.default_rng(seed)
+    probabilities = zipf_probabilities(vocab_size, exponent)
+    queries = []
+    for _ in range(num_queries):
+        query = [f"t{t}" for t in rng.choice(vocab_size, size=terms_per_query, p=probabilities)]
+        if head:
+            query.append(f"t{rng.integers(0, head)}")
+        queries.append(query)
+    return queries
+
+# Словарь для текстового корпуса: английские слова из nltk (их пропустит
+# фильтр предобработки), перемешанные с фиксированным seed, чтобы частые по
+# Zipf слова не шли по алфавиту. Без nltk — слова вида "t123", которые
+# предобработка отбросит, поэтому об этом предупреждаем.
+def default_vocabulary(size, seed=0):
+    try:
+        from nltk.corpus import words, stopwords
+        stop_words = set(stopwords.words('english'))
+        candidates = sorted({w.lower() for w in words.words() if w.isalpha() and len(w) > 1} - stop_words)
+    except (ImportError, LookupError):
+        print("Предупреждение: нет словаря nltk, используются синтетические слова")
+        return [f"t{i}" for i in range(size)]
+    rng = np.random.default_rng(seed)
+    rng.shuffle(candidates)
+    return candidates[:size]
+
+def generate_documents(num_docs, vocabulary, doc_length=120, exponent=1.1, seed=0):
+    rng = np.random.default_rng(seed)
+    probabilities = zipf_probabilities(len(vocabulary), exponent)
+    lengths = rng.poisson(doc_length, size=num_docs).clip(min=1)
+    word_ids = rng.choice(len(vocabulary), size=int(lengths.sum()), p=probabilities)
+    words = np.array(vocabulary, dtype=object)[word_ids]
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    return [' '.join(words[bounds[i]:bounds[i + 1]]) for i in range(num_docs)]
+
+def generate_text_queries(vocabulary, num_queries, max_terms=3, exponent=1.1, seed=1):
+    rng = np.random.default_rng(seed)
+    probabilities = zipf_probabilities(len(vocabulary), exponent)
+    return [[vocabulary[t] for t in rng.choice(len(vocabulary), size=rng.integers(1, max_terms + 1), p=probabilities)]
+            for _ in range(num_queries)]
+
+# Булевы запросы: случайное дерево AND/OR с NOT и скобками над словами по Zipf
+def generate_boolean_queries(vocabulary, num_queries, max_terms=4, exponent=1.1, seed=2):
+    rng = np.random.default_rng(seed)
+    probabilities = zipf_probabilities(len(vocabulary), exponent)
+
+    def expression(terms):
+        if terms == 1:
+            word = vocabulary[rng.choice(len(vocabulary), p=probabilities)]
+            return f"NOT {word}" if rng.random() < 0.2 else word
+        left = int(rng.integers(1, terms))
+        operator = 'AND' if rng.random() < 0.6 else 'OR'
+        text = f"{expression(left)} {operator} {expression(terms - left)}"
+        return f"({text})" if rng.random() < 0.3 else text
+
+    return [expression(int(rng.integers(1, max_terms + 1))) for _ in range(num_queries)]
@@ -0,0 +1,129 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from term_dictionary import TermDictionary, read_dictionary, write_dictionary
+
+# Снимок ресурсов анализатора: английский словарь NLTK (words, ~236 тыс.
+# слов) и стоп-слова в одном файле. Словари хранятся сжатыми
+# (term_dictionary.py) и читаются через mmap, так что процессу не нужно
+# импортировать nltk (больше секунды) и строить множества строк при запуске.
+#   заголовок   MAGIC, версия, смещение оглавления
+#   словари     блоки и смещения блоков, выровнены на 8 байт
+#   оглавление  JSON {"words": {...}, "stopwords": {...}}
+# Без снимка слова, как раньше, берутся из корпусов NLTK.
+# После обновления данных NLTK снимок нужно пересобрать:
+#   python information-search/project/analyzer.py build
+
+MAGIC = b'ANLZ'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIQ')
+
+ANALYZER_PATH = 'information-search/task_2/analyzer.bin'
+
+# Слова из одних букв, которые word_tokenize всё же разрезает (can|not, gon|na...)
+TREEBANK_SPLIT_WORDS = {'cannot', 'gimme', 'gonna', 'gotta', 'lemme', 'wanna'}
+
+def nltk_word_sets():
+    from nltk.corpus import stopwords, words
+    return set(words.words()), set(stopwords.words('english'))
+
+def word_tokenize(text):
+    # nltk импортируется при первом вызове, а не при импорте модулей task_2..task_4
+    from nltk.tokenize import word_tokenize as nltk_word_tokenize
+    return nltk_word_tokenize(text)
+
+def tokenize_words(text):
+    # Текст из одних буквенных слов (запрос, фраза) word_tokenize делит по
+    # пробелам, поэтому nltk для него не нужен; остальное — через word_tokenize
+    parts = text.split()
+    if all(part.isalpha() and part.lower() not in TREEBANK_SPLIT_WORDS for part in parts):
+        return parts
+    return word_tokenize(text)
+
+class WordFilter:
+    # Проверки слов, общие для task_2, task_3 и task_4. english_vocab и
+    # stop_words — сжатые словари из снимка или множества из корпусов NLTK
+
+    def __init__(self, english_vocab, stop_words):
+        self.english_vocab = english_vocab
+        self.stop_words = stop_words
+        self._index_tokens = {}
+
+    def is_english_word(self, word):
+        return word.lower() in self.english_vocab
+
+    def is_stop_word(self, word):
+        return word.lower() in self.stop_words
+
+    def is_index_token(self, token):
+        # Слово из букв длиннее одной, есть в словаре и не стоп-слово.
+        # Ответ запоминается: в текстах одни и те же слова повторяются
+        result = self._index_tokens.get(token)
+        if result is None:
+            result = (token.isalpha() and len(token) > 1 and self.is_english_word(token)
+                      and not self.is_stop_word(token))
+            self._index_tokens[token] = result
+        return result
+
+def write_snapshot(english_vocab, stop_words, path=ANALYZER_PATH):
+    tmp_path = path + '.tmp'
+    table = {}
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+
+        def append(blob):
+            offset = f.tell()
+            f.write(blob)
+            f.write(b'\0' * (-len(blob) % 8))
+            return offset
+
+        for name, words in (('words', english_vocab), ('stopwords', stop_words)):
+            table[name] = write_dictionary(TermDictionary.from_terms(sorted(words)), append)
+        table_offset = append(json.dumps(table).encode('utf-8'))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, table_offset))
+    os.replace(tmp_path, path)
+
+def open_snapshot(path=ANALYZER_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, table_offset = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"{path}: неподдерживаемый формат снимка анализатора")
+    table = json.loads(data[table_offset:].rstrip(b'\0').decode('utf-8'))
+    return WordFilter(read_dictionary(data, table['words']), read_dictionary(data, table['stopwords']))
+
+_word_filter = None
+
+def get_word_filter(path=ANALYZER_PATH):
+    global _word_filter
+    if _word_filter is None:
+        _word_filter = open_snapshot(path) or WordFilter(*nltk_word_sets())
+    return _word_filter
+
+def build(path=ANALYZER_PATH):
+    start = time.perf_counter()
+    english_vocab, stop_words = nltk_word_sets()
+    nltk_seconds = time.perf_counter() - start
+    write_snapshot(english_vocab, stop_words, path)
+
+    start = time.perf_counter()
+    snapshot = open_snapshot(path)
+    snapshot.is_english_word('a')
+    snapshot_seconds = time.perf_counter() - start
+
+    reference = WordFilter(english_vocab, stop_words)
+    for word in list(english_vocab) + [word.lower() for word in english_vocab] + list(stop_words):
+        assert snapshot.is_index_token(word) == reference.is_index_token(word), f"расхождение на '{word}'"
+    print(f"Слов: {len(english_vocab)}, стоп-слов: {len(stop_words)}, файл {os.path.getsize(path) / 1024:.1f} КБ")
+    print(f"Загрузка: nltk {nltk_seconds * 1000:.1f} мс, снимок {snapshot_seconds * 1000:.2f} мс")
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['build']:
+        sys.exit("использование: analyzer.py build [путь]")
+    build(*sys.argv[2:3])
@@ -1,20 +1,145 @@
-from flask import Flask, render_template, request
-import re
-from vector_search import search
+from flask import Flask, Response, g, render_template, request, jsonify
+from vector_search import (SEARCH_MODES, search, search_batch, get_index, get_lemma_index, get_semantic_index,
+                           available_modes, reload_index, query_cache)
+from metrics import metrics
+from term_dictionary import split_query
 from flask import send_file
 from bs4 import BeautifulSoup
 import os
+import time
 
 app = Flask(__name__)
 
+# Загружаем индекс при старте процесса, а не на первом запросе
+get_index()
+
+# В режиме нескольких процессов POST /reload попадает только в один из них,
+# поэтому каждый процесс сам проверяет файлы индекса не чаще раза в
+# SEARCH_RELOAD_INTERVAL секунд (0 — не проверять). Если поиск идёт по
+# сегментам task_3, которые дописывает потоковая индексация, по умолчанию
+# проверка раз в секунду: новые страницы находятся через секунды
+DEFAULT_RELOAD_INTERVAL = 1 if getattr(get_index(), 'uses_segments', False) else 0
+RELOAD_INTERVAL = float(os.environ.get('SEARCH_RELOAD_INTERVAL', DEFAULT_RELOAD_INTERVAL))
+_last_reload_check = time.monotonic()
+
+@app.before_request
+def check_index_files():
+    global _last_reload_check
+    if RELOAD_INTERVAL > 0 and time.monotonic() - _last_reload_check >= RELOAD_INTERVAL:
+        _last_reload_check = time.monotonic()
+        reload_index()
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unknown'
+        metrics.observe('http_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+        metrics.inc('http_requests_total', endpoint=endpoint, status=response.status_code)
+    return response
+
+MAX_TOP_N = 100
+MAX_BATCH_QUERIES = 100
+
+MODE_LABELS = {'tfidf': 'по словам', 'lemmas': 'по леммам', 'semantic': 'по смыслу (LSA)'}
+
+def query_tokens(query):
+    return split_query(query)
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     results = []
+    modes = available_modes()
+    mode = 'tfidf'
     if request.method == 'POST':
         query = request.form['query']
-        tokens = re.findall(r'\w+', query.lower())
-        results = search(tokens, return_results=True)
-    return render_template('index.html', results=results)
+        if request.form.get('mode') in modes:
+            mode = request.form['mode']
+        tokens = query_tokens(query)
+        results = search(tokens, return_results=True, mode=mode)
+    return render_template('index.html', results=results, mode=mode,
+                           modes=[(name, MODE_LABELS[name]) for name in modes])
+
+def read_top_n(value):
+    try:
+        top_n = int(value)
+    except (TypeError, ValueError):
+        return None
+    return top_n if 0 < top_n <= MAX_TOP_N else None
+
+def mode_error(mode):
+    if mode not in SEARCH_MODES:
+        return jsonify({'error': f"mode должен быть одним из: {', '.join(SEARCH_MODES)}"}), 400
+    if mode == 'semantic' and get_semantic_index() is None:
+        return jsonify({'error': "семантический индекс не построен (project/semantic_index.py build)"}), 503
+    if mode == 'lemmas' and get_lemma_index() is None:
+        return jsonify({'error': "нет TF-IDF по леммам (task_4/analyze.py)"}), 503
+    return None
+
+# JSON API: GET /api/search?q=...&top_n=10&mode=semantic или POST {"query": ..., "top_n": ..., "mode": ...};
+# mode — tfidf (по умолчанию), lemmas (по леммам) или semantic
+@app.route('/api/search', methods=['GET', 'POST'])
+def api_search():
+    if request.method == 'POST':
+        params = request.get_json(silent=True) or {}
+    else:
+        params = request.args
+    query = params.get('query', params.get('q'))
+    top_n = read_top_n(params.get('top_n', 10))
+    if not isinstance(query, str) or top_n is None:
+        return jsonify({'error': f"нужны query (строка) и top_n от 1 до {MAX_TOP_N}"}), 400
+    mode = params.get('mode', 'tfidf')
+    error = mode_error(mode)
+    if error:
+        return error
+    start = time.perf_counter()
+    results = search(query_tokens(query), top_n, return_results=True, mode=mode)
+    return jsonify({'query': query, 'mode': mode, 'results': results,
+                    'took_ms': (time.perf_counter() - start) * 1000})
+
+# Пакетный поиск: POST {"queries": [...], "top_n": 10, "mode": "tfidf"} -> результаты в том же порядке
+@app.route('/api/search/batch', methods=['POST'])
+def api_search_batch():
+    params = request.get_json(silent=True) or {}
+    queries = params.get('queries')
+    top_n = read_top_n(params.get('top_n', 10))
+    if (not isinstance(queries, list) or not all(isinstance(q, str) for q in queries)
+            or len(queries) > MAX_BATCH_QUERIES or top_n is None):
+        return jsonify({'error': f"нужен список queries (до {MAX_BATCH_QUERIES} строк) и top_n от 1 до {MAX_TOP_N}"}), 400
+    mode = params.get('mode', 'tfidf')
+    error = mode_error(mode)
+    if error:
+        return error
+    start = time.perf_counter()
+    results = search_batch([query_tokens(query) for query in queries], top_n, mode=mode)
+    return jsonify({'results': results, 'took_ms': (time.perf_counter() - start) * 1000})
+
+@app.route('/reload', methods=['POST'])
+def reload():
+    force = request.args.get('force') == '1'
+    reloaded = reload_index(force=force)
+    return jsonify({'reloaded': reloaded, 'version': get_index().version})
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(query_cache.stats())
+
+# Счётчики и время стадий поиска в текстовом формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    cache = query_cache.stats()
+    index = get_index()
+    gauges = {
+        'search_cache_entries': cache['size'],
+        'search_cache_hit_rate': cache['hit_rate'],
+        'search_index_version': index.version,
+        'search_index_docs': index.num_docs or 0,
+    }
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=True)
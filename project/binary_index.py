@@ -0,0 +1,235 @@
+import mmap
+import os
+import struct
+import sys
+import time
+import numpy as np
+
+# Бинарный формат инвертированного индекса:
+#   заголовок     MAGIC, версия, число терминов, число документов,
+#                 смещения таблицы терминов, строк и списков
+#   таблица       на каждый термин смещение строки и смещение списка
+#                 (плюс замыкающая запись, длины берутся как разности)
+#   строки        термины в UTF-8, отсортированы по байтам
+#   списки        df (varint), затем doc id в виде разностей, закодированных varint
+# Файл читается через mmap: открытие не зависит от размера индекса,
+# а страницы делятся между всеми процессами, открывшими один файл.
+
+MAGIC = b'IIDX'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIIIQQQ')
+TERM_ENTRY = struct.Struct('<II')
+
+INDEX_PATH = 'information-search/task_3/inverted_index.txt'
+BINARY_INDEX_PATH = 'information-search/task_3/inverted_index.bin'
+# Леммы -> документы; пишет task_4/analyze.py вместе с tfidf.bin
+LEMMA_INDEX_PATH = 'information-search/task_4/lemma_index.bin'
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def decode_varint(buffer, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def encode_postings(doc_ids):
+    out = bytearray()
+    previous = 0
+    for doc_id in doc_ids:
+        encode_varint(doc_id - previous, out)
+        previous = doc_id
+    return bytes(out)
+
+# Векторные варианты для длинных последовательностей (позиционный индекс)
+def encode_varints(values):
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+    starts = np.cumsum(lengths) - lengths
+    byte_index = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+    shifts = (byte_index * 7).astype(np.uint64)
+    out = ((np.repeat(values, lengths) >> shifts) & np.uint64(0x7F)).astype(np.uint8)
+    out[byte_index < np.repeat(lengths, lengths) - 1] |= 0x80
+    return out.tobytes()
+
+def decode_varints(buffer):
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Конец каждого числа — байт без старшего бита
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shift = (np.arange(len(data)) - starts[group]) * 7
+    values = (data & 0x7F).astype(np.int64) << shift
+    return np.add.reduceat(values, starts)
+
+def decode_postings(buffer):
+    return np.cumsum(decode_varints(buffer))
+
+def write_binary_index(index, path):
+    items = sorted(((term.encode('utf-8'), sorted(docs)) for term, docs in index.items()), key=lambda x: x[0])
+    num_docs = max((docs[-1] for _, docs in items if docs), default=-1) + 1
+
+    term_blob = bytearray()
+    postings_blob = bytearray()
+    table = bytearray()
+    for term, docs in items:
+        table += TERM_ENTRY.pack(len(term_blob), len(postings_blob))
+        term_blob += term
+        encode_varint(len(docs), postings_blob)
+        postings_blob += encode_postings(docs)
+    table += TERM_ENTRY.pack(len(term_blob), len(postings_blob))
+
+    table_offset = HEADER.size
+    terms_offset = table_offset + len(table)
+    postings_offset = terms_offset + len(term_blob)
+    # Пишем во временный файл и подменяем атомарно: процессы, у которых
+    # открыт старый индекс, продолжают читать свою копию
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(items), num_docs, table_offset, terms_offset, postings_offset))
+        f.write(table)
+        f.write(term_blob)
+        f.write(postings_blob)
+    os.replace(tmp_path, path)
+
+class BinaryInvertedIndex:
+    # Словарь термин -> np.array doc id поверх mmap бинарного файла
+
+    def __init__(self, path=BINARY_INDEX_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_terms, self.num_docs, self._table_offset, self._terms_offset, self._postings_offset = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path}: неподдерживаемый формат индекса")
+
+    def close(self):
+        self._mmap.close()
+
+    def _entry(self, position):
+        return TERM_ENTRY.unpack_from(self._mmap, self._table_offset + position * TERM_ENTRY.size)
+
+    def _term_at(self, position):
+        start, _ = self._entry(position)
+        end, _ = self._entry(position + 1)
+        return self._mmap[self._terms_offset + start:self._terms_offset + end]
+
+    def _find(self, term):
+        key = term.encode('utf-8')
+        low = self._rank(key)
+        if low < self.num_terms and self._term_at(low) == key:
+            return low
+        return None
+
+    def _postings_at(self, position):
+        _, start = self._entry(position)
+        _, end = self._entry(position + 1)
+        _, start = decode_varint(self._mmap, self._postings_offset + start)
+        return decode_postings(self._mmap[start:self._postings_offset + end])
+
+    def document_frequency(self, term):
+        position = self._find(term)
+        if position is None:
+            return 0
+        _, start = self._entry(position)
+        return decode_varint(self._mmap, self._postings_offset + start)[0]
+
+    def get(self, term, default=None):
+        position = self._find(term)
+        if position is None:
+            return default
+        return self._postings_at(position)
+
+    def __getitem__(self, term):
+        position = self._find(term)
+        if position is None:
+            raise KeyError(term)
+        return self._postings_at(position)
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def __len__(self):
+        return self.num_terms
+
+    def _rank(self, key):
+        low, high = 0, self.num_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Те же методы, что у term_dictionary.TermDictionary, для шаблонов learn*
+    def prefix_range(self, prefix):
+        key = prefix.encode('utf-8')
+        return self._rank(key), self._rank(key + b'\xff')
+
+    def terms_in_range(self, low, high):
+        for position in range(low, high):
+            yield self._term_at(position).decode('utf-8')
+
+    def __iter__(self):
+        for position in range(self.num_terms):
+            yield self._term_at(position).decode('utf-8')
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        for position in range(self.num_terms):
+            yield self._term_at(position).decode('utf-8'), self._postings_at(position)
+
+# Бинарный индекс используется, только если он не старше текстового
+def resolve_index_path(index_path):
+    if index_path.endswith('.bin'):
+        return index_path
+    binary_path = os.path.splitext(index_path)[0] + '.bin'
+    if os.path.exists(binary_path) and (
+            not os.path.exists(index_path) or os.path.getmtime(binary_path) >= os.path.getmtime(index_path)):
+        return binary_path
+    return index_path
+
+def convert(text_path=INDEX_PATH, binary_path=BINARY_INDEX_PATH):
+    # Импорт здесь, чтобы модуль не зависел от search_index
+    from search_index import load_inverted_index
+
+    start = time.perf_counter()
+    index = load_inverted_index(text_path)
+    text_load = time.perf_counter() - start
+    write_binary_index(index, binary_path)
+
+    start = time.perf_counter()
+    binary = BinaryInvertedIndex(binary_path)
+    binary_open = time.perf_counter() - start
+
+    for term, docs in index.items():
+        assert binary[term].tolist() == docs, f"Списки для '{term}' не совпадают"
+
+    text_size = os.path.getsize(text_path)
+    binary_size = os.path.getsize(binary_path)
+    print(f"Терминов: {len(index)}, документов: {binary.num_docs}")
+    print(f"Размер: текст {text_size / 1024:.1f} КБ, бинарный {binary_size / 1024:.1f} КБ (x{text_size / binary_size:.1f})")
+    print(f"Загрузка: текст {text_load * 1000:.1f} мс, бинарный (mmap) {binary_open * 1000:.3f} мс")
+    binary.close()
+
+if __name__ == '__main__':
+    convert(*sys.argv[1:3])
@@ -0,0 +1,329 @@
+import re
+import numpy as np
+from metrics import metrics
+from term_dictionary import TermPostings, expand_pattern, is_pattern
+
+# Разбор булевых запросов в дерево и его вычисление над отсортированными
+# массивами doc id. Приоритет операторов как в исходной версии через eval:
+# NOT связывает сильнее AND, AND сильнее OR. Фразы в кавычках и NEAR/k
+# (слова не дальше k позиций друг от друга) связывают сильнее всех и
+# вычисляются по позиционному индексу (project/positional_index.py).
+# Шаблон learn* или colo?r — OR всех подходящих терминов индекса.
+
+OPERATORS = {
+    'AND': 'AND', 'И': 'AND',
+    'OR': 'OR', 'ИЛИ': 'OR',
+    'NOT': 'NOT', 'НЕ': 'NOT',
+}
+NEAR_OPERATORS = {'NEAR', 'РЯДОМ'}
+
+class QuerySyntaxError(ValueError):
+    pass
+
+class Term:
+    def __init__(self, term):
+        self.term = term
+
+    def __repr__(self):
+        return f"Term({self.term!r})"
+
+class Wildcard:
+    # terms заполняется при вычислении: у каждого шарда свой набор терминов
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.terms = None
+
+    def __repr__(self):
+        return f"Wildcard({self.pattern!r})"
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def __repr__(self):
+        return f"Not({self.child!r})"
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return f"And({self.children!r})"
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return f"Or({self.children!r})"
+
+class Phrase:
+    # terms[i] должен стоять на позиции начала фразы + offsets[i]; смещения
+    # учитывают выброшенные стоп-слова ("state of the art" -> state +0, art +3)
+    def __init__(self, terms, offsets):
+        self.terms = terms
+        self.offsets = offsets
+
+    def __repr__(self):
+        return f"Phrase({self.terms!r}, {self.offsets!r})"
+
+class Near:
+    def __init__(self, left, right, distance):
+        self.left = left
+        self.right = right
+        self.distance = distance
+
+    def __repr__(self):
+        return f"Near({self.left!r}, {self.right!r}, {self.distance})"
+
+def tokenize_query(query):
+    if query.count('"') % 2:
+        raise QuerySyntaxError("не хватает закрывающей кавычки")
+    return re.findall(r'"[^"]*"|\w+/\d+|\(|\)|[\w*?]+', query)
+
+def default_phrase_terms(text):
+    return [(offset, word.lower()) for offset, word in enumerate(re.findall(r'\w+', text))]
+
+class QueryParser:
+    # Рекурсивный спуск:
+    #   or_expr  := and_expr (OR and_expr)*
+    #   and_expr := not_expr (AND not_expr)*
+    #   not_expr := NOT not_expr | '(' or_expr ')' | near_expr
+    #   near_expr := атом (NEAR/k атом)*
+    #   атом     := "фраза" | шаблон | термин
+    # normalize_phrase(текст) -> [(позиция, термин)] для слов фразы, которые
+    # есть в индексе; позиции — в той же нумерации, что в позиционном индексе
+
+    def __init__(self, normalize=None, normalize_phrase=None):
+        self.normalize = normalize or (lambda token: token.lower())
+        self.normalize_phrase = normalize_phrase or default_phrase_terms
+
+    def parse(self, query):
+        self.tokens = tokenize_query(query)
+        self.position = 0
+        if not self.tokens:
+            raise QuerySyntaxError("пустой запрос")
+        node = self.parse_or()
+        if self.position != len(self.tokens):
+            raise QuerySyntaxError(f"неожиданный токен '{self.tokens[self.position]}'")
+        return node
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def operator(self, token):
+        if token is None:
+            return None
+        return OPERATORS.get(token.upper())
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.operator(self.peek()) == 'OR':
+            self.position += 1
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.operator(self.peek()) == 'AND':
+            self.position += 1
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not(self):
+        token = self.peek()
+        if token is None:
+            raise QuerySyntaxError("запрос оборвался")
+        if self.operator(token) == 'NOT':
+            self.position += 1
+            return Not(self.parse_not())
+        if token == '(':
+            self.position += 1
+            node = self.parse_or()
+            if self.peek() != ')':
+                raise QuerySyntaxError("не хватает ')'")
+            self.position += 1
+            return node
+        return self.parse_near()
+
+    def near_distance(self, token):
+        match = re.fullmatch(r'(\w+)/(\d+)', token or '')
+        if match and match.group(1).upper() in NEAR_OPERATORS:
+            return int(match.group(2))
+        return None
+
+    def parse_near(self):
+        # a NEAR/2 b NEAR/3 c — каждая соседняя пара рядом: And(Near(a, b), Near(b, c))
+        left = self.parse_atom()
+        pairs = []
+        while self.near_distance(self.peek()) is not None:
+            distance = self.near_distance(self.peek())
+            self.position += 1
+            right = self.parse_atom()
+            if not isinstance(left, Term) or not isinstance(right, Term):
+                raise QuerySyntaxError("NEAR применяется только к отдельным словам")
+            pairs.append(Near(left.term, right.term, distance))
+            left = right
+        if not pairs:
+            return left
+        return pairs[0] if len(pairs) == 1 else And(pairs)
+
+    def parse_atom(self):
+        token = self.peek()
+        if token is None:
+            raise QuerySyntaxError("запрос оборвался")
+        self.position += 1
+        if token.startswith('"'):
+            words = self.normalize_phrase(token[1:-1])
+            if not words:
+                raise QuerySyntaxError(f"во фразе {token} нет слов из индекса")
+            if len(words) == 1:
+                return Term(words[0][1])
+            first = words[0][0]
+            return Phrase([term for _, term in words], [offset - first for offset, _ in words])
+        if token in ('(', ')') or self.operator(token) or '/' in token:
+            raise QuerySyntaxError(f"неожиданный токен '{token}'")
+        if is_pattern(token):
+            # Шаблон не лемматизируется: learn* должен найти и learning, и learned
+            if not token.strip('*?'):
+                raise QuerySyntaxError(f"в шаблоне '{token}' нет ни одной буквы")
+            return Wildcard(token.lower())
+        return Term(self.normalize(token))
+
+def parse_query(query, normalize=None, normalize_phrase=None):
+    return QueryParser(normalize, normalize_phrase).parse(query)
+
+# Дерево запроса в виде вложенных списков JSON и обратно — для передачи
+# уже разобранного запроса процессам-шардам (project/sharding.py)
+def node_to_json(node):
+    if isinstance(node, Term):
+        return ['term', node.term]
+    if isinstance(node, Wildcard):
+        return ['wildcard', node.pattern]
+    if isinstance(node, Not):
+        return ['not', node_to_json(node.child)]
+    if isinstance(node, Phrase):
+        return ['phrase', [node.terms, node.offsets]]
+    if isinstance(node, Near):
+        return ['near', [node.left, node.right, node.distance]]
+    kind = 'and' if isinstance(node, And) else 'or'
+    return [kind, [node_to_json(child) for child in node.children]]
+
+def node_from_json(data):
+    kind, value = data
+    if kind == 'term':
+        return Term(value)
+    if kind == 'wildcard':
+        return Wildcard(value)
+    if kind == 'not':
+        return Not(node_from_json(value))
+    if kind == 'phrase':
+        return Phrase(*value)
+    if kind == 'near':
+        return Near(*value)
+    children = [node_from_json(child) for child in value]
+    if kind == 'and':
+        return And(children)
+    if kind == 'or':
+        return Or(children)
+    raise QuerySyntaxError(f"неизвестный узел '{kind}'")
+
+class QueryPlanner:
+    # postings: термин -> отсортированный np.array doc id.
+    # AND пересекает списки от самого короткого к длинному и останавливается
+    # на пустом результате; NOT внутри AND вычитается из уже найденного,
+    # а полное дополнение строится только для NOT без положительной части.
+    # Фразы и NEAR требуют позиционного индекса (positions).
+    # Шаблоны раскрываются по словарю postings: у BinaryInvertedIndex он свой,
+    # обычный dict переводится в TermPostings (сжатый словарь, один массив doc id).
+
+    def __init__(self, postings, num_docs, all_docs=None, positions=None):
+        if isinstance(postings, dict):
+            postings = TermPostings.from_mapping(postings)
+        self.postings = postings
+        self.positions = positions
+        self.num_docs = num_docs
+        # Для индекса с пропусками в нумерации (удалённые документы)
+        # дополнение берётся относительно переданного списка живых doc id
+        self.all_docs = all_docs
+        self.empty = np.zeros(0, dtype=np.int64)
+
+    def lookup(self, term):
+        docs = self.postings.get(term)
+        return self.empty if docs is None else docs
+
+    def wildcard_terms(self, node):
+        if node.terms is None:
+            node.terms = expand_pattern(self.postings, node.pattern)
+        return node.terms
+
+    def estimate(self, node):
+        if isinstance(node, Term):
+            return len(self.lookup(node.term))
+        if isinstance(node, Wildcard):
+            return min(self.num_docs, sum(len(self.lookup(term)) for term in self.wildcard_terms(node)))
+        if isinstance(node, Phrase):
+            return min(len(self.lookup(term)) for term in node.terms)
+        if isinstance(node, Near):
+            return min(len(self.lookup(node.left)), len(self.lookup(node.right)))
+        if isinstance(node, Not):
+            return self.num_docs - self.estimate(node.child)
+        if isinstance(node, And):
+            return min(self.estimate(child) for child in node.children)
+        return min(self.num_docs, sum(self.estimate(child) for child in node.children))
+
+    def evaluate(self, node):
+        if isinstance(node, Term):
+            docs = self.lookup(node.term)
+            metrics.inc('search_postings_read_total', len(docs))
+            return docs
+        if isinstance(node, Wildcard):
+            parts = [self.lookup(term) for term in self.wildcard_terms(node)]
+            metrics.inc('search_postings_read_total', sum(len(docs) for docs in parts))
+            return np.unique(np.concatenate(parts)) if parts else self.empty
+        if isinstance(node, (Phrase, Near)):
+            if self.positions is None:
+                raise QuerySyntaxError("фразы и NEAR недоступны: нет позиционного индекса")
+            if isinstance(node, Phrase):
+                return self.positions.phrase(node.terms, node.offsets)
+            return self.positions.near(node.left, node.right, node.distance)
+        if isinstance(node, Not):
+            return self.complement(self.evaluate(node.child))
+        if isinstance(node, And):
+            return self.evaluate_and(node)
+        return self.evaluate_or(node)
+
+    def complement(self, docs):
+        all_docs = np.arange(self.num_docs, dtype=np.int64) if self.all_docs is None else self.all_docs
+        return np.setdiff1d(all_docs, docs, assume_unique=True)
+
+    def evaluate_and(self, node):
+        positive = [child for child in node.children if not isinstance(child, Not)]
+        negative = [child.child for child in node.children if isinstance(child, Not)]
+        if not positive:
+            return self.complement(self.evaluate_or(Or(negative)))
+
+        positive.sort(key=self.estimate)
+        result = self.evaluate(positive[0])
+        for child in positive[1:]:
+            if len(result) == 0:
+                return result
+            result = np.intersect1d(result, self.evaluate(child), assume_unique=True)
+        for child in negative:
+            if len(result) == 0:
+                return result
+            result = np.setdiff1d(result, self.evaluate(child), assume_unique=True)
+        return result
+
+    def evaluate_or(self, node):
+        positive = [child for child in node.children if not isinstance(child, Not)]
+        negative = [child.child for child in node.children if isinstance(child, Not)]
+        parts = [self.evaluate(child) for child in positive]
+        union = np.unique(np.concatenate(parts)) if parts else self.empty
+        if not negative:
+            return union
+        # NOT x OR NOT y OR p = NOT (x AND y AND NOT p): одно дополнение в конце
+        excluded = self.evaluate_and(And(negative))
+        return self.complement(np.setdiff1d(excluded, union, assume_unique=True))
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+from page_hashes import page_hashes
+
+# Хранилище документов, разобранных один раз: текст, заголовок, токены и
+# леммы каждой страницы, ключ обновления — хеш содержимого HTML.
+# Формат файла:
+#   заголовок   MAGIC, версия, число документов, смещение оглавления
+#   записи      JSON каждого документа, сжатый zlib
+#   оглавление  JSON {doc_id: [смещение, длина, хеш]}
+# Записи неизменившихся страниц при пересборке копируются как есть,
+# без распаковки.
+
+MAGIC = b'DSTR'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIIQ')
+
+DOCSTORE_PATH = 'information-search/task_2/docstore.bin'
+
+def content_hash(content):
+    return hashlib.sha1(content).hexdigest()
+
+class DocumentStore:
+
+    def __init__(self, path=DOCSTORE_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, index_offset = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path}: неподдерживаемый формат хранилища")
+        entries = json.loads(self._mmap[index_offset:].decode('utf-8'))
+        self.entries = {int(doc_id): tuple(entry) for doc_id, entry in entries.items()}
+
+    def close(self):
+        self._mmap.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.entries
+
+    def doc_ids(self):
+        return sorted(self.entries)
+
+    def hash(self, doc_id):
+        entry = self.entries.get(doc_id)
+        return entry[2] if entry else None
+
+    def raw_record(self, doc_id):
+        offset, length, _ = self.entries[doc_id]
+        return self._mmap[offset:offset + length]
+
+    def get(self, doc_id):
+        return json.loads(zlib.decompress(self.raw_record(doc_id)).decode('utf-8'))
+
+    def items(self):
+        for doc_id in self.doc_ids():
+            yield doc_id, self.get(doc_id)
+
+    def title(self, doc_id):
+        return self.get(doc_id).get('title')
+
+def open_docstore(path=DOCSTORE_PATH):
+    if os.path.exists(path):
+        return DocumentStore(path)
+    return None
+
+# Хранилище, собранное по текущему набору страниц: все страницы в нём есть
+# и хеш содержимого каждой совпадает с записанным. Иначе None — читайте HTML
+# напрямую. Хеши берутся из кэша project/page_hashes.py, поэтому время
+# изменения файлов (другое после git clone) на результат не влияет.
+def open_fresh_docstore(pages_folder, path=DOCSTORE_PATH):
+    store = open_docstore(path)
+    if store is None:
+        return None
+    stored = {doc_id: entry[2] for doc_id, entry in store.entries.items()}
+    if page_hashes(pages_folder) != stored:
+        store.close()
+        return None
+    return store
+
+class DocumentStoreWriter:
+    # Новые записи сжимаются, старые (страница не изменилась) копируются
+    # байт в байт. Файл подменяется атомарно в close().
+
+    def __init__(self, path=DOCSTORE_PATH):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, 0))
+        self.entries = {}
+
+    def _append(self, doc_id, compressed, page_hash):
+        offset = self.file.tell()
+        self.file.write(compressed)
+        self.entries[doc_id] = [offset, len(compressed), page_hash]
+
+    def add(self, doc_id, page_hash, record):
+        record = dict(record, doc_id=doc_id, hash=page_hash)
+        self._append(doc_id, zlib.compress(json.dumps(record, ensure_ascii=False).encode('utf-8'), 6), page_hash)
+
+    def copy(self, store, doc_id):
+        self._append(doc_id, store.raw_record(doc_id), store.hash(doc_id))
+
+    def close(self):
+        index_offset = self.file.tell()
+        self.file.write(json.dumps({str(k): v for k, v in sorted(self.entries.items())}).encode('utf-8'))
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(self.entries), index_offset))
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
@@ -0,0 +1,167 @@
+import os
+import time
+from collections import OrderedDict
+
+# Кэш лемматизации: токен -> лемма.
+# Новые слова размечаются одним пакетным вызовом pos_tag_sents (каждое слово
+# отдельным "предложением", поэтому теги те же, что при pos_tag([word]), но
+# модель теггера загружается один раз). Горячие слова лежат в LRU в памяти,
+# все известные — в файле на диске, который переживает перезапуски.
+# nltk импортируется только при первом промахе: процессу, которому хватает
+# кэша, он не нужен.
+
+LEMMA_CACHE_PATH = 'information-search/task_2/lemma_cache.tsv'
+
+lemmatizer = None
+
+def wordnet_pos(tag):
+    from nltk.corpus import wordnet
+    if tag.startswith('V'):
+        return wordnet.VERB
+    elif tag.startswith('N'):
+        return wordnet.NOUN
+    elif tag.startswith('R'):
+        return wordnet.ADV
+    else:
+        return wordnet.ADJ
+
+def tag_and_lemmatize(tokens):
+    global lemmatizer
+    import nltk
+    if lemmatizer is None:
+        from nltk.stem import WordNetLemmatizer
+        lemmatizer = WordNetLemmatizer()
+    tagged = nltk.pos_tag_sents([[token] for token in tokens])
+    return [lemmatizer.lemmatize(token, wordnet_pos(sentence[0][1])) for token, sentence in zip(tokens, tagged)]
+
+class LemmaCache:
+
+    def __init__(self, path=LEMMA_CACHE_PATH, maxsize=100000):
+        self.path = path
+        self.maxsize = maxsize
+        self.lru = OrderedDict()
+        # Средняя стоимость одного промаха; хранится в файле строкой "#\t<секунды>",
+        # чтобы оценивать экономию и в прогонах, где промахов не было
+        self.seconds_per_miss = 0.0
+        self.stored = self.load() if path else {}
+        self.new_entries = {}
+        self.unsent = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.tagging_seconds = 0.0
+
+    def load(self):
+        stored = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    token, _, lemma = line.rstrip('\n').partition('\t')
+                    if token == '#':
+                        self.seconds_per_miss = float(lemma)
+                    elif token:
+                        stored[token] = lemma
+        return stored
+
+    def save(self):
+        if not self.path or not self.new_entries:
+            return
+        # Дописываем к тому, что сейчас на диске: файл мог обновить другой процесс
+        merged = self.load()
+        merged.update(self.new_entries)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f"#\t{self.miss_cost()}\n")
+            for token in sorted(merged):
+                f.write(f"{token}\t{merged[token]}\n")
+        os.replace(tmp_path, self.path)
+        self.stored.update(self.new_entries)
+        self.new_entries = {}
+
+    def _remember(self, token, lemma):
+        self.lru[token] = lemma
+        self.lru.move_to_end(token)
+        if len(self.lru) > self.maxsize:
+            self.lru.popitem(last=False)
+
+    def lookup(self, token):
+        lemma = self.lru.get(token)
+        if lemma is not None:
+            self.lru.move_to_end(token)
+            self.memory_hits += 1
+            return lemma
+        lemma = self.stored.get(token)
+        if lemma is None:
+            lemma = self.new_entries.get(token)
+        if lemma is not None:
+            self.disk_hits += 1
+            self._remember(token, lemma)
+        return lemma
+
+    def lemmatize_batch(self, tokens):
+        result = {}
+        unknown = []
+        for token in dict.fromkeys(tokens):
+            lemma = self.lookup(token)
+            if lemma is None:
+                unknown.append(token)
+            else:
+                result[token] = lemma
+
+        if unknown:
+            start = time.perf_counter()
+            for token, lemma in zip(unknown, tag_and_lemmatize(unknown)):
+                result[token] = lemma
+                self.new_entries[token] = lemma
+                self.unsent[token] = lemma
+                self._remember(token, lemma)
+            self.tagging_seconds += time.perf_counter() - start
+            self.misses += len(unknown)
+        return result
+
+    def lemmatize(self, token):
+        return self.lemmatize_batch([token])[token]
+
+    def drain_new_entries(self):
+        # Для рабочих процессов: отдать выученное родителю, который сохранит кэш
+        entries = self.unsent
+        self.unsent = {}
+        return entries
+
+    def merge(self, entries):
+        for token, lemma in entries.items():
+            if token not in self.stored:
+                self.new_entries[token] = lemma
+
+    def miss_cost(self):
+        if self.misses:
+            return self.tagging_seconds / self.misses
+        return self.seconds_per_miss
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        per_miss = self.miss_cost()
+        return {
+            'lookups': lookups,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'tagging_seconds': self.tagging_seconds,
+            'saved_seconds': hits * per_miss,
+        }
+
+    def add_stats(self, stats):
+        self.memory_hits += stats['memory_hits']
+        self.disk_hits += stats['disk_hits']
+        self.misses += stats['misses']
+        self.tagging_seconds += stats['tagging_seconds']
+
+    def report(self):
+        stats = self.stats()
+        print(f"Кэш лемм: обращений {stats['lookups']}, попаданий {stats['hit_rate']:.1%} "
+              f"(память {stats['memory_hits']}, диск {stats['disk_hits']}), промахов {stats['misses']}")
+        print(f"  разметка и лемматизация: {stats['tagging_seconds']:.2f} с, "
+              f"сэкономлено примерно {stats['saved_seconds']:.2f} с")
@@ -0,0 +1,143 @@
+import bisect
+import threading
+import time
+
+# Счётчики и гистограммы времени стадий поиска для /metrics (формат
+# Prometheus) и для --profile в консольных программах.
+# Замер стадии — два вызова perf_counter и одно обновление под блокировкой,
+# поэтому инструментирование можно не выключать.
+# Значения свои в каждом процессе: при запуске в несколько рабочих процессов
+# /metrics показывает счётчики того процесса, который ответил на запрос.
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_local = threading.local()
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        profile = getattr(_local, 'profile', None)
+        if profile is not None:
+            profile.counts[name] = profile.counts.get(name, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def stage(self, name):
+        return StageTimer(self, name)
+
+    def render(self, gauges=None):
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+            histograms = [(key, list(h.counts), h.sum, h.count) for key, h in histograms]
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), counts, total, count in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        # Значения, которые считает кто-то другой (размер кэша, версия индекса)
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+class StageTimer:
+    # Время стадии уходит в гистограмму search_stage_seconds{stage=...}
+    # и, если в этом потоке идёт profile(), в его разбивку по стадиям
+
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe('search_stage_seconds', elapsed, stage=self.name)
+        profile = getattr(_local, 'profile', None)
+        if profile is not None:
+            profile.stages[self.name] = profile.stages.get(self.name, 0.0) + elapsed
+        return False
+
+class Profile:
+    # Разбивка одного запроса: время по стадиям и счётчики
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.total = 0.0
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'profile', None)
+        _local.profile = self
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.total = time.perf_counter() - self.start
+        _local.profile = self.previous
+        return False
+
+    def report(self):
+        parts = [f"{name} {seconds * 1000:.3f} мс" for name, seconds in self.stages.items()]
+        other = self.total - sum(self.stages.values())
+        lines = [f"Профиль: всего {self.total * 1000:.3f} мс — " + ', '.join(parts + [f"прочее {other * 1000:.3f} мс"])]
+        if self.counts:
+            lines.append("  " + ', '.join(f"{name}={value}" for name, value in self.counts.items()))
+        return '\n'.join(lines)
+
+metrics = Metrics()
+
+def profile():
+    return Profile()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import re
+
+# Хеши содержимого страниц task_1 с кэшем по (размер, mtime_ns).
+# Страница, у которой размер и время изменения те же, что в кэше, не
+# читается: берётся сохранённый хеш. После git clone или копирования время
+# изменения другое, поэтому страницы один раз хешируются заново, а сравнение
+# по содержимому остаётся верным. Кэш лежит рядом с папкой страниц:
+# task_1/pages -> task_1/page_hashes.json. Им пользуются update_index.py и
+# проверка образа индекса task_3 при запуске.
+
+CACHE_NAME = 'page_hashes.json'
+
+# Номер страницы по имени файла (page_12.html -> 12) или None
+def page_id(filename):
+    match = re.search(r'\d+', filename)
+    if filename.endswith('.html') and match:
+        return int(match.group())
+    return None
+
+# Номер страницы -> путь к файлу
+def page_files(folder_path):
+    pages = {}
+    for filename in os.listdir(folder_path):
+        doc_id = page_id(filename)
+        if doc_id is not None:
+            pages[doc_id] = os.path.join(folder_path, filename)
+    return pages
+
+# SHA-1 содержимого файла (читается блоками по 1 МБ)
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_path_for(folder_path):
+    folder_path = os.path.normpath(folder_path)
+    return os.path.join(os.path.dirname(folder_path), CACHE_NAME)
+
+def read_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_cache(path, cache):
+    # Имя временного файла своё у каждого процесса: кэш могут обновлять
+    # одновременно поиск и индексация
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # Кэш только ускоряет проверку; без прав на запись хешируем каждый раз
+        pass
+
+def page_hashes(folder_path, paths=None, cache_path=None):
+    # Номер страницы -> SHA-1 содержимого. paths — только эти страницы
+    # (номер -> путь), иначе все страницы папки. Хешируются только файлы,
+    # чей (размер, mtime_ns) отличается от кэша
+    cache_path = cache_path or cache_path_for(folder_path)
+    cache = read_cache(cache_path)
+    pages = page_files(folder_path) if paths is None else paths
+    hashes = {}
+    changed = False
+    for doc_id, path in pages.items():
+        name = os.path.basename(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        cached = cache.get(name)
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            hashes[doc_id] = cached[2]
+            continue
+        hashes[doc_id] = file_digest(path)
+        cache[name] = [stat.st_size, stat.st_mtime_ns, hashes[doc_id]]
+        changed = True
+    if paths is None:
+        # Удалённые страницы из кэша убираются
+        names = {os.path.basename(path) for path in pages.values()}
+        stale = [name for name in cache if name not in names]
+        for name in stale:
+            del cache[name]
+        changed = changed or bool(stale)
+    if changed:
+        write_cache(cache_path, cache)
+    return hashes
+
+# Отпечаток набора страниц: номера и хеши содержимого
+def hashes_signature(hashes):
+    digest = hashlib.sha1()
+    for doc_id, page_hash in sorted(hashes.items()):
+        digest.update(f"{doc_id}:{page_hash}\n".encode('utf-8'))
+    return digest.hexdigest()
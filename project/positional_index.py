@@ -0,0 +1,188 @@
+import mmap
+import os
+import struct
+import numpy as np
+from binary_index import decode_varints, encode_varints
+from metrics import metrics
+
+# Позиционный индекс для фраз ("machine learning") и близости (a NEAR/3 b).
+# Позиция — номер слова в тексте документа (по nltk.word_tokenize, включая
+# стоп-слова и знаки препинания), поэтому расстояния те же, что в исходном тексте.
+# Формат (как у binary_index):
+#   заголовок  MAGIC, версия, число терминов, число документов,
+#              смещения таблицы терминов, строк и данных
+#   таблица    на каждый термин смещение строки и смещение данных
+#   строки     термины в UTF-8, отсортированы по байтам
+#   данные     на термин одна последовательность varint: df, doc id
+#              разностями, число позиций в каждом документе, позиции
+#              разностями (в каждом документе счёт заново)
+# Запрос декодирует только списки своих терминов, так что его стоимость
+# зависит от их длины, а не от длины документов.
+
+MAGIC = b'PIDX'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIIIQQQ')
+TERM_ENTRY = struct.Struct('<QQ')
+
+POSITIONAL_INDEX_PATH = 'information-search/task_3/positional_index.bin'
+
+# Ключ doc_id * POSITION_STRIDE + позиция: позиции разных документов не пересекаются
+POSITION_STRIDE = 1 << 32
+
+def encode_term(doc_ids, counts, positions):
+    counts = np.asarray(counts, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    deltas = np.diff(positions, prepend=0)
+    starts = np.cumsum(counts) - counts
+    deltas[starts] = positions[starts]
+    doc_deltas = np.diff(np.asarray(doc_ids, dtype=np.int64), prepend=0)
+    return encode_varints(np.concatenate(([len(counts)], doc_deltas, counts, deltas)))
+
+def decode_term(buffer):
+    values = decode_varints(buffer)
+    df = int(values[0])
+    doc_ids = np.cumsum(values[1:1 + df])
+    counts = values[1 + df:1 + 2 * df]
+    deltas = values[1 + 2 * df:]
+    running = np.cumsum(deltas)
+    starts = np.cumsum(counts) - counts
+    # Вычитаем сумму, накопленную до начала документа
+    positions = running - np.repeat(running[starts] - deltas[starts], counts)
+    return doc_ids, counts, positions
+
+def encode_positional_index(positions, num_docs):
+    # positions: термин -> (doc id по возрастанию, число позиций в каждом, позиции подряд)
+    items = sorted(((term.encode('utf-8'), entry) for term, entry in positions.items()), key=lambda item: item[0])
+    term_blob = bytearray()
+    data_blob = bytearray()
+    table = bytearray()
+    for term, (doc_ids, counts, term_positions) in items:
+        table += TERM_ENTRY.pack(len(term_blob), len(data_blob))
+        term_blob += term
+        data_blob += encode_term(doc_ids, counts, term_positions)
+    table += TERM_ENTRY.pack(len(term_blob), len(data_blob))
+    table_offset = HEADER.size
+    terms_offset = table_offset + len(table)
+    data_offset = terms_offset + len(term_blob)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(items), num_docs, table_offset, terms_offset, data_offset)
+    return b''.join((header, table, term_blob, data_blob))
+
+def write_positional_index(data, path=POSITIONAL_INDEX_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class PositionalIndex:
+    # Поверх bytes (индекс, только что построенный в памяти) или mmap файла
+
+    def __init__(self, data):
+        self.data = data
+        magic, version, self.num_terms, self.num_docs, self._table_offset, self._terms_offset, self._data_offset = \
+            HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("неподдерживаемый формат позиционного индекса")
+
+    def _entry(self, position):
+        return TERM_ENTRY.unpack_from(self.data, self._table_offset + position * TERM_ENTRY.size)
+
+    def _term_at(self, position):
+        start, _ = self._entry(position)
+        end, _ = self._entry(position + 1)
+        return self.data[self._terms_offset + start:self._terms_offset + end]
+
+    def _find(self, term):
+        key = term.encode('utf-8')
+        low, high = 0, self.num_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.num_terms and self._term_at(low) == key:
+            return low
+        return None
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def __len__(self):
+        return self.num_terms
+
+    def _decode_at(self, position):
+        _, start = self._entry(position)
+        _, end = self._entry(position + 1)
+        return decode_term(self.data[self._data_offset + start:self._data_offset + end])
+
+    def items(self):
+        for position in range(self.num_terms):
+            yield self._term_at(position).decode('utf-8'), self._decode_at(position)
+
+    def postings(self, term):
+        # (doc id, число позиций в каждом документе, позиции подряд) или None
+        position = self._find(term)
+        if position is None:
+            return None
+        doc_ids, counts, positions = self._decode_at(position)
+        metrics.inc('search_positions_read_total', len(positions))
+        return doc_ids, counts, positions
+
+    def _keys(self, entry, docs, offset=0):
+        doc_ids, counts, positions = entry
+        owners = np.repeat(doc_ids, counts)
+        keep = np.isin(owners, docs) & (positions >= offset)
+        return owners[keep] * POSITION_STRIDE + (positions[keep] - offset)
+
+    def _common_docs(self, entries):
+        docs = None
+        for doc_ids, _, _ in sorted(entries, key=lambda entry: len(entry[0])):
+            docs = doc_ids if docs is None else np.intersect1d(docs, doc_ids, assume_unique=True)
+            if len(docs) == 0:
+                break
+        return docs
+
+    def phrase(self, terms, offsets):
+        # Документы, где terms[i] стоит на позиции start + offsets[i]
+        empty = np.zeros(0, dtype=np.int64)
+        entries = [self.postings(term) for term in terms]
+        if any(entry is None for entry in entries):
+            return empty
+        docs = self._common_docs(entries)
+        starts = None
+        for entry, offset in zip(entries, offsets):
+            if len(docs) == 0:
+                return empty
+            keys = self._keys(entry, docs, offset)
+            starts = keys if starts is None else np.intersect1d(starts, keys, assume_unique=True)
+            docs = np.unique(starts // POSITION_STRIDE)
+        return docs
+
+    def near(self, left, right, distance):
+        # Документы, где left и right стоят не дальше distance слов друг от друга
+        empty = np.zeros(0, dtype=np.int64)
+        entries = [self.postings(left), self.postings(right)]
+        if any(entry is None for entry in entries):
+            return empty
+        docs = self._common_docs(entries)
+        if len(docs) == 0:
+            return empty
+        left_keys = self._keys(entries[0], docs)
+        right_keys = self._keys(entries[1], docs)
+        low = np.searchsorted(right_keys, left_keys - distance, side='left')
+        high = np.searchsorted(right_keys, left_keys + distance, side='right')
+        found = high - low
+        if left == right:
+            # Слово не считается соседом самого себя
+            found -= 1
+        return np.unique(left_keys[found > 0] // POSITION_STRIDE)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+def open_positional_index(path=POSITIONAL_INDEX_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return PositionalIndex(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
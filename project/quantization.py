@@ -0,0 +1,167 @@
+import argparse
+import random
+import time
+import tracemalloc
+import numpy as np
+from scipy import sparse
+
+# Компактное хранение весов TF-IDF для поиска. Хранится только нормированная
+# матрица по терминам (CSC: doc id термина по возрастанию, вес документа,
+# делённый на норму документа): по ней считаются и косинус, и верхние границы
+# MaxScore. Doc id — int32, веса — в одной из точностей:
+#   float64  без потерь, ответы совпадают с прежними до бита
+#   float32  4 байта на вес
+#   float16  2 байта на вес, ~3 значащие цифры
+#   int8     1 байт на вес и масштаб на термин: вес = q * scale[термин],
+#            scale = максимальный вес термина / 127
+# Согласие выдачи с float64 и расход памяти печатает
+#   python information-search/project/quantization.py
+
+PRECISIONS = ('float64', 'float32', 'float16', 'int8')
+INT8_MAX = 127
+
+class TermWeights:
+
+    def __init__(self, indptr, indices, data, scale, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.scale = scale
+        self.shape = shape
+
+    @classmethod
+    def from_columns(cls, columns, precision='float64'):
+        # columns — scipy CSC с отсортированными индексами
+        if precision not in PRECISIONS:
+            raise ValueError(f"неизвестная точность '{precision}', допустимы: {', '.join(PRECISIONS)}")
+        indices = columns.indices.astype(np.int32, copy=False)
+        data = columns.data
+        scale = None
+        if precision == 'int8':
+            lengths = np.diff(columns.indptr)
+            scale = (column_max(data, columns.indptr) / INT8_MAX).astype(np.float32)
+            steps = np.repeat(scale.astype(np.float64), lengths)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                levels = np.where(steps > 0, np.rint(data / steps), 0.0)
+            data = np.clip(levels, -INT8_MAX, INT8_MAX).astype(np.int8)
+        elif precision != 'float64':
+            data = data.astype(precision)
+        return cls(columns.indptr, indices, data, scale, columns.shape)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes + (
+            self.scale.nbytes if self.scale is not None else 0)
+
+    def values(self, term_id, start=None, end=None):
+        # Веса столбца термина в float64
+        if start is None:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        values = self.data[start:end]
+        if self.scale is not None:
+            return values * np.float64(self.scale[term_id])
+        return values if values.dtype == np.float64 else values.astype(np.float64)
+
+    def dequantized(self):
+        if self.scale is not None:
+            return self.data * np.repeat(self.scale.astype(np.float64), np.diff(self.indptr))
+        return self.data.astype(np.float64, copy=False)
+
+    def upper_bounds(self):
+        # Наибольший вес каждого термина — по тем значениям, что видит поиск
+        return column_max(self.dequantized(), self.indptr)
+
+    def term_matrix(self, term_ids):
+        # Строки выбранных терминов (термины x документы, float64) для
+        # пакетного поиска: разворачиваются только столбцы терминов пакета
+        starts = self.indptr[term_ids]
+        lengths = self.indptr[np.asarray(term_ids) + 1] - starts
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        positions = np.arange(indptr[-1]) + np.repeat(starts - indptr[:-1], lengths)
+        data = self.data[positions].astype(np.float64)
+        if self.scale is not None:
+            data *= np.repeat(self.scale[term_ids].astype(np.float64), lengths)
+        return sparse.csr_matrix((data, self.indices[positions], indptr), shape=(len(term_ids), self.shape[0]))
+
+def column_max(data, indptr):
+    bounds = np.zeros(len(indptr) - 1)
+    non_empty = np.diff(indptr) > 0
+    if len(data):
+        bounds[non_empty] = np.maximum.reduceat(data, indptr[:-1][non_empty])
+    return bounds
+
+def agreement(reference, results, top_n):
+    # Средняя доля общих документов в top-n и доля запросов с той же выдачей
+    overlaps = []
+    identical = 0
+    for expected, got in zip(reference, results):
+        expected_docs = [doc_id for doc_id, _ in expected]
+        got_docs = [doc_id for doc_id, _ in got]
+        identical += expected_docs == got_docs
+        if expected_docs:
+            overlaps.append(len(set(expected_docs) & set(got_docs)) / min(top_n, len(expected_docs)))
+    return (sum(overlaps) / len(overlaps) if overlaps else 1.0), identical / max(1, len(reference))
+
+def report(make_index, queries, top_n=10):
+    # make_index(precision) -> SearchIndex; сравнение с float64 на одних запросах
+    reference = None
+    print(f"{'точность':>9} {'память, КБ':>11} {'байт/вес':>9} {'пик загрузки, КБ':>17} "
+          f"{'p50, мс':>8} {'пересечение@' + str(top_n):>15} {'та же выдача':>13}")
+    for precision in PRECISIONS:
+        tracemalloc.start()
+        index = make_index(precision)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        data = index._data
+        results = []
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(index.search(query, top_n))
+            timings.append((time.perf_counter() - start) * 1000)
+        if reference is None:
+            reference = results
+        overlap, identical = agreement(reference, results, top_n)
+        print(f"{precision:>9} {data.nbytes / 1024:>11.1f} {data.nbytes / max(1, data.nnz):>9.1f} "
+              f"{peak / 1024:>17.1f} {np.percentile(timings, 50):>8.3f} {overlap:>15.4f} {identical:>13.1%}")
+
+def text_loading_report(tfidf_path, kind='tokens'):
+    # Разбор текстовых файлов tfidf_doc_N_*.txt: список словарей на документ
+    # (load_tfidf_vectors) против массивов (load_tfidf_matrix)
+    from search_index import load_tfidf_matrix, load_tfidf_vectors
+
+    for title, load in (('словари', load_tfidf_vectors), ('массивы', load_tfidf_matrix)):
+        tracemalloc.start()
+        result = load(tfidf_path, kind=kind)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        print(f"Текстовые файлы, {title}: в памяти {current / 1024:.1f} КБ, пик {peak / 1024:.1f} КБ")
+
+def main():
+    # Импорт здесь, чтобы модуль не зависел от search_index
+    from search_index import TFIDF_PATH, SearchIndex, count_tfidf_docs
+
+    parser = argparse.ArgumentParser(description="Память и согласие выдачи при сжатых весах TF-IDF")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--terms', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--space', choices=('tokens', 'lemmas'), default='tokens')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    index = SearchIndex(space=args.space)
+    rng = random.Random(args.seed)
+    words = [term for term in index._data.vocab if term.isalpha()]
+    queries = [rng.sample(words, rng.randint(1, args.terms)) for _ in range(args.queries)]
+    print(f"Документов: {index.num_docs}, ненулевых весов: {index._data.nnz}, запросов: {len(queries)}")
+    report(lambda precision: SearchIndex(space=args.space, precision=precision), queries, args.top)
+    if count_tfidf_docs(TFIDF_PATH, args.space):
+        text_loading_report(TFIDF_PATH, args.space)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Кэш результатов поиска. Ключ — нормализованные токены запроса (порядок слов
+# на оценку не влияет, поэтому они сортируются), top_n и версия индекса.
+# Записи вытесняются по LRU при превышении maxsize и устаревают через ttl
+# секунд. При смене версии индекса (перезагрузка, пересборка) кэш очищается
+# целиком: старые ключи всё равно больше не совпадут.
+
+class QueryCache:
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(query_tokens, top_n, version):
+        return tuple(sorted(token.lower() for token in query_tokens)), top_n, version
+
+    def get(self, query_tokens, top_n, version):
+        key = self.make_key(query_tokens, top_n, version)
+        with self._lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.monotonic() - stored_at <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, query_tokens, top_n, version, value):
+        if self.maxsize <= 0:
+            return
+        key = self.make_key(query_tokens, top_n, version)
+        with self._lock:
+            self._check_version(version)
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.version = version
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
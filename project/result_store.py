@@ -0,0 +1,182 @@
+import html
+import mmap
+import os
+import re
+import struct
+import sys
+
+# Хранилище для отрисовки выдачи: заголовок, URL и весь текст страницы
+# (пробелы схлопнуты), а также смещение первого вхождения каждого слова.
+# Формат файла:
+#   заголовок   MAGIC, версия, число слотов (max doc id + 1)
+#   таблица     на каждый doc id смещение записи, длина текстовой части и
+#               длина словаря смещений (0, 0, 0 — документа нет)
+#   записи      UTF-8 "заголовок\0url\0текст", за ним словарь
+#               "\nслово смещение" по словам текста в нижнем регистре
+# Запись документа находится по фиксированному смещению в таблице, поэтому
+# на один результат приходится одно чтение из mmap без разбора HTML. Слово
+# запроса ищется в словаре (mmap.find), а не регулярным выражением по всему
+# тексту: фрагмент строится вокруг первого вхождения, даже если оно далеко
+# от начала страницы.
+
+MAGIC = b'RSTR'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4sII')
+SLOT = struct.Struct('<QII')
+WORD = re.compile(r'\w+')
+
+RESULT_STORE_PATH = 'information-search/project/results.bin'
+URLS_PATH = 'information-search/task_1/index.txt'
+
+def load_urls(path=URLS_PATH):
+    urls = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2:
+                urls[int(parts[0])] = parts[1]
+    return urls
+
+# Слово в нижнем регистре -> смещение (в символах) первого вхождения
+def first_offsets(text):
+    offsets = {}
+    for match in WORD.finditer(text):
+        offsets.setdefault(match.group().lower(), match.start())
+    return offsets
+
+def write_result_store(documents, path=RESULT_STORE_PATH):
+    # documents: {doc_id: (title, url, text)}
+    slots = max(documents, default=-1) + 1
+    table = bytearray(SLOT.size * slots)
+    blob = bytearray()
+    data_offset = HEADER.size + len(table)
+    for doc_id in sorted(documents):
+        title, url, text = documents[doc_id]
+        text = ' '.join(text.replace('\0', ' ').split())
+        record = '\0'.join((title or '', url or '', text)).encode('utf-8')
+        offsets = ''.join(f"\n{word} {offset}" for word, offset in first_offsets(text).items())
+        offsets = (offsets + '\n').encode('utf-8')
+        SLOT.pack_into(table, doc_id * SLOT.size, data_offset + len(blob), len(record), len(offsets))
+        blob += record
+        blob += offsets
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, slots))
+        f.write(table)
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+class ResultStore:
+
+    def __init__(self, path=RESULT_STORE_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slots = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path}: неподдерживаемый формат хранилища выдачи")
+
+    def close(self):
+        self._mmap.close()
+
+    def __contains__(self, doc_id):
+        return 0 <= doc_id < self.slots and self._slot(doc_id)[1] > 0
+
+    def _slot(self, doc_id):
+        return SLOT.unpack_from(self._mmap, HEADER.size + doc_id * SLOT.size)
+
+    def get(self, doc_id):
+        if doc_id not in self:
+            return None
+        offset, length, _ = self._slot(doc_id)
+        title, url, text = self._mmap[offset:offset + length].decode('utf-8').split('\0', 2)
+        return title, url, text
+
+    def first_match(self, doc_id, query_tokens):
+        # Смещение первого вхождения любого из слов запроса в тексте, -1 —
+        # ни одного нет. None — среди токенов есть не слово (шаблон learn*),
+        # такой запрос ищется по тексту в make_snippet
+        offset, length, offsets_length = self._slot(doc_id)
+        start = offset + length
+        end = start + offsets_length
+        first = -1
+        for token in {token.lower() for token in query_tokens if token}:
+            if not WORD.fullmatch(token):
+                return None
+            found = self._mmap.find(f"\n{token} ".encode('utf-8'), start, end)
+            if found < 0:
+                continue
+            value_end = self._mmap.find(b'\n', found + 1, end)
+            position = int(self._mmap[found + len(token.encode('utf-8')) + 2:value_end])
+            first = position if first < 0 else min(first, position)
+        return first
+
+    def title(self, doc_id):
+        record = self.get(doc_id)
+        return record[0] if record else None
+
+    def snippet(self, doc_id, query_tokens, width=200):
+        record = self.get(doc_id)
+        if record is None:
+            return ''
+        return make_snippet(record[2], query_tokens, width, self.first_match(doc_id, query_tokens))
+
+# Фрагмент вокруг первого вхождения слова запроса; слова запроса
+# выделяются <mark>, остальной текст экранируется для HTML. match_start —
+# уже известное смещение первого вхождения (-1 — вхождений нет), иначе оно
+# ищется по всему тексту
+def make_snippet(text, query_tokens, width=200, match_start=None):
+    terms = {token.lower() for token in query_tokens if token}
+    pattern = re.compile(r'\b(' + '|'.join(sorted(map(re.escape, terms), key=len, reverse=True)) + r')\b',
+                         re.IGNORECASE) if terms else None
+    if match_start is None:
+        match = pattern.search(text) if pattern else None
+        match_start = -1 if match is None else match.start()
+    start = 0 if match_start < 0 else max(0, match_start - width // 3)
+    if start > 0:
+        space = text.find(' ', start)
+        start = space + 1 if 0 <= space < match_start else start
+    end = min(len(text), start + width)
+    if end < len(text):
+        space = text.rfind(' ', start, end)
+        end = space if space > start else end
+    fragment = text[start:end]
+
+    parts = []
+    position = 0
+    for found in (pattern.finditer(fragment) if pattern else ()):
+        parts.append(html.escape(fragment[position:found.start()]))
+        parts.append(f"<mark>{html.escape(found.group())}</mark>")
+        position = found.end()
+    parts.append(html.escape(fragment[position:]))
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+    return prefix + ''.join(parts) + suffix
+
+def build(path=RESULT_STORE_PATH, urls_path=URLS_PATH):
+    from docstore import open_docstore
+    from search_index import DOCS_PATH
+
+    urls = load_urls(urls_path)
+    store = open_docstore()
+    documents = {}
+    if store is not None:
+        for doc_id, record in store.items():
+            documents[doc_id] = (record.get('title'), urls.get(doc_id), record['spaced_text'])
+        store.close()
+    else:
+        # Хранилища task_2 нет: разбираем HTML один раз при сборке
+        from bs4 import BeautifulSoup
+        for filename in os.listdir(DOCS_PATH):
+            match = re.search(r'\d+', filename)
+            if filename.endswith('.html') and match:
+                doc_id = int(match.group())
+                with open(os.path.join(DOCS_PATH, filename), 'r', encoding='utf-8') as file:
+                    soup = BeautifulSoup(file, 'html.parser')
+                title = soup.title.string.strip() if soup.title and soup.title.string else None
+                documents[doc_id] = (title, urls.get(doc_id), soup.get_text(separator=' ', strip=True))
+    write_result_store(documents, path)
+    print(f"Хранилище выдачи: {len(documents)} документов, {os.path.getsize(path) / 1024:.1f} КБ")
+
+if __name__ == '__main__':
+    build(*sys.argv[1:3])
@@ -0,0 +1,920 @@
+import os
+import re
+import sys
+import time
+import heapq
+import random
+import threading
+import tracemalloc
+from array import array
+import numpy as np
+from scipy import sparse
+from collections import defaultdict
+from binary_index import BinaryInvertedIndex, LEMMA_INDEX_PATH, resolve_index_path
+from docstore import DOCSTORE_PATH, open_docstore
+from lemma_cache import LEMMA_CACHE_PATH, LemmaCache
+from tfidf_matrix import TFIDF_MATRIX_PATH, TfidfMatrix
+from term_dictionary import TermDictionary, TermPostings, expand_tokens
+from quantization import TermWeights
+from metrics import metrics
+from segments import MANIFEST_NAME, SegmentedIndex, SegmentSnapshot
+
+# Пути к данным
+DOCS_PATH = 'information-search/task_1/pages'
+TFIDF_PATH = 'information-search/task_4/tfidf_output'
+INDEX_PATH = 'information-search/task_3/inverted_index.txt'
+
+# Пространства поиска: слова (tfidf_doc_N_tokens, индекс task_3) и леммы
+# (tfidf_doc_N_lemmas, индекс лемм task_4). В пространстве лемм "running"
+# и "ran" дают один термин "run", словарь и матрица меньше, списки плотнее.
+SPACE_INDEX_PATHS = {'tokens': INDEX_PATH, 'lemmas': LEMMA_INDEX_PATH}
+
+def load_inverted_index(index_path=INDEX_PATH):
+    index = defaultdict(list)
+    with open(index_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            term, docs_str = line.strip().split(': ')
+            docs = list(map(int, re.findall(r'\d+', docs_str)))
+            index[term] = docs
+    return index
+
+def open_inverted_index(index_path=INDEX_PATH):
+    if index_path.endswith('.bin'):
+        return BinaryInvertedIndex(index_path)
+    return load_inverted_index(index_path)
+
+# Число документов определяется по файлам tfidf_doc_N_<kind>.txt (наибольший N + 1)
+def count_tfidf_docs(tfidf_path=TFIDF_PATH, kind='tokens'):
+    pattern = re.compile(rf'tfidf_doc_(\d+)_{kind}\.txt$')
+    doc_ids = [int(m.group(1)) for m in map(pattern.match, os.listdir(tfidf_path)) if m]
+    return max(doc_ids, default=-1) + 1
+
+def tfidf_file_paths(tfidf_path=TFIDF_PATH, num_docs=None, kind='tokens'):
+    if num_docs is None:
+        num_docs = count_tfidf_docs(tfidf_path, kind)
+    return [os.path.join(tfidf_path, f'tfidf_doc_{i}_{kind}.txt') for i in range(num_docs)]
+
+# Словарь, векторы документов и IDF читаются за один проход по файлам;
+# строка i — документ i, у пропущенных номеров вектор пустой
+def load_tfidf_vectors(tfidf_path=TFIDF_PATH, num_docs=None, kind='tokens'):
+    vocab = {}
+    doc_vectors = []
+    idf_values = {}
+    for file_path in tfidf_file_paths(tfidf_path, num_docs, kind):
+        vector = {}
+        if not os.path.exists(file_path):
+            doc_vectors.append(vector)
+            continue
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                token, idf, tfidf = line.strip().split()
+                vector[token] = float(tfidf)
+                idf_values[token] = float(idf)
+                if token not in vocab:
+                    vocab[token] = len(vocab)
+        doc_vectors.append(vector)
+    return vocab, doc_vectors, idf_values
+
+# То же, сразу в разреженную матрицу: строки файлов разбираются в массивы
+# (id термина int32, вес float64) без словаря на каждый документ
+def load_tfidf_matrix(tfidf_path=TFIDF_PATH, num_docs=None, kind='tokens'):
+    vocab = {}
+    idf_values = array('d')
+    indptr = array('q', [0])
+    indices = array('i')
+    data = array('d')
+    for file_path in tfidf_file_paths(tfidf_path, num_docs, kind):
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    token, idf, tfidf = line.strip().split()
+                    term_id = vocab.setdefault(token, len(vocab))
+                    if term_id == len(idf_values):
+                        idf_values.append(0.0)
+                    idf_values[term_id] = float(idf)
+                    indices.append(term_id)
+                    data.append(float(tfidf))
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.frombuffer(data, dtype=np.float64), np.frombuffer(indices, dtype=np.int32),
+         np.frombuffer(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, len(vocab)),
+    )
+    matrix.sort_indices()
+    return vocab, matrix, np.frombuffer(idf_values, dtype=np.float64).copy()
+
+def vectorize(tokens, vocab, idf_values):
+    tf = defaultdict(int)
+    for token in tokens:
+        tf[token] += 1
+    total = len(tokens)
+    vec = np.zeros(len(vocab))
+    for token, count in tf.items():
+        if token in vocab and token in idf_values:
+            tfidf = (count / total) * idf_values[token]
+            vec[vocab[token]] = tfidf
+    return vec
+
+def get_document_vector(doc_vec, vocab):
+    vec = np.zeros(len(vocab))
+    for token, tfidf in doc_vec.items():
+        if token in vocab:
+            vec[vocab[token]] = tfidf
+    return vec
+
+def cosine_similarity(vec1, vec2):
+    if np.linalg.norm(vec1) == 0 or np.linalg.norm(vec2) == 0:
+        return 0.0
+    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+
+_docstore = None
+
+def get_docstore(path=DOCSTORE_PATH):
+    # Хранилище открывается один раз; False — хранилища нет
+    global _docstore
+    if _docstore is None:
+        _docstore = open_docstore(path) or False
+    return _docstore or None
+
+def extract_title_from_html(doc_id, docs_path=DOCS_PATH):
+    # Заголовок уже извлечён при сборке хранилища документов task_2
+    store = get_docstore()
+    if store is not None and doc_id in store:
+        return store.title(doc_id) or f"Документ {doc_id}"
+    path = os.path.join(docs_path, f'page_{doc_id}.html')
+    # bs4 нужен только без хранилища: импорт не замедляет запуск сервера
+    from bs4 import BeautifulSoup
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            soup = BeautifulSoup(file, 'html.parser')
+            title = soup.title.string if soup.title else f"Документ {doc_id}"
+            return title.strip()
+    except Exception as e:
+        print(f"Ошибка при чтении {doc_id}: {e}")
+        return f"Документ {doc_id}"
+
+# Разреженная матрица документ-термин (CSR)
+def build_doc_term_matrix(doc_vectors, vocab):
+    indptr = [0]
+    indices = []
+    data = []
+    for vector in doc_vectors:
+        for token, tfidf in vector.items():
+            indices.append(vocab[token])
+            data.append(tfidf)
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(len(doc_vectors), len(vocab)),
+    )
+    matrix.sort_indices()
+    return matrix
+
+def idf_array(vocab, idf_values):
+    idf = np.zeros(len(vocab))
+    for token, term_id in vocab.items():
+        idf[term_id] = idf_values[token]
+    return idf
+
+def query_weights(tokens, vocab, idf):
+    tf = defaultdict(int)
+    for token in tokens:
+        tf[token] += 1
+    total = len(tokens)
+    term_ids = []
+    weights = []
+    for token, count in tf.items():
+        term_id = vocab.get(token)
+        if term_id is not None:
+            term_ids.append(term_id)
+            weights.append((count / total) * idf[term_id])
+    return np.array(term_ids, dtype=np.int64), np.array(weights, dtype=np.float64)
+
+def build_query_vector(tokens, vocab, idf):
+    term_ids, weights = query_weights(tokens, vocab, idf)
+    vec = np.zeros(len(vocab))
+    vec[term_ids] = weights
+    return vec
+
+# Используем индекс для сужения списка документов
+def find_candidates(index, query_tokens):
+    relevant_docs = set()
+    for token in query_tokens:
+        relevant_docs.update(index.get(token, []))
+    return relevant_docs
+
+def candidate_array(postings, query_tokens):
+    arrays = [postings[token] for token in set(query_tokens) if token in postings]
+    metrics.inc('search_postings_read_total', sum(len(docs) for docs in arrays))
+    if not arrays:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(arrays))
+
+# Списки по ненулевым весам столбцов — когда файла инвертированного индекса нет
+def matrix_postings(vocab, columns):
+    return TermPostings.from_mapping({term: columns.indices[columns.indptr[i]:columns.indptr[i + 1]]
+                                      for term, i in vocab.items()})
+
+_lemma_cache = None
+_lemma_lock = threading.Lock()
+
+def lemmatize_query(tokens):
+    # Слова запроса приводятся к леммам тем же кэшем, что в task_2/task_4
+    # (lemma_cache.tsv), и в нижний регистр, как в analyze.lemmatize_tokens.
+    # Шаблоны learn* и не-слова остаются как есть. Новые слова запоминаются
+    # только в памяти процесса.
+    global _lemma_cache
+    words = [token for token in tokens if token.isalpha()]
+    if not words:
+        return list(tokens)
+    with _lemma_lock:
+        if _lemma_cache is None:
+            _lemma_cache = LemmaCache(LEMMA_CACHE_PATH if os.path.exists(LEMMA_CACHE_PATH) else None)
+        lemmas = _lemma_cache.lemmatize_batch(words)
+        _lemma_cache.drain_new_entries()
+    return [lemmas[token].lower() if token in lemmas else token for token in tokens]
+
+def contains_sorted(sorted_array, values):
+    positions = np.searchsorted(sorted_array, values)
+    positions[positions == len(sorted_array)] = 0
+    return sorted_array[positions] == values if len(sorted_array) else np.zeros(len(values), dtype=bool)
+
+# Списки словопозиций по терминам (CSC нормированной матрицы) и верхние
+# границы вклада каждого термина для отсечения в top-k поиске
+def build_term_postings(matrix, norms):
+    inv_norms = np.zeros_like(norms)
+    nonzero = norms > 0
+    inv_norms[nonzero] = 1.0 / norms[nonzero]
+    normalized = sparse.diags(inv_norms) @ matrix
+    columns = normalized.tocsc()
+    columns.sort_indices()
+    upper_bounds = np.zeros(columns.shape[1])
+    lengths = np.diff(columns.indptr)
+    non_empty = lengths > 0
+    if columns.nnz:
+        upper_bounds[non_empty] = np.maximum.reduceat(columns.data, columns.indptr[:-1][non_empty])
+    return columns, upper_bounds
+
+# Порог top-k для каждой строки пакета (оценки лежат по строкам, как в CSR,
+# границы строк — indptr): k-я по величине оценка, если оценок в строке
+# больше k, иначе 0. np.partition по срезу строки — работа пропорциональна
+# числу оценок строки, а не числу документов
+def top_k_thresholds(indptr, scores, top_n):
+    counts = np.diff(indptr)
+    thresholds = np.zeros(len(counts))
+    for row in np.flatnonzero(counts > top_n).tolist():
+        row_scores = scores[indptr[row]:indptr[row + 1]]
+        thresholds[row] = np.partition(row_scores, len(row_scores) - top_n)[len(row_scores) - top_n]
+    return thresholds
+
+# Запросы, у которых в столбцах терминов произведения в сумме больше
+# BATCH_MAX_POSTINGS весов, search_batch() отдаёт MaxScore по одному:
+# произведение оценивает каждый такой вес. Порог — точка, где пакет и
+# MaxScore сравниваются по времени (benchmarks/bench_batch.py)
+BATCH_MAX_POSTINGS = 16000
+# Длинные списки — больше BATCH_LONG_POSTINGS документов и больше 1/BATCH_LONG_SHARE
+# корпуса — в пакетное произведение не входят (кроме термина с наибольшей
+# границей вклада): их вклад ограничивается сверху, как у несущественных
+# терминов MaxScore. На маленьких корпусах длинных списков нет
+BATCH_LONG_POSTINGS = 1024
+BATCH_LONG_SHARE = 8
+
+class IndexData:
+    # Всё, что нужно для ответа на запросы; подменяется целиком при перезагрузке
+
+    # precision — хранение весов (quantization.py). При float64 матрица
+    # документов остаётся как есть, и ответы совпадают с прежними до бита.
+    # Иначе хранятся только сжатые нормированные столбцы терминов, а
+    # матрица документов после загрузки не нужна
+    def __init__(self, vocab, matrix, idf, index, precision='float64'):
+        # Словарь и списки хранятся без строк Python (term_dictionary.py)
+        self.vocab = vocab if isinstance(vocab, TermDictionary) else TermDictionary.from_mapping(vocab)
+        self.precision = precision
+        self.shape = matrix.shape
+        self.nnz = matrix.nnz
+        self.norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        self.idf = idf
+        columns, self.upper_bounds = build_term_postings(matrix, self.norms)
+        self.term_postings = TermWeights.from_columns(columns, precision)
+        if precision == 'float64':
+            self.matrix = matrix
+        else:
+            self.matrix = None
+            self.upper_bounds = self.term_postings.upper_bounds()
+        if index is None:
+            self.postings = matrix_postings(self.vocab, columns)
+        elif isinstance(index, (BinaryInvertedIndex, TermPostings)):
+            # Бинарный индекс декодирует списки из mmap по требованию
+            self.postings = index
+        else:
+            self.postings = TermPostings.from_mapping({term: np.sort(docs) for term, docs in index.items()})
+        self._term_rows = None
+        self._term_keys = None
+        self._covers = True if index is None else None
+
+    @property
+    def nbytes(self):
+        # Память под веса, списки и словарь (без файлов, открытых через mmap)
+        total = self.norms.nbytes + self.idf.nbytes + self.upper_bounds.nbytes + self.term_postings.nbytes
+        total += self.vocab.nbytes
+        if isinstance(self.postings, TermPostings):
+            total += self.postings.nbytes
+        for matrix in (self.matrix, self._term_rows):
+            if matrix is not None:
+                total += matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        if self._term_keys is not None:
+            total += self._term_keys.nbytes
+        return total
+
+    @property
+    def term_rows(self):
+        # Транспонированная матрица весов (термины x документы) для пакетного
+        # поиска; строится при первом пакете
+        if self._term_rows is None:
+            term_rows = self.matrix.T.tocsr()
+            term_rows.sort_indices()
+            self._term_rows = term_rows
+        return self._term_rows
+
+    @property
+    def term_keys(self):
+        # Ключи term id * num_docs + doc id элементов term_rows (по
+        # возрастанию) для поиска веса пары термин-документ
+        if self._term_keys is None:
+            term_rows = self.term_rows
+            rows = np.repeat(np.arange(term_rows.shape[0], dtype=np.int64), np.diff(term_rows.indptr))
+            self._term_keys = rows * self.shape[0] + term_rows.indices
+        return self._term_keys
+
+    @property
+    def postings_cover_matrix(self):
+        # Все ненулевые веса есть в списках своих терминов: документ с
+        # положительной оценкой всегда среди кандидатов search(). Проверяется
+        # один раз, при первом пакете: ключи term id * num_docs + doc id
+        # столбцов ищутся среди ключей списков
+        if self._covers is None:
+            term_ids = dict(self.vocab.items())
+            ids, lists = [], []
+            for term, docs in self.postings.items():
+                term_id = term_ids.get(term)
+                if term_id is not None:
+                    ids.append(term_id)
+                    lists.append(np.asarray(docs, dtype=np.int64))
+            num_docs = self.shape[0]
+            posting_keys = np.repeat(np.array(ids, dtype=np.int64) * num_docs, [len(docs) for docs in lists])
+            if lists:
+                posting_keys += np.concatenate(lists)
+            posting_keys.sort()
+            columns = self.term_postings
+            column_keys = np.repeat(np.arange(len(columns.indptr) - 1, dtype=np.int64) * num_docs,
+                                    np.diff(columns.indptr)) + columns.indices
+            self._covers = bool(contains_sorted(posting_keys, column_keys).all())
+        return self._covers
+
+class SearchIndex:
+    # Индекс загружается один раз и обслуживает запросы из памяти.
+    # reload() перечитывает данные только если файлы на диске изменились.
+
+    # Веса берутся из бинарного файла task_4 (matrix_path), если он есть,
+    # иначе из текстовых файлов tfidf_doc_N_<space>.txt
+    # num_docs=None — число документов определяется по файлам
+    # space='lemmas' — поиск по леммам: запрос лемматизируется, index_path по
+    # умолчанию — индекс лемм. Если файла индекса нет, кандидаты берутся из
+    # ненулевых элементов самой матрицы
+    # precision — float64, float32, float16 или int8 (см. quantization.py)
+    # segments_path — каталог сегментов task_3 (segments.py). Если в нём есть
+    # segments.json, поиск по словам идёт по живым документам сегментов
+    # (с учётом удалений) с IDF по живому корпусу, а reload() подхватывает
+    # новые сегменты, дописанные update_index.py или потоковой индексацией.
+    # Общая матрица не собирается: оценки считаются по сегментам во время
+    # запроса (SegmentSnapshot), поэтому reload() стоит столько, сколько
+    # новые сегменты, а не весь корпус
+    def __init__(self, tfidf_path=TFIDF_PATH, index_path=None, num_docs=None,
+                 matrix_path=TFIDF_MATRIX_PATH, space='tokens', precision='float64',
+                 segments_path=None):
+        if space not in SPACE_INDEX_PATHS:
+            raise ValueError(f"неизвестное пространство '{space}'")
+        self.space = space
+        self.precision = precision
+        self.tfidf_path = tfidf_path
+        self.index_path = index_path or SPACE_INDEX_PATHS[space]
+        self.requested_docs = num_docs
+        self.num_docs = num_docs
+        self.matrix_path = matrix_path
+        self.segments_path = segments_path
+        self.segments = None
+        self.version = 0
+        self._lock = threading.Lock()
+        self._signature = None
+        self.load()
+
+    @property
+    def uses_segments(self):
+        return (self.space == 'tokens' and self.segments_path is not None
+                and os.path.exists(os.path.join(self.segments_path, MANIFEST_NAME)))
+
+    def use_matrix_file(self):
+        return self.matrix_path is not None and os.path.exists(self.matrix_path)
+
+    def artifact_paths(self):
+        if self.uses_segments:
+            # Новый сегмент или слияние меняют segments.json, удаление — файл .del
+            deleted = sorted(name for name in os.listdir(self.segments_path) if name.endswith('.del'))
+            return [os.path.join(self.segments_path, name) for name in [MANIFEST_NAME] + deleted]
+        if self.use_matrix_file():
+            paths = [self.matrix_path, self.index_path]
+        else:
+            paths = tfidf_file_paths(self.tfidf_path, self.requested_docs, self.space) + [self.index_path]
+        resolved = resolve_index_path(self.index_path)
+        if resolved != self.index_path:
+            paths.append(resolved)
+        return paths
+
+    def artifacts_signature(self):
+        signature = []
+        for path in self.artifact_paths():
+            if not os.path.exists(path):
+                continue
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def load(self):
+        with self._lock, metrics.stage('load'):
+            signature = self.artifacts_signature()
+            if self.uses_segments:
+                if self.segments is None:
+                    self.segments = SegmentedIndex(self.segments_path)
+                else:
+                    self.segments.refresh()
+                snapshot = self.segments.snapshot()
+                self.num_docs = snapshot.num_live
+                self._set_data(snapshot)
+                self._signature = signature
+                return
+            if self.use_matrix_file():
+                tfidf = TfidfMatrix(self.matrix_path, self.space)
+                vocab, matrix, idf = tfidf.vocab, tfidf.rows_by_doc_id(), tfidf.idf
+                self.num_docs = matrix.shape[0]
+            else:
+                vocab, matrix, idf = load_tfidf_matrix(self.tfidf_path, self.requested_docs, self.space)
+                self.num_docs = matrix.shape[0]
+            index_path = resolve_index_path(self.index_path)
+            index = open_inverted_index(index_path) if os.path.exists(index_path) else None
+            self._set_data(IndexData(vocab, matrix, idf, index, self.precision))
+            self._signature = signature
+
+    @classmethod
+    def from_vectors(cls, vocab, doc_vectors, idf_values, index):
+        return cls.from_matrix(vocab, build_doc_term_matrix(doc_vectors, vocab), idf_array(vocab, idf_values), index)
+
+    @classmethod
+    def from_matrix(cls, vocab, matrix, idf, index, precision='float64'):
+        # Индекс поверх данных в памяти (бенчмарки, синтетические корпуса);
+        # файлов на диске у него нет, поэтому reload() ничего не делает
+        self = cls.__new__(cls)
+        self.space = 'tokens'
+        self.precision = precision
+        self.tfidf_path = self.index_path = self.matrix_path = self.segments_path = None
+        self.segments = None
+        self.requested_docs = self.num_docs = matrix.shape[0]
+        self.version = 0
+        self._lock = threading.Lock()
+        self._signature = None
+        self._set_data(IndexData(vocab, matrix, idf, index, precision))
+        return self
+
+    def _set_data(self, data):
+        # Подменяем все данные одним присваиванием, чтобы параллельные
+        # запросы не увидели наполовину загруженный индекс
+        self._data = data
+        self.version += 1
+
+    def is_stale(self):
+        if self.tfidf_path is None:
+            return False
+        return self.artifacts_signature() != self._signature
+
+    def reload(self, force=False):
+        if self.tfidf_path is None:
+            return False
+        if force or self.is_stale():
+            self.load()
+            return True
+        return False
+
+    def analyze(self, query_tokens):
+        if self.space == 'lemmas':
+            with metrics.stage('lemmatize'):
+                return lemmatize_query(query_tokens)
+        return query_tokens
+
+    def analyze_batch(self, queries):
+        # Леммы всего пакета — одним обращением к кэшу лемм
+        if self.space != 'lemmas':
+            return queries
+        with metrics.stage('lemmatize'):
+            lemmas = lemmatize_query([token for query in queries for token in query])
+        bounds = np.cumsum([0] + [len(query) for query in queries]).tolist()
+        return [lemmas[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def candidates(self, query_tokens):
+        data = self._data
+        query_tokens = self.analyze(query_tokens)
+        if isinstance(data, SegmentSnapshot):
+            return set(candidate_array(data, expand_tokens(query_tokens, data)).tolist())
+        return set(candidate_array(data.postings, expand_tokens(query_tokens, data.vocab)).tolist())
+
+    def search(self, query_tokens, top_n=10, exhaustive=False):
+        data = self._data
+        metrics.inc('search_queries_total', engine='vector' if self.space == 'tokens' else 'vector_lemmas')
+        query_tokens = self.analyze(query_tokens)
+        if isinstance(data, SegmentSnapshot):
+            return self._search_segments(data, query_tokens, top_n)
+        with metrics.stage('vectorize'):
+            # learn* -> термины словаря с этим префиксом (не больше MAX_EXPANSIONS)
+            query_tokens = expand_tokens(query_tokens, data.vocab)
+            term_ids, weights = query_weights(query_tokens, data.vocab, data.idf)
+            query_norm = np.linalg.norm(weights)
+        if query_norm == 0 or top_n <= 0:
+            return []
+        if exhaustive:
+            return self._search_exhaustive(data, query_tokens, term_ids, weights, query_norm, top_n)
+        return self._search_maxscore(data, query_tokens, term_ids, weights, query_norm, top_n)
+
+    def search_batch(self, queries, top_n=10, batch_size=1024):
+        # Пакет запросов: матрица запросов (строка на запрос) умножается на
+        # матрицу документов одним произведением разреженных матриц, top-k
+        # выбирается сразу по всем строкам. Ответ для каждого запроса тот же,
+        # что у search() (при precision='float64' — до бита); batch_size
+        # ограничивает размер промежуточных матриц.
+        # Длинные списки в произведение не входят, их вклад ограничен сверху
+        # (_search_pruned). Запросы, для которых этой границы не хватает или
+        # у которых остаётся больше BATCH_MAX_POSTINGS весов, идут через
+        # MaxScore по одному, как в search()
+        data = self._data
+        queries = list(queries)
+        if isinstance(data, SegmentSnapshot):
+            # Сегменты: запросы по одному, матрицы для пакета нет
+            metrics.inc('search_queries_total', len(queries), engine='vector')
+            return [self._search_segments(data, tokens, top_n) for tokens in self.analyze_batch(queries)]
+        results = []
+        for start in range(0, len(queries), batch_size):
+            results.extend(self._search_chunk(data, queries[start:start + batch_size], top_n))
+        return results
+
+    def _search_chunk(self, data, queries, top_n):
+        metrics.inc('search_queries_total', len(queries), engine='vector' if self.space == 'tokens' else 'vector_lemmas')
+        if top_n <= 0:
+            return [[] for _ in queries]
+        queries = self.analyze_batch(queries)
+        # Отсечение по верхним границам, как в MaxScore, — когда есть матрица
+        # весов и списки покрывают все её ненулевые веса
+        prune = data.matrix is not None and data.postings_cover_matrix
+        with metrics.stage('vectorize'):
+            expanded = [expand_tokens(tokens, data.vocab) for tokens in queries]
+            term_lengths = np.diff(data.term_postings.indptr)
+            long_postings = max(BATCH_LONG_POSTINGS, data.shape[0] // BATCH_LONG_SHARE)
+            query_terms = []
+            query_norms = np.zeros(len(queries))
+            rest_bounds = np.zeros(len(queries))
+            routed = {}
+            for row, tokens in enumerate(expanded):
+                ids, values = query_weights(tokens, data.vocab, data.idf)
+                query_norms[row] = np.linalg.norm(values)
+                essential = np.ones(len(ids), dtype=bool)
+                if prune and query_norms[row] > 0:
+                    # Длинные списки (кроме термина с наибольшей границей) в
+                    # произведение не входят, их вклад ограничен сверху
+                    bounds = values * data.upper_bounds[ids] / query_norms[row]
+                    essential = term_lengths[ids] <= long_postings
+                    essential[np.argmax(bounds)] = True
+                    rest_bounds[row] = bounds[~essential].sum()
+                if query_norms[row] > 0 and term_lengths[ids[essential]].sum() > BATCH_MAX_POSTINGS:
+                    routed[row] = (ids, values)
+                    ids, values, essential = ids[:0], values[:0], essential[:0]
+                    rest_bounds[row] = 0.0
+                query_terms.append((ids, values, essential))
+            rows = np.repeat(np.arange(len(queries)), [len(ids) for ids, _, _ in query_terms])
+            term_ids = np.concatenate([ids for ids, _, _ in query_terms])
+            weights = np.concatenate([values for _, values, _ in query_terms])
+            essential = np.concatenate([essential for _, _, essential in query_terms])
+            query_matrix = sparse.csr_matrix((weights, (rows, term_ids)), shape=(len(queries), data.shape[1]))
+            query_matrix.sort_indices()
+
+        if prune:
+            essential_matrix = sparse.csr_matrix((weights[essential], (rows[essential], term_ids[essential])),
+                                                 shape=query_matrix.shape)
+            results, failed = self._search_pruned(data, query_matrix, essential_matrix, rest_bounds,
+                                                  query_norms, top_n)
+            for row in failed:
+                routed[row] = query_terms[row][:2]
+        else:
+            results = self._search_masked(data, expanded, query_matrix, query_norms, routed, top_n)
+        # Остальные запросы — MaxScore по одному, ответ тот же, что у search()
+        for row, (ids, values) in routed.items():
+            results[row] = self._search_maxscore(data, expanded[row], ids, values, query_norms[row], top_n)
+        return results
+
+    def _search_masked(self, data, expanded, query_matrix, query_norms, routed, top_n):
+        with metrics.stage('candidates'):
+            # Кандидаты — как в search(): документы из списков терминов запроса.
+            # Каждый список читается один раз на пакет; объединение списков
+            # для всех запросов — произведение матрицы "запрос x термин" на
+            # матрицу "термин x документ"
+            token_rows = {}
+            lists = []
+            query_rows, query_tokens = [], []
+            for row, (tokens, query_norm) in enumerate(zip(expanded, query_norms)):
+                for token in (set(tokens) if query_norm > 0 and row not in routed else ()):
+                    if token not in token_rows:
+                        token_rows[token] = len(lists) if token in data.postings else None
+                        if token_rows[token] is not None:
+                            lists.append(data.postings[token])
+                    if token_rows[token] is not None:
+                        query_rows.append(row)
+                        query_tokens.append(token_rows[token])
+            lengths = [len(docs) for docs in lists]
+            metrics.inc('search_postings_read_total', sum(lengths))
+            term_docs = sparse.csr_matrix(
+                (np.ones(sum(lengths)), np.concatenate(lists) if lists else np.zeros(0, dtype=np.int64),
+                 np.concatenate(([0], np.cumsum(lengths)))), shape=(len(lists), data.shape[0]))
+            query_terms = sparse.csr_matrix((np.ones(len(query_rows)), (query_rows, query_tokens)),
+                                            shape=(len(expanded), len(lists)))
+            mask = (query_terms @ term_docs).tocsr()
+            mask.data[:] = 1.0
+
+        with metrics.stage('score'):
+            metrics.inc('search_candidates_scored_total', mask.nnz)
+            rows, doc_ids, cosine = self._batch_cosine(data, query_matrix, query_norms, mask)
+            return self._batch_top_k(rows, doc_ids, cosine, len(expanded), top_n)
+
+    def _search_pruned(self, data, query_matrix, essential_matrix, rest_bounds, query_norms, top_n):
+        # MaxScore для пакета. Произведение по существенным терминам даёт
+        # частичные оценки кандидатов, k-я из них — нижняя граница порога.
+        # Если сумма границ остальных терминов (rest_bounds) ниже неё, документ
+        # вне кандидатов в топ не попадёт; кандидаты, которые ещё могут
+        # попасть, оцениваются точно по всем терминам. Иначе запрос
+        # возвращается в failed и ищется MaxScore по одному
+        num_rows = query_matrix.shape[0]
+        slack = 1e-9
+        with metrics.stage('candidates'):
+            metrics.inc('search_postings_read_total', int(np.diff(data.term_rows.indptr)[essential_matrix.indices].sum()))
+            partial = (essential_matrix @ data.term_rows).tocsr()
+            rows = np.repeat(np.arange(num_rows), np.diff(partial.indptr))
+            doc_ids = partial.indices.astype(np.int64)
+            doc_norms = data.norms[doc_ids]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scores = np.where(doc_norms > 0, partial.data / (doc_norms * query_norms[rows]), 0.0)
+            metrics.inc('search_candidates_scored_total', len(scores))
+
+        with metrics.stage('score'):
+            positive = scores > 0
+            rows, doc_ids, scores = rows[positive], doc_ids[positive], scores[positive]
+            indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=num_rows))))
+            lower = top_k_thresholds(indptr, scores, top_n)
+            failed = (rest_bounds > 0) & (rest_bounds >= lower - slack)
+            keep = ~failed[rows] & (scores + rest_bounds[rows] >= lower[rows] - slack)
+            rows, doc_ids = rows[keep], doc_ids[keep]
+            cosine = self._score_pairs(data, query_matrix, rows, doc_ids, query_norms)
+            return self._batch_top_k(rows, doc_ids, cosine, num_rows, top_n), np.flatnonzero(failed).tolist()
+
+    def _score_pairs(self, data, query_matrix, rows, doc_ids, query_norms):
+        # Точные оценки пар (запрос, документ). Вес термина в документе
+        # ищется бинарным поиском по ключам term id * num_docs + doc id,
+        # термины запроса складываются по возрастанию id, как в произведении
+        # матрицы на вектор в search(), поэтому оценки совпадают до бита
+        keys = data.term_keys
+        values = data.term_rows.data
+        lengths = np.diff(query_matrix.indptr)[rows]
+        starts = query_matrix.indptr[rows]
+        dots = np.zeros(len(rows))
+        for slot in range(int(lengths.max()) if len(rows) else 0):
+            pairs = np.flatnonzero(lengths > slot)
+            positions_in_query = starts[pairs] + slot
+            wanted = query_matrix.indices[positions_in_query].astype(np.int64) * data.shape[0] + doc_ids[pairs]
+            positions = np.searchsorted(keys, wanted)
+            positions[positions == len(keys)] = 0
+            found = keys[positions] == wanted
+            dots[pairs[found]] += values[positions[found]] * query_matrix.data[positions_in_query[found]]
+        doc_norms = data.norms[doc_ids]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(doc_norms > 0, dots / (doc_norms * query_norms[rows]), 0.0)
+
+    def _batch_top_k(self, rows, doc_ids, cosine, num_rows, top_n):
+        # rows не убывают. В каждой строке остаются оценки не ниже k-й (порог
+        # по срезу строки), остаток сортируется по (запрос, -оценка, doc id),
+        # берутся первые top_n каждой строки
+        positive = cosine > 0
+        rows, doc_ids, cosine = rows[positive], doc_ids[positive], cosine[positive]
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=num_rows))))
+        keep = cosine >= top_k_thresholds(indptr, cosine, top_n)[rows]
+        rows, doc_ids, cosine = rows[keep], doc_ids[keep], cosine[keep]
+        order = np.lexsort((doc_ids, -cosine, rows))
+        rows, doc_ids, cosine = rows[order], doc_ids[order], cosine[order]
+        keep = np.arange(len(rows)) - np.searchsorted(rows, rows) < top_n
+        counts = np.bincount(rows[keep], minlength=num_rows)
+        pairs = list(zip(doc_ids[keep].tolist(), cosine[keep].tolist()))
+        bounds = np.concatenate(([0], np.cumsum(counts))).tolist()
+        return [pairs[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def _batch_cosine(self, data, query_matrix, query_norms, mask):
+        if data.matrix is None:
+            # Сжатые веса: разворачиваются только столбцы терминов пакета,
+            # они уже поделены на нормы документов
+            term_ids, inverse = np.unique(query_matrix.indices, return_inverse=True)
+            used = sparse.csr_matrix((query_matrix.data, inverse, query_matrix.indptr),
+                                     shape=(query_matrix.shape[0], len(term_ids)))
+            dots = (used @ data.term_postings.term_matrix(term_ids)).multiply(mask).tocsr()
+            rows = np.repeat(np.arange(query_matrix.shape[0]), np.diff(dots.indptr))
+            return rows, dots.indices.astype(np.int64), dots.data / query_norms[rows]
+        # Термины запроса складываются по возрастанию id, как в произведении
+        # матрицы на вектор в search(), поэтому скалярные произведения
+        # совпадают до бита
+        dots = (query_matrix @ data.term_rows).multiply(mask).tocsr()
+        rows = np.repeat(np.arange(query_matrix.shape[0]), np.diff(dots.indptr))
+        doc_ids = dots.indices.astype(np.int64)
+        doc_norms = data.norms[doc_ids]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return rows, doc_ids, np.where(doc_norms > 0, dots.data / (doc_norms * query_norms[rows]), 0.0)
+
+    def _score_docs(self, data, doc_ids, term_ids, weights, query_norm):
+        if data.matrix is None:
+            return self._score_docs_by_terms(data, doc_ids, term_ids, weights, query_norm)
+        query_vector = np.zeros(data.matrix.shape[1])
+        query_vector[term_ids] = weights
+        dots = data.matrix[doc_ids] @ query_vector
+        doc_norms = data.norms[doc_ids]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(doc_norms > 0, dots / (doc_norms * query_norm), 0.0)
+
+    def _score_docs_by_terms(self, data, doc_ids, term_ids, weights, query_norm):
+        # Косинус по сжатым столбцам терминов запроса: вклад термина находится
+        # у документов бинарным поиском
+        columns = data.term_postings
+        cosine = np.zeros(len(doc_ids))
+        for term_id, weight in zip(term_ids.tolist(), weights.tolist()):
+            start, end = columns.indptr[term_id], columns.indptr[term_id + 1]
+            docs = columns.indices[start:end]
+            if len(docs) == 0:
+                continue
+            positions = np.searchsorted(docs, doc_ids)
+            positions[positions == len(docs)] = 0
+            found = docs[positions] == doc_ids
+            cosine[found] += columns.values(term_id, start, end)[positions[found]] * weight
+        return cosine / query_norm
+
+    def _search_segments(self, data, query_tokens, top_n):
+        # Поиск по сегментам: IDF живого корпуса применяется к весам запроса,
+        # оценки и нормы документов считаются по сегментам (SegmentSnapshot.score)
+        with metrics.stage('vectorize'):
+            terms, weights = data.query_weights(expand_tokens(query_tokens, data))
+        if top_n <= 0 or not terms:
+            return []
+        with metrics.stage('score'):
+            doc_ids, cosine = data.score(terms, weights)
+            metrics.inc('search_candidates_scored_total', len(doc_ids))
+            if len(cosine) > top_n:
+                # Сортируются только оценки не ниже k-й (вместе с равными ей)
+                keep = cosine >= np.partition(cosine, len(cosine) - top_n)[len(cosine) - top_n]
+                doc_ids, cosine = doc_ids[keep], cosine[keep]
+            return self._top_k(doc_ids, cosine, top_n)
+
+    def _top_k(self, doc_ids, cosine, top_n):
+        positive = cosine > 0
+        doc_ids, cosine = doc_ids[positive], cosine[positive]
+        order = np.lexsort((doc_ids, -cosine))[:top_n]
+        return [(int(doc_ids[i]), float(cosine[i])) for i in order]
+
+    def _search_exhaustive(self, data, query_tokens, term_ids, weights, query_norm, top_n):
+        with metrics.stage('candidates'):
+            doc_ids = candidate_array(data.postings, query_tokens)
+        if len(doc_ids) == 0:
+            return []
+        # Все кандидаты оцениваются одним умножением матрицы на вектор
+        with metrics.stage('score'):
+            metrics.inc('search_candidates_scored_total', len(doc_ids))
+            cosine = self._score_docs(data, doc_ids, term_ids, weights, query_norm)
+            return self._top_k(doc_ids, cosine, top_n)
+
+    def _search_maxscore(self, data, query_tokens, term_ids, weights, query_norm, top_n):
+        # Term-at-a-time MaxScore: термины обрабатываются по убыванию верхней
+        # границы вклада. Пока сумма границ оставшихся терминов не меньше
+        # порога (k-й лучшей оценки), их списки сливаются целиком. Дальше
+        # новые документы в топ попасть не могут, и оставшиеся термины только
+        # дооценивают уже найденных кандидатов через бинарный поиск.
+        columns = data.term_postings
+        query_term_ids, query_term_weights = term_ids, weights
+        bounds = weights * data.upper_bounds[term_ids] / query_norm
+        useful = bounds > 0
+        term_ids, weights, bounds = term_ids[useful], weights[useful], bounds[useful]
+        order = np.argsort(-bounds, kind='stable')
+        term_ids, weights, bounds = term_ids[order], weights[order], bounds[order]
+        remaining = np.concatenate((np.cumsum(bounds[::-1])[::-1], [0.0]))
+
+        with metrics.stage('candidates'):
+            query_postings = [data.postings[token] for token in set(query_tokens) if token in data.postings]
+            metrics.inc('search_postings_read_total', sum(len(docs) for docs in query_postings))
+
+        def is_candidate(doc_ids):
+            valid = np.zeros(len(doc_ids), dtype=bool)
+            for docs in query_postings:
+                valid |= contains_sorted(docs, doc_ids)
+            return valid
+
+        with metrics.stage('score'):
+            # Запас на погрешность округления: пограничные документы не теряются,
+            # а финальные оценки пересчитываются так же, как при полном переборе
+            slack = 1e-9
+            acc_docs = np.zeros(0, dtype=np.int64)
+            acc_scores = np.zeros(0)
+            valid = np.zeros(0, dtype=bool)
+            threshold = 0.0
+            postings_read = 0
+            touched = 0
+            for i, term_id in enumerate(term_ids):
+                start, end = columns.indptr[term_id], columns.indptr[term_id + 1]
+                postings_read += int(end - start)
+                docs = columns.indices[start:end].astype(np.int64)
+                contrib = columns.values(term_id, start, end) * (weights[i] / query_norm)
+                if remaining[i] >= threshold - slack:
+                    merged = np.concatenate((acc_docs, docs))
+                    acc_docs, inverse = np.unique(merged, return_inverse=True)
+                    acc_scores = np.bincount(inverse, weights=np.concatenate((acc_scores, contrib)), minlength=len(acc_docs))
+                    valid = is_candidate(acc_docs)
+                    touched = max(touched, len(acc_docs))
+                else:
+                    positions = np.searchsorted(docs, acc_docs)
+                    positions[positions == len(docs)] = 0
+                    found = docs[positions] == acc_docs if len(docs) else np.zeros(len(acc_docs), dtype=bool)
+                    acc_scores[found] += contrib[positions[found]]
+                valid_scores = acc_scores[valid]
+                if len(valid_scores) >= top_n:
+                    threshold = np.partition(valid_scores, len(valid_scores) - top_n)[len(valid_scores) - top_n]
+                if remaining[i + 1] < threshold - slack:
+                    keep = valid & (acc_scores + remaining[i + 1] >= threshold - slack)
+                    acc_docs, acc_scores, valid = acc_docs[keep], acc_scores[keep], valid[keep]
+
+            metrics.inc('search_postings_read_total', postings_read)
+            metrics.inc('search_candidates_scored_total', touched)
+            survivors = acc_docs[valid]
+            if len(survivors) == 0:
+                return []
+            best = heapq.nlargest(top_n, zip(acc_scores[valid].tolist(), (-survivors).tolist()))
+            cutoff = best[-1][0] - slack
+            survivors = survivors[acc_scores[valid] >= cutoff]
+            cosine = self._score_docs(data, survivors, query_term_ids, query_term_weights, query_norm)
+            return self._top_k(survivors, cosine, top_n)
+
+def postings_size(postings):
+    return sum(len(docs) for _, docs in postings.items())
+
+def compare_spaces(num_queries=500, max_terms=3, top_n=10, seed=0):
+    # Память, размер словаря и списков, задержка поиска по словам и по леммам
+    # на одних и тех же запросах (слова берутся из словаря токенов)
+    indexes = {}
+    stats = {}
+    for space in SPACE_INDEX_PATHS:
+        tracemalloc.start()
+        start = time.perf_counter()
+        index = SearchIndex(space=space)
+        load_ms = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        indexes[space] = index
+        data = index._data
+        stats[space] = {'terms': len(data.vocab), 'nnz': data.nnz,
+                        'postings': postings_size(data.postings), 'memory': peak, 'load_ms': load_ms}
+
+    rng = random.Random(seed)
+    words = [term for term in indexes['tokens']._data.vocab if term.isalpha()]
+    queries = [rng.sample(words, rng.randint(1, max_terms)) for _ in range(num_queries)]
+    for space, index in indexes.items():
+        # Прогрев: кэш лемм и ленивые структуры не должны попасть в замер
+        for query in queries[:20]:
+            index.search(query, top_n)
+        timings = []
+        candidates = 0
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, top_n)
+            timings.append((time.perf_counter() - start) * 1000)
+            candidates += len(index.candidates(query))
+        stats[space].update(p50=np.percentile(timings, 50), p99=np.percentile(timings, 99),
+                            candidates=candidates / len(queries))
+
+    print(f"Документов: {indexes['tokens'].num_docs}, запросов: {len(queries)}")
+    print(f"{'':>22} {'слова':>12} {'леммы':>12} {'леммы/слова':>12}")
+    rows = (('терминов', 'terms', '{:.0f}'), ('ненулевых весов', 'nnz', '{:.0f}'),
+            ('элементов в списках', 'postings', '{:.0f}'), ('память, КБ', 'memory', '{:.1f}'),
+            ('загрузка, мс', 'load_ms', '{:.1f}'), ('p50, мс', 'p50', '{:.3f}'),
+            ('p99, мс', 'p99', '{:.3f}'), ('кандидатов', 'candidates', '{:.1f}'))
+    for title, key, template in rows:
+        tokens, lemmas = stats['tokens'][key], stats['lemmas'][key]
+        if key == 'memory':
+            tokens, lemmas = tokens / 1024, lemmas / 1024
+        ratio = lemmas / tokens if tokens else 0.0
+        print(f"{title:>22} {template.format(tokens):>12} {template.format(lemmas):>12} {ratio:>12.2f}")
+
+if __name__ == '__main__':
+    compare_spaces(*map(int, sys.argv[1:2]))
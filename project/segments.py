@@ -0,0 +1,650 @@
+import bisect
+import heapq
+import json
+import math
+import os
+import threading
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from positional_index import PositionalIndex, encode_positional_index
+
+# Инкрементальный индекс из неизменяемых сегментов.
+# Каждый вызов add_documents() пишет новый маленький сегмент, удаление
+# дописывает doc id в файл-надгробие сегмента (segment_N.del), а список
+# сегментов хранится в segments.json. Документные частоты (df) ведутся в
+# памяти и меняются только на термины добавленной/удалённой страницы, так что
+# добавление одной страницы стоит столько, сколько сама страница.
+# Слияние объединяет сегменты одного порядка размера и выбрасывает удалённые
+# документы; его можно запускать в фоне.
+# Поиск (SearchIndex, BooleanSearchEngine) идёт по сегментам без сборки общей
+# матрицы: snapshot() отдаёт живые части сегментов и IDF по df живого корпуса,
+# списки и оценки сливаются по сегментам во время запроса (SegmentSnapshot),
+# IDF применяется к весам запроса. refresh() подхватывает сегменты, записанные
+# другим процессом, и пересчитывает учёт только для изменившихся сегментов.
+# Если документы пришли с позициями слов, сегмент хранит и свой позиционный
+# индекс; фразы и NEAR ищутся по всем сегментам, при слиянии позиции
+# переносятся вместе с документами.
+# Файлы слитых сегментов удаляются не сразу, а при следующем слиянии: другой
+# процесс мог уже прочитать старый segments.json и ещё загружать их.
+
+SEGMENTS_PATH = 'information-search/task_3/segments'
+MANIFEST_NAME = 'segments.json'
+# Сколько раз refresh() перечитывает segments.json, если сегмент из него уже удалён
+LOAD_ATTEMPTS = 5
+# Если запрос задел больше 1/NORMS_SHARE документов сегмента, нормы считаются
+# сразу для всего сегмента и запоминаются до следующей версии индекса
+NORMS_SHARE = 8
+
+class Segment:
+    # Неизменяемая часть индекса: doc id, хеши содержимого,
+    # матрица документ-термин (число вхождений) в локальных id терминов и
+    # позиционный индекс (None, если позиций у документов не было)
+
+    def __init__(self, name, doc_ids, hashes, terms, counts, positions=None):
+        self.name = name
+        self.doc_ids = doc_ids
+        self.hashes = hashes
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.counts = counts
+        self.positions = positions
+        self.df = np.diff(counts.tocsc().indptr)
+        self.deleted = set()
+        # Глобальные id терминов (назначает SegmentedIndex), маска живых
+        # документов и матрицы TF строятся один раз и дальше берутся из кэша
+        self.global_ids = None
+        self._live = None
+        self._frequencies = None
+
+    @classmethod
+    def build(cls, name, documents):
+        # documents: [(doc_id, tokens, content_hash)] или
+        # [(doc_id, tokens, content_hash, [(позиция, термин)])]
+        terms = sorted({token for document in documents for token in document[1]})
+        term_ids = {term: i for i, term in enumerate(terms)}
+        indptr = [0]
+        indices = []
+        data = []
+        for _, tokens, *_ in documents:
+            for token, count in sorted(Counter(tokens).items()):
+                indices.append(term_ids[token])
+                data.append(count)
+            indptr.append(len(indices))
+        counts = sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(documents), len(terms)),
+        )
+        doc_ids = np.array([document[0] for document in documents], dtype=np.int64)
+        hashes = np.array([document[2] for document in documents], dtype=np.str_)
+        positions = None
+        if documents and all(len(document) > 3 and document[3] is not None for document in documents):
+            positions = encode_segment_positions([(document[0], document[3]) for document in documents])
+        return cls(name, doc_ids, hashes, terms, counts, positions)
+
+    def save(self, directory):
+        path = os.path.join(directory, self.name + '.npz')
+        tmp_path = os.path.join(directory, self.name + '.tmp.npz')
+        arrays = {}
+        if self.positions is not None:
+            arrays['positions'] = np.frombuffer(self.positions.data, dtype=np.uint8)
+        np.savez(
+            tmp_path,
+            doc_ids=self.doc_ids,
+            hashes=self.hashes,
+            terms=np.array(self.terms, dtype=np.str_),
+            indptr=self.counts.indptr,
+            indices=self.counts.indices,
+            data=self.counts.data,
+            **arrays,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory, name):
+        with np.load(os.path.join(directory, name + '.npz'), allow_pickle=False) as f:
+            terms = f['terms'].tolist()
+            counts = sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=(len(f['doc_ids']), len(terms)))
+            # Сегменты, записанные без позиций, фраз не поддерживают
+            positions = PositionalIndex(f['positions'].tobytes()) if 'positions' in f.files else None
+            segment = cls(name, f['doc_ids'], f['hashes'], terms, counts, positions)
+        segment.deleted = read_deleted(directory, name)
+        return segment
+
+    def live_mask(self):
+        # Надгробия только добавляются, поэтому маска пересчитывается, лишь
+        # когда их стало больше
+        deleted = self.deleted
+        if self._live is None or self._live[0] != len(deleted):
+            if deleted:
+                live = ~np.isin(self.doc_ids, np.array(list(deleted), dtype=np.int64))
+            else:
+                live = np.ones(len(self.doc_ids), dtype=bool)
+            self._live = (len(deleted), live)
+        return self._live[1]
+
+    def frequencies(self):
+        # TF (число вхождений / длина документа): строки по документам (для
+        # норм) и столбцы по терминам (для списков запроса)
+        if self._frequencies is None:
+            lengths = np.asarray(self.counts.sum(axis=1)).ravel()
+            lengths[lengths == 0] = 1
+            rows = sparse.csr_matrix((self.counts.data / np.repeat(lengths, np.diff(self.counts.indptr)),
+                                      self.counts.indices, self.counts.indptr), shape=self.counts.shape)
+            columns = rows.tocsc()
+            columns.sort_indices()
+            self._frequencies = (rows, columns)
+        return self._frequencies
+
+    def live_count(self):
+        return len(self.doc_ids) - len(self.deleted)
+
+    def document_terms(self, position):
+        start, end = self.counts.indptr[position], self.counts.indptr[position + 1]
+        return [self.terms[i] for i in self.counts.indices[start:end]]
+
+class SegmentedIndex:
+
+    def __init__(self, directory=SEGMENTS_PATH, merge_factor=10):
+        self.directory = directory
+        self.merge_factor = merge_factor
+        self.version = 0
+        self._lock = threading.RLock()
+        self._merge_thread = None
+        self._snapshot = None
+        os.makedirs(directory, exist_ok=True)
+        manifest, self.segments = self._load_segments({})
+        self.next_segment = manifest['next_segment']
+        self.generation = manifest.get('generation', 0)
+        self.retired = manifest.get('retired', [])
+        # Термин -> глобальный id и df живых документов по глобальным id
+        self.term_ids = {}
+        self.df = np.zeros(0, dtype=np.int64)
+        self.locations = {}
+        for segment in self.segments:
+            self._register(segment)
+
+    def read_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return {'segments': [], 'next_segment': 0, 'generation': 0, 'retired': []}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_manifest(self):
+        # generation растёт с каждой записью; retired — слитые сегменты
+        # [имя, поколение], чьи файлы ещё не удалены (удаляются следующим слиянием)
+        self.generation += 1
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({
+                'segments': [s.name for s in self.segments],
+                'next_segment': self.next_segment,
+                'generation': self.generation,
+                'retired': self.retired,
+            }, f)
+        os.replace(path + '.tmp', path)
+
+    def _load_segments(self, loaded):
+        # Сегменты из segments.json; уже загруженные (loaded: имя -> Segment)
+        # только перечитывают надгробия. Если между чтением списка и загрузкой
+        # сегмент успели слить и удалить, список перечитывается заново
+        for attempt in range(LOAD_ATTEMPTS):
+            manifest = self.read_manifest()
+            try:
+                segments = []
+                for name in manifest['segments']:
+                    segment = loaded.get(name)
+                    if segment is None:
+                        segment = Segment.load(self.directory, name)
+                    else:
+                        segment.deleted = read_deleted(self.directory, name)
+                    segments.append(segment)
+                return manifest, segments
+            except FileNotFoundError:
+                if attempt == LOAD_ATTEMPTS - 1:
+                    raise
+
+    # Подхватить сегменты и удаления, записанные другим процессом
+    # (например, потоковой индексацией во время обхода)
+    def refresh(self):
+        # Перестраивается только то, что изменилось: новые сегменты
+        # регистрируются, у старых учитываются новые надгробия, слитые
+        # другим процессом сегменты снимаются с учёта
+        with self._lock:
+            before = {segment.name: segment.deleted for segment in self.segments}
+            manifest, segments = self._load_segments({segment.name: segment for segment in self.segments})
+            if [s.name for s in segments] == list(before) and all(
+                    len(s.deleted) == len(before[s.name]) for s in segments):
+                return False
+            self.next_segment = manifest['next_segment']
+            self.generation = manifest.get('generation', 0)
+            self.retired = manifest.get('retired', [])
+            names = {segment.name for segment in segments}
+            for segment in self.segments:
+                if segment.name not in names:
+                    self._unregister(segment)
+            for segment in segments:
+                if segment.name in before:
+                    for doc_id in segment.deleted - before[segment.name]:
+                        self._forget(segment, doc_id)
+            for segment in segments:
+                if segment.name not in before:
+                    self._register(segment)
+            self.segments = segments
+            self.version += 1
+            return True
+
+    def _global_ids(self, segment):
+        # Локальные id терминов сегмента -> глобальные (self.term_ids только
+        # растёт, поэтому у загруженного сегмента они не меняются)
+        if segment.global_ids is None:
+            ids = np.empty(len(segment.terms), dtype=np.int64)
+            for i, term in enumerate(segment.terms):
+                term_id = self.term_ids.get(term)
+                if term_id is None:
+                    term_id = self.term_ids[term] = len(self.term_ids)
+                ids[i] = term_id
+            segment.global_ids = ids
+            if len(self.term_ids) > len(self.df):
+                # Запас вдвое, чтобы массив df не копировался на каждый сегмент
+                grown = np.zeros(max(len(self.term_ids), 2 * len(self.df)), dtype=np.int64)
+                grown[:len(self.df)] = self.df
+                self.df = grown
+        return segment.global_ids
+
+    def _live_df(self, segment):
+        live = segment.live_mask()
+        live_df = segment.df.copy()
+        if not live.all():
+            live_df -= np.diff(segment.counts[~live].tocsc().indptr)
+        return live, live_df
+
+    def _register(self, segment):
+        # Учёт живых документов сегмента в df и в карте doc id -> сегмент
+        global_ids = self._global_ids(segment)
+        live, live_df = self._live_df(segment)
+        for position in np.flatnonzero(live).tolist():
+            self.locations[int(segment.doc_ids[position])] = (segment, position)
+        self.df[global_ids] += live_df
+
+    def _unregister(self, segment):
+        # Сегмент ушёл из segments.json (его слили): его живые документы
+        # уже есть в новом сегменте
+        live, live_df = self._live_df(segment)
+        for position in np.flatnonzero(live).tolist():
+            doc_id = int(segment.doc_ids[position])
+            if self.locations.get(doc_id, (None,))[0] is segment:
+                del self.locations[doc_id]
+        self.df[segment.global_ids] -= live_df
+
+    def _forget(self, segment, doc_id):
+        # Документ сегмента помечен удалённым: убрать из карты и из df
+        location = self.locations.get(doc_id)
+        if location is None or location[0] is not segment:
+            return
+        del self.locations[doc_id]
+        start, end = segment.counts.indptr[location[1]], segment.counts.indptr[location[1] + 1]
+        self.df[segment.global_ids[segment.counts.indices[start:end]]] -= 1
+
+    def document_frequency(self, term):
+        term_id = self.term_ids.get(term)
+        return 0 if term_id is None else int(self.df[term_id])
+
+    def _new_segment_name(self):
+        name = f'segment_{self.next_segment:06d}'
+        self.next_segment += 1
+        return name
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.locations
+
+    def content_hash(self, doc_id):
+        location = self.locations.get(doc_id)
+        if location is None:
+            return None
+        segment, position = location
+        return str(segment.hashes[position])
+
+    def add_documents(self, documents):
+        # documents: [(doc_id, tokens, content_hash[, позиции])]; уже
+        # существующие документы заменяются: старая версия помечается удалённой
+        if not documents:
+            return
+        with self._lock:
+            for doc_id, *_ in documents:
+                if doc_id in self.locations:
+                    self._delete(doc_id)
+            segment = Segment.build(self._new_segment_name(), documents)
+            segment.save(self.directory)
+            self.segments.append(segment)
+            self._register(segment)
+            self.write_manifest()
+            self.version += 1
+
+    def add_document(self, doc_id, tokens, content_hash='', token_positions=None):
+        self.add_documents([(doc_id, tokens, content_hash, token_positions)])
+
+    def delete_document(self, doc_id):
+        with self._lock:
+            if doc_id not in self.locations:
+                return False
+            self._delete(doc_id)
+            self.version += 1
+            return True
+
+    def _delete(self, doc_id):
+        segment, _ = self.locations[doc_id]
+        self._forget(segment, doc_id)
+        segment.deleted.add(doc_id)
+        with open(os.path.join(self.directory, segment.name + '.del'), 'a', encoding='utf-8') as f:
+            f.write(f"{doc_id}\n")
+
+    def snapshot(self):
+        # Состояние для поиска (SegmentSnapshot): одно на версию индекса,
+        # запросы до следующего изменения берут готовое
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != self.version:
+                parts = [(segment, segment.live_mask()) for segment in self.segments]
+                self._snapshot = SegmentSnapshot(self.version, [(segment, live) for segment, live in parts if live.any()],
+                                                 self.term_ids, self.df[:len(self.term_ids)].copy(), len(self.locations))
+            return self._snapshot
+
+    def all_docs(self):
+        return self.snapshot().all_docs
+
+    def live_positions(self):
+        return self.snapshot().positions()
+
+    def merge_candidates(self):
+        # Ступенчатая политика: сегменты группируются по порядку размера,
+        # и группа из merge_factor сегментов сливается в один
+        tiers = {}
+        for segment in self.segments:
+            size = max(segment.live_count(), 1)
+            tier = int(math.log(size, self.merge_factor))
+            tiers.setdefault(tier, []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tiers[tier][:self.merge_factor]
+        # Сегменты, где больше половины документов удалены, переписываются
+        return [s for s in self.segments if s.deleted and len(s.deleted) * 2 > len(s.doc_ids)][:1]
+
+    def merge(self, segments):
+        with self._lock:
+            snapshot = {segment.name: set(segment.deleted) for segment in segments}
+        documents = []
+        for segment in segments:
+            deleted = snapshot[segment.name]
+            positions = document_positions(segment)
+            for position, doc_id in enumerate(segment.doc_ids.tolist()):
+                if doc_id in deleted:
+                    continue
+                documents.append((
+                    doc_id,
+                    expand_counts(segment, position),
+                    str(segment.hashes[position]),
+                    None if positions is None else positions.get(doc_id, []),
+                ))
+        with self._lock:
+            merged = Segment.build(self._new_segment_name(), documents)
+            self._global_ids(merged)
+            # Удаления, пришедшие во время слияния, переносятся в новый сегмент
+            for segment in segments:
+                for doc_id in segment.deleted - snapshot[segment.name]:
+                    merged.deleted.add(doc_id)
+            merged.save(self.directory)
+            if merged.deleted:
+                with open(os.path.join(self.directory, merged.name + '.del'), 'w', encoding='utf-8') as f:
+                    f.writelines(f"{doc_id}\n" for doc_id in sorted(merged.deleted))
+            merged_names = {segment.name for segment in segments}
+            position = min(i for i, s in enumerate(self.segments) if s.name in merged_names)
+            remaining = [s for s in self.segments if s.name not in merged_names]
+            self.segments = remaining[:position] + [merged] + remaining[position:]
+            for i, doc_id in enumerate(merged.doc_ids.tolist()):
+                if doc_id not in merged.deleted:
+                    self.locations[doc_id] = (merged, i)
+            # Файлы сегментов, слитых прошлыми слияниями, больше никому не
+            # нужны; только что слитые остаются до следующего слияния
+            purged = [name for name, _ in self.retired]
+            self.retired = [[name, self.generation + 1] for name in sorted(merged_names)]
+            self.write_manifest()
+            self.version += 1
+        self.purge_files(purged)
+        return merged
+
+    def purge_files(self, names):
+        for name in names:
+            for suffix in ('.npz', '.del'):
+                path = os.path.join(self.directory, name + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def maybe_merge(self):
+        merged = 0
+        while True:
+            with self._lock:
+                candidates = self.merge_candidates()
+            if not candidates:
+                return merged
+            self.merge(candidates)
+            merged += 1
+
+    def merge_in_background(self):
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return self._merge_thread
+        self._merge_thread = threading.Thread(target=self.maybe_merge, daemon=True)
+        self._merge_thread.start()
+        return self._merge_thread
+
+class SegmentSnapshot:
+    # Индекс на момент одной версии: живые части сегментов, IDF по df живого
+    # корпуса и глобальные id терминов. Собирается за O(словаря) numpy, без
+    # общей матрицы. Служит списками для QueryPlanner (get, prefix_range,
+    # terms_in_range) и считает косинус для SearchIndex (score)
+
+    def __init__(self, version, parts, term_ids, df, num_live):
+        # parts: [(Segment, маска живых документов)] — сегменты с живыми документами
+        self.version = version
+        self.parts = parts
+        self.term_ids = term_ids
+        self.df = df
+        self.num_live = num_live
+        self.idf = np.zeros(len(df))
+        present = df > 0
+        self.idf[present] = np.log(num_live / df[present])
+        self._all_docs = None
+        self._norms = {}
+
+    @property
+    def all_docs(self):
+        if self._all_docs is None:
+            docs = [segment.doc_ids[live] for segment, live in self.parts]
+            self._all_docs = np.sort(np.concatenate(docs)).astype(np.int64) if docs else np.zeros(0, dtype=np.int64)
+        return self._all_docs
+
+    @property
+    def num_docs(self):
+        return int(self.all_docs[-1]) + 1 if len(self.all_docs) else 0
+
+    def _term_id(self, term):
+        # Термин, который есть у живых документов снимка, иначе None
+        term_id = self.term_ids.get(term)
+        if term_id is None or term_id >= len(self.df) or self.df[term_id] == 0:
+            return None
+        return term_id
+
+    def __contains__(self, term):
+        return self._term_id(term) is not None
+
+    def get(self, term, default=None):
+        # Живые doc id термина по возрастанию: столбцы сегментов сливаются
+        if self._term_id(term) is None:
+            return default
+        docs = []
+        for segment, live in self.parts:
+            local = segment.term_ids.get(term)
+            if local is None:
+                continue
+            _, columns = segment.frequencies()
+            positions = columns.indices[columns.indptr[local]:columns.indptr[local + 1]]
+            docs.append(segment.doc_ids[positions[live[positions]]])
+        return np.sort(np.concatenate(docs)).astype(np.int64)
+
+    def __getitem__(self, term):
+        docs = self.get(term)
+        if docs is None:
+            raise KeyError(term)
+        return docs
+
+    # Для expand_pattern: границы диапазона — сами строки, термины берутся из
+    # отсортированных словарей сегментов
+    def prefix_range(self, prefix):
+        return prefix, prefix + '\U0010ffff'
+
+    def terms_in_range(self, low, high):
+        ranges = [segment.terms[bisect.bisect_left(segment.terms, low):bisect.bisect_left(segment.terms, high)]
+                  for segment, _ in self.parts]
+        previous = None
+        for term in heapq.merge(*ranges):
+            if term != previous and self._term_id(term) is not None:
+                yield term
+            previous = term
+
+    def query_weights(self, tokens):
+        # Веса запроса: доля термина в запросе * IDF живого корпуса. IDF
+        # нужен только для терминов запроса
+        counts = Counter(tokens)
+        terms, weights = [], []
+        for token, count in counts.items():
+            term_id = self._term_id(token)
+            if term_id is not None:
+                terms.append(token)
+                weights.append(count / len(tokens) * self.idf[term_id])
+        return terms, np.array(weights, dtype=np.float64)
+
+    def score(self, terms, weights):
+        # Косинус запроса с живыми документами, где есть его термины.
+        # Скалярное произведение — по столбцам терминов запроса, нормы
+        # документов — по строкам только этих документов с текущим IDF.
+        # Возвращает (doc id, косинус) для документов с положительной оценкой
+        query_norm = np.linalg.norm(weights)
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0)
+        if query_norm == 0:
+            return empty
+        term_weights = {term: weight * self.idf[self.term_ids[term]] for term, weight in zip(terms, weights)}
+        found_docs, found_scores = [], []
+        for segment, live in self.parts:
+            rows, columns = segment.frequencies()
+            positions, contributions = [], []
+            for term, weight in term_weights.items():
+                local = segment.term_ids.get(term)
+                if local is None or weight == 0:
+                    continue
+                start, end = columns.indptr[local], columns.indptr[local + 1]
+                positions.append(columns.indices[start:end])
+                contributions.append(columns.data[start:end] * weight)
+            if not positions:
+                continue
+            positions, contributions = np.concatenate(positions), np.concatenate(contributions)
+            keep = live[positions]
+            positions, inverse = np.unique(positions[keep], return_inverse=True)
+            if len(positions) == 0:
+                continue
+            dots = np.bincount(inverse, weights=contributions[keep], minlength=len(positions))
+            norms = self._segment_norms(segment, rows, positions)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cosine = np.where(norms > 0, dots / (norms * query_norm), 0.0)
+            found_docs.append(segment.doc_ids[positions].astype(np.int64))
+            found_scores.append(cosine)
+        if not found_docs:
+            return empty
+        doc_ids, cosine = np.concatenate(found_docs), np.concatenate(found_scores)
+        positive = cosine > 0
+        return doc_ids[positive], cosine[positive]
+
+    def _segment_norms(self, segment, rows, positions):
+        # Нормы TF-IDF документов сегмента на позициях positions с IDF этой
+        # версии: только по строкам этих документов или, если их много, по
+        # всему сегменту один раз на версию. Суммы в обоих случаях одинаковые
+        norms = self._norms.get(segment.name)
+        if norms is None and len(positions) * NORMS_SHARE >= len(segment.doc_ids):
+            norms = self._norms[segment.name] = self._row_norms(segment, rows)
+        if norms is not None:
+            return norms[positions]
+        return self._row_norms(segment, rows[positions])
+
+    def _row_norms(self, segment, rows):
+        values = rows.data * self.idf[segment.global_ids[rows.indices]]
+        owners = np.repeat(np.arange(rows.shape[0]), np.diff(rows.indptr))
+        return np.sqrt(np.bincount(owners, weights=values * values, minlength=rows.shape[0]))
+
+    def positions(self):
+        # Позиционные индексы сегментов для фраз и NEAR; None, если хотя бы
+        # у одного сегмента с живыми документами позиций нет
+        if any(segment.positions is None for segment, _ in self.parts):
+            return None
+        return SegmentPositions(self.parts)
+
+class SegmentPositions:
+    # Фразы и NEAR по позиционным индексам сегментов. Ответ каждого сегмента
+    # ограничивается его живыми документами: старая версия изменённой
+    # страницы остаётся в старом сегменте, но уже помечена удалённой
+
+    def __init__(self, parts):
+        # parts: [(Segment, маска живых документов)]
+        self.parts = parts
+
+    def _union(self, results):
+        docs = [found[np.isin(found, segment.doc_ids[live])] for found, (segment, live) in zip(results, self.parts)]
+        return np.unique(np.concatenate(docs)).astype(np.int64) if docs else np.zeros(0, dtype=np.int64)
+
+    def phrase(self, terms, offsets):
+        return self._union([segment.positions.phrase(terms, offsets) for segment, _ in self.parts])
+
+    def near(self, left, right, distance):
+        return self._union([segment.positions.near(left, right, distance) for segment, _ in self.parts])
+
+def encode_segment_positions(documents):
+    # documents: [(doc_id, [(позиция, термин)])] -> PositionalIndex сегмента
+    # (doc id — номера страниц, как в остальном сегменте)
+    positions = {}
+    for doc_id, token_positions in sorted(documents, key=lambda document: document[0]):
+        doc_positions = {}
+        for position, token in sorted(token_positions):
+            doc_positions.setdefault(token, []).append(position)
+        for token, term_positions in doc_positions.items():
+            doc_ids, counts, flat = positions.setdefault(token, ([], [], []))
+            doc_ids.append(doc_id)
+            counts.append(len(term_positions))
+            flat.extend(term_positions)
+    num_docs = max(doc_id for doc_id, _ in documents) + 1 if documents else 0
+    return PositionalIndex(encode_positional_index(positions, num_docs))
+
+def document_positions(segment):
+    # doc id -> [(позиция, термин)] из позиционного индекса сегмента (для слияния)
+    if segment.positions is None:
+        return None
+    documents = {}
+    for term, (doc_ids, counts, positions) in segment.positions.items():
+        owners = np.repeat(doc_ids, counts)
+        for doc_id, position in zip(owners.tolist(), positions.tolist()):
+            documents.setdefault(doc_id, []).append((position, term))
+    return documents
+
+def read_deleted(directory, name):
+    path = os.path.join(directory, name + '.del')
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return {int(line) for line in f if line.strip()}
+
+def expand_counts(segment, position):
+    start, end = segment.counts.indptr[position], segment.counts.indptr[position + 1]
+    tokens = []
+    for term_id, count in zip(segment.counts.indices[start:end], segment.counts.data[start:end]):
+        tokens.extend([segment.terms[term_id]] * int(count))
+    return tokens
@@ -0,0 +1,272 @@
+import argparse
+import json
+import math
+import mmap
+import os
+import random
+import struct
+import time
+import numpy as np
+from scipy import sparse
+from metrics import metrics
+from search_index import query_weights
+from term_dictionary import TermDictionary, expand_tokens
+from tfidf_matrix import TFIDF_MATRIX_PATH, TFIDF_TEXT_PATH, TfidfMatrix, read_text_section
+
+# Семантический режим поиска: LSA (усечённое SVD матрицы TF-IDF task_4) и
+# приближённый поиск ближайших соседей по плотным векторам.
+#   документ  строка TF-IDF, нормированная по длине, умноженная на V (термины × dims)
+#   запрос    вектор TF-IDF запроса, умноженный на ту же V
+# Векторы хранятся во float32 и нормированы, поэтому косинус — скалярное
+# произведение. Поиск — IVF: векторы разбиты k-средними на ~sqrt(N) списков,
+# запрос сравнивается с центроидами и просматривает только nprobe ближайших
+# списков, т. е. порядка sqrt(N) * nprobe векторов вместо N. Документы в
+# файле упорядочены по спискам, так что список — непрерывный срез массива.
+# Документ находится и без общих с запросом слов, если в корпусе эти слова
+# встречаются в похожем окружении.
+#
+# Файл устроен как tfidf.bin: заголовок, выровненные на 8 байт массивы и
+# JSON-оглавление в конце; массивы читаются из mmap без копирования.
+#   python information-search/project/semantic_index.py build --dims 128
+#   python information-search/project/semantic_index.py report --queries 200
+
+MAGIC = b'LSAI'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIQ')
+
+LSA_PATH = 'information-search/task_4/lsa.bin'
+
+ARRAYS = (('doc_ids', np.int64), ('idf', np.float64), ('components', np.float32),
+          ('embeddings', np.float32), ('centroids', np.float32), ('list_offsets', np.int64))
+
+# Сколько строк умножается на центроиды за раз при обучении k-средних
+CHUNK_ROWS = 65536
+# Обучающая выборка k-средних: не больше TRAIN_PER_LIST точек на список
+TRAIN_PER_LIST = 256
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    return vectors / norms[:, None]
+
+def lsa_embeddings(matrix, dims, seed=0):
+    # Строки нормируются, как при косинусе; возвращает V (термины × dims) и векторы документов.
+    # scipy.sparse.linalg нужен только при сборке, поэтому импортируется здесь
+    from scipy.sparse.linalg import svds
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inv_norms = np.zeros_like(norms)
+    inv_norms[norms > 0] = 1.0 / norms[norms > 0]
+    normalized = sparse.diags(inv_norms) @ sparse.csr_matrix(matrix, dtype=np.float64)
+    dims = max(1, min(dims, min(normalized.shape) - 1))
+    rng = np.random.default_rng(seed)
+    v0 = rng.standard_normal(min(normalized.shape))
+    u, s, vt = svds(normalized, k=dims, v0=v0)
+    order = np.argsort(-s)
+    components = vt[order].T
+    embeddings = u[:, order] * s[order]
+    return components.astype(np.float32), normalize_rows(embeddings).astype(np.float32)
+
+def nearest_centroids(vectors, centroids):
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), CHUNK_ROWS):
+        assign[start:start + CHUNK_ROWS] = np.argmax(vectors[start:start + CHUNK_ROWS] @ centroids.T, axis=1)
+    return assign
+
+def train_ivf(embeddings, num_lists, iterations=20, seed=0):
+    # Сферические k-средние: центроиды нормированы, близость — скалярное произведение
+    rng = np.random.default_rng(seed)
+    num_lists = max(1, min(num_lists, len(embeddings)))
+    sample = embeddings
+    if len(embeddings) > num_lists * TRAIN_PER_LIST:
+        sample = embeddings[rng.choice(len(embeddings), num_lists * TRAIN_PER_LIST, replace=False)]
+    centroids = sample[rng.choice(len(sample), num_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = nearest_centroids(sample, centroids)
+        members = sparse.csr_matrix((np.ones(len(sample), dtype=np.float32), (assign, np.arange(len(sample)))),
+                                    shape=(num_lists, len(sample)))
+        sums = np.asarray(members @ sample)
+        filled = np.linalg.norm(sums, axis=1) > 0
+        # Пустой список остаётся на прежнем месте
+        centroids[filled] = normalize_rows(sums[filled])
+    assign = nearest_centroids(embeddings, centroids)
+    order = np.argsort(assign, kind='stable')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=num_lists)))).astype(np.int64)
+    return centroids.astype(np.float32), offsets, order
+
+def default_nprobe(num_lists):
+    # Подбирается по отчёту report для своего корпуса (build --nprobe)
+    return max(1, math.ceil(math.sqrt(num_lists)))
+
+def write_semantic_index(path, terms, doc_ids, idf, components, embeddings, centroids, offsets, nprobe=None):
+    arrays = {
+        'doc_ids': np.asarray(doc_ids, dtype=np.int64),
+        'idf': np.asarray(idf, dtype=np.float64),
+        'components': components,
+        'embeddings': embeddings,
+        'centroids': centroids,
+        'list_offsets': offsets,
+    }
+    table = {'docs': len(arrays['doc_ids']), 'terms': len(terms), 'dims': components.shape[1],
+             'lists': len(centroids), 'nprobe': nprobe or default_nprobe(len(centroids))}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+
+        def append(blob):
+            offset = f.tell()
+            f.write(blob)
+            f.write(b'\0' * (-len(blob) % 8))
+            return offset
+
+        for key, dtype in ARRAYS:
+            table[key] = append(np.ascontiguousarray(arrays[key], dtype=dtype).tobytes())
+        encoded = '\n'.join(terms).encode('utf-8')
+        table['terms_offset'], table['terms_length'] = append(encoded), len(encoded)
+        table_offset = append(json.dumps(table).encode('utf-8'))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, table_offset))
+    os.replace(tmp_path, path)
+
+def build(tfidf_path=TFIDF_MATRIX_PATH, path=LSA_PATH, dims=128, num_lists=None, nprobe=None, seed=0):
+    if os.path.exists(tfidf_path):
+        tfidf = TfidfMatrix(tfidf_path, 'tokens')
+        terms, doc_ids, matrix, idf = tfidf.terms, tfidf.doc_ids, tfidf.matrix, tfidf.idf
+    else:
+        terms, doc_ids, matrix, idf = read_text_section(TFIDF_TEXT_PATH, 'tokens')
+    components, embeddings = lsa_embeddings(matrix, dims, seed)
+    if num_lists is None:
+        num_lists = round(math.sqrt(len(embeddings)))
+    centroids, offsets, order = train_ivf(embeddings, num_lists, seed=seed)
+    write_semantic_index(path, terms, np.asarray(doc_ids)[order], idf, components, embeddings[order],
+                         centroids, offsets, nprobe)
+    return len(doc_ids), components.shape[1], len(centroids)
+
+class SemanticIndex:
+
+    def __init__(self, path=LSA_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, table_offset = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path}: неподдерживаемый формат семантического индекса")
+        table = json.loads(self._mmap[table_offset:].rstrip(b'\0').decode('utf-8'))
+        docs, terms, dims, lists = table['docs'], table['terms'], table['dims'], table['lists']
+        shapes = {'doc_ids': (docs,), 'idf': (terms,), 'components': (terms, dims),
+                  'embeddings': (docs, dims), 'centroids': (lists, dims),
+                  'list_offsets': (lists + 1,)}
+        for key, dtype in ARRAYS:
+            count = int(np.prod(shapes[key]))
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=table[key])
+            setattr(self, key, array.reshape(shapes[key]))
+        self._table = table
+        self.vocab = TermDictionary.from_terms(self.terms)
+        self.nprobe = table['nprobe']
+
+    @property
+    def terms(self):
+        start = self._table['terms_offset']
+        encoded = self._mmap[start:start + self._table['terms_length']]
+        return encoded.decode('utf-8').split('\n') if self._table['terms'] else []
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def embed(self, query_tokens):
+        query_tokens = expand_tokens(query_tokens, self.vocab)
+        term_ids, weights = query_weights(query_tokens, self.vocab, self.idf)
+        if len(term_ids) == 0:
+            return None
+        query = weights.astype(np.float32) @ self.components[term_ids]
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else None
+
+    def probe_lists(self, query, nprobe):
+        # Срезы (начало, конец) nprobe списков с ближайшими к запросу центроидами
+        nprobe = min(nprobe, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        offsets = self.list_offsets
+        return [(offsets[c], offsets[c + 1]) for c in np.sort(nearest) if offsets[c + 1] > offsets[c]]
+
+    def search(self, query_tokens, top_n=10, nprobe=None, exact=False):
+        metrics.inc('search_queries_total', engine='semantic')
+        with metrics.stage('vectorize'):
+            query = self.embed(query_tokens)
+        if query is None or top_n <= 0:
+            return []
+        with metrics.stage('candidates'):
+            if exact:
+                spans = [(0, len(self.embeddings))]
+            else:
+                spans = self.probe_lists(query, nprobe or self.nprobe)
+        with metrics.stage('score'):
+            if not spans:
+                return []
+            rows = np.concatenate([np.arange(start, end) for start, end in spans])
+            scores = np.concatenate([self.embeddings[start:end] @ query for start, end in spans])
+            metrics.inc('search_candidates_scored_total', len(rows))
+            if len(rows) > top_n:
+                best = np.argpartition(-scores, top_n - 1)[:top_n]
+                rows, scores = rows[best], scores[best]
+            doc_ids = self.doc_ids[rows]
+            order = np.lexsort((doc_ids, -scores))
+            return [(int(doc_ids[i]), float(scores[i])) for i in order if scores[i] > 0]
+
+# Полнота top-k приближённого поиска относительно точного перебора тех же
+# векторов и задержка при разных nprobe
+def report(path=LSA_PATH, num_queries=200, max_terms=3, top_n=10, seed=0):
+    index = SemanticIndex(path)
+    rng = random.Random(seed)
+    terms = index.terms
+    queries = [rng.sample(terms, rng.randint(1, max_terms)) for _ in range(num_queries)]
+
+    def run(**kwargs):
+        results = []
+        start = time.perf_counter()
+        for query in queries:
+            results.append({doc_id for doc_id, _ in index.search(query, top_n, **kwargs)})
+        return results, (time.perf_counter() - start) / len(queries) * 1000
+
+    exact, exact_ms = run(exact=True)
+    lists = len(index.centroids)
+    print(f"Документов: {len(index)}, размерность: {index.components.shape[1]}, списков IVF: {lists}")
+    print(f"{'nprobe':>8} {'полнота@' + str(top_n):>12} {'мс/запрос':>10} {'просмотрено':>12}")
+    nprobes = sorted({n for n in (1, 2, 4, 8, 16, 32, 64, index.nprobe, lists) if n <= lists})
+    for nprobe in nprobes:
+        approx, approx_ms = run(nprobe=nprobe)
+        recall = [len(a & e) / len(e) for a, e in zip(approx, exact) if e]
+        mean_recall = sum(recall) / len(recall) if recall else 1.0
+        embedded = [index.embed(query) for query in queries]
+        embedded = [query for query in embedded if query is not None]
+        scanned = sum(end - start for query in embedded
+                      for start, end in index.probe_lists(query, nprobe)) / max(1, len(embedded))
+        mark = ' (по умолчанию)' if nprobe == index.nprobe else ''
+        print(f"{nprobe:>8} {mean_recall:>12.3f} {approx_ms:>10.3f} {scanned:>12.0f}{mark}")
+    print(f"{'точный':>8} {1.0:>12.3f} {exact_ms:>10.3f} {len(index):>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Семантический индекс (LSA + IVF)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="построить индекс из TF-IDF task_4")
+    build_parser.add_argument('--dims', type=int, default=128)
+    build_parser.add_argument('--lists', type=int, help="число списков IVF (по умолчанию sqrt(N))")
+    build_parser.add_argument('--nprobe', type=int, help="списков на запрос (по умолчанию sqrt(списков))")
+    build_parser.add_argument('--seed', type=int, default=0)
+    build_parser.add_argument('--output', default=LSA_PATH)
+    report_parser = subparsers.add_parser('report', help="полнота и задержка против точного поиска")
+    report_parser.add_argument('--queries', type=int, default=200)
+    report_parser.add_argument('--top', type=int, default=10)
+    report_parser.add_argument('--path', default=LSA_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        docs, dims, lists = build(path=args.output, dims=args.dims, num_lists=args.lists,
+                                  nprobe=args.nprobe, seed=args.seed)
+        print(f"Документов: {docs}, размерность: {dims}, списков IVF: {lists}, "
+              f"за {time.perf_counter() - start:.2f} с -> {args.output}")
+    else:
+        report(args.path, args.queries, top_n=args.top)
+
+if __name__ == '__main__':
+    main()
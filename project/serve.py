@@ -0,0 +1,101 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+
+# Боевой режим веб-приложения: индекс, хранилище выдачи и шаблоны
+# загружаются один раз в родительском процессе, затем процесс делится на
+# рабочие через fork. Массивы индекса (numpy, mmap-файлы .bin) рабочие
+# читают из общих страниц памяти, поэтому память почти не растёт с числом
+# рабочих. gc.freeze() перед fork убирает загруженные объекты из-под сборщика
+# мусора, чтобы он не трогал их страницы и не вызывал копирование.
+#
+# Запуск из папки над репозиторием:
+#   python information-search/project/serve.py --workers 4 --port 8000
+# --server gunicorn использует gunicorn с preload_app (если он установлен),
+# --server prefork — встроенный вариант на werkzeug без внешних зависимостей.
+
+def preload():
+    from app import app
+    from vector_search import get_index, get_result_store
+    get_index()
+    get_result_store()
+    app.jinja_env.get_template('index.html')
+    gc.collect()
+    gc.freeze()
+    return app
+
+def serve_gunicorn(app, args):
+    from gunicorn.app.base import BaseApplication
+
+    class PreloadedApplication(BaseApplication):
+
+        def load_config(self):
+            self.cfg.set('bind', f"{args.host}:{args.port}")
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('timeout', 60)
+
+        def load(self):
+            return app
+
+    PreloadedApplication().run()
+
+def serve_prefork(app, args):
+    from werkzeug.serving import make_server
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(1024)
+    listener.set_inheritable(True)
+
+    workers = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            server = make_server(args.host, args.port, app, threaded=args.threads > 1, fd=listener.fileno())
+            server.serve_forever()
+            os._exit(0)
+        workers.append(pid)
+    print(f"Слушаем http://{args.host}:{args.port}/, рабочих процессов: {len(workers)} ({workers})", flush=True)
+
+    def stop(signum, frame):
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in workers:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Запуск веб-поиска в несколько процессов")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=1, help="потоков в каждом рабочем процессе")
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'prefork'), default='auto')
+    parser.add_argument('--reload-interval', type=float, default=30.0,
+                        help="как часто рабочие проверяют файлы индекса, с (0 — не проверять)")
+    args = parser.parse_args()
+
+    os.environ.setdefault('SEARCH_RELOAD_INTERVAL', str(args.reload_interval))
+    server = args.server
+    if server == 'auto':
+        try:
+            import gunicorn
+            server = 'gunicorn'
+        except ImportError:
+            server = 'prefork'
+    app = preload()
+    print(f"Индекс загружен в процессе {os.getpid()}, сервер: {server}", flush=True)
+    if server == 'gunicorn':
+        serve_gunicorn(app, args)
+    else:
+        serve_prefork(app, args)
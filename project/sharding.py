@@ -0,0 +1,393 @@
+import argparse
+import atexit
+import concurrent.futures
+import heapq
+import itertools
+import json
+import os
+import random
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+from binary_index import BinaryInvertedIndex, resolve_index_path, write_binary_index
+from boolean_query import QueryPlanner, node_from_json, node_to_json, parse_query
+from metrics import metrics
+from positional_index import (
+    POSITIONAL_INDEX_PATH, encode_positional_index, open_positional_index, write_positional_index,
+)
+from search_index import (
+    INDEX_PATH, TFIDF_PATH, SearchIndex, load_tfidf_matrix,
+    open_inverted_index,
+)
+from tfidf_matrix import TFIDF_MATRIX_PATH, TfidfMatrix, write_tfidf_matrix
+
+# Шардированный индекс: документы делятся на N шардов по doc_id % N, у
+# каждого шарда свой инвертированный индекс и своя матрица TF-IDF. Веса в
+# матрицах посчитаны по общему IDF (шарды режутся из готовой матрицы task_4),
+# поэтому косинус документа в шарде тот же, что и в общем индексе.
+# Координатор рассылает запрос всем шардам и сливает ответы:
+#   векторный поиск  каждый шард возвращает свой top-k, k лучших из
+#                    объединения — точный общий top-k (порядок при равных
+#                    оценках — по doc id, как в SearchIndex)
+#   булев поиск      AND/OR/NOT вычисляются по каждому документу отдельно,
+#                    поэтому ответ — объединение ответов шардов; NOT в шарде
+#                    дополняет только до документов этого шарда
+# Позиционный индекс (фразы и NEAR) режется так же, если он построен.
+# Шарды работают в отдельных процессах: transport='process' — пул процессов
+# на этой машине, 'socket' — процессы `sharding.py serve`, к которым
+# координатор ходит по TCP (строки JSON); их можно запустить самому и
+# передать адреса. 'inline' — все шарды в текущем процессе (для проверки).
+#   python information-search/project/sharding.py build --shards 4
+#   python information-search/project/sharding.py check --transport socket
+#   python information-search/project/sharding.py serve --shard 0 --port 9100
+
+SHARDS_PATH = 'information-search/shards'
+MANIFEST_NAME = 'manifest.json'
+
+def shard_directory(directory, shard_id):
+    return os.path.join(directory, f'shard_{shard_id}')
+
+def read_manifest(directory=SHARDS_PATH):
+    with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# Матрица читается так же, как в SearchIndex.load: тот же порядок терминов
+# даёт тот же порядок сложения в косинусе, и оценки совпадают до бита
+def load_tfidf(matrix_path=TFIDF_MATRIX_PATH, tfidf_path=TFIDF_PATH):
+    if os.path.exists(matrix_path):
+        tfidf = TfidfMatrix(matrix_path, 'tokens')
+        return tfidf.terms, np.asarray(tfidf.doc_ids), tfidf.matrix, tfidf.idf
+    vocab, matrix, idf = load_tfidf_matrix(tfidf_path)
+    return list(vocab), np.arange(matrix.shape[0], dtype=np.int64), matrix, idf
+
+def split_positional_index(positional, num_shards):
+    shards = [{} for _ in range(num_shards)]
+    for term, (doc_ids, counts, positions) in positional.items():
+        owners = doc_ids % num_shards
+        position_owners = np.repeat(owners, counts)
+        for shard_id in np.unique(owners):
+            docs = owners == shard_id
+            shards[shard_id][term] = (doc_ids[docs], counts[docs], positions[position_owners == shard_id])
+    return shards
+
+def build_shards(num_shards, directory=SHARDS_PATH, matrix_path=TFIDF_MATRIX_PATH, index_path=INDEX_PATH,
+                 positional_path=POSITIONAL_INDEX_PATH):
+    terms, doc_ids, matrix, idf = load_tfidf(matrix_path)
+    num_docs = int(doc_ids.max()) + 1 if len(doc_ids) else 0
+
+    postings = [{} for _ in range(num_shards)]
+    for term, docs in open_inverted_index(resolve_index_path(index_path)).items():
+        docs = np.asarray(docs, dtype=np.int64)
+        owners = docs % num_shards
+        for shard_id in np.unique(owners):
+            postings[shard_id][term] = docs[owners == shard_id].tolist()
+    positional = open_positional_index(positional_path)
+    positional_shards = split_positional_index(positional, num_shards) if positional is not None else None
+
+    for shard_id in range(num_shards):
+        path = shard_directory(directory, shard_id)
+        os.makedirs(path, exist_ok=True)
+        rows = np.flatnonzero(doc_ids % num_shards == shard_id)
+        write_tfidf_matrix({'tokens': (terms, doc_ids[rows], matrix[rows], idf)}, os.path.join(path, 'tfidf.bin'))
+        write_binary_index(postings[shard_id], os.path.join(path, 'inverted_index.bin'))
+        positional_file = os.path.join(path, 'positional_index.bin')
+        if positional_shards is not None:
+            write_positional_index(encode_positional_index(positional_shards[shard_id], num_docs), positional_file)
+        elif os.path.exists(positional_file):
+            os.remove(positional_file)
+
+    # Манифест пишется последним: шарды с прежним числом частей до этого момента
+    # продолжают читаться по старому манифесту
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'shards': num_shards, 'num_docs': num_docs, 'docs': len(doc_ids)}, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return len(doc_ids)
+
+class Shard:
+    # Векторный индекс по строкам шарда и булев планировщик по его спискам
+
+    def __init__(self, directory, shard_id):
+        self.directory = directory
+        self.shard_id = shard_id
+        path = shard_directory(directory, shard_id)
+        self.index_path = os.path.join(path, 'inverted_index.bin')
+        self.positional_path = os.path.join(path, 'positional_index.bin')
+        self.index = SearchIndex(tfidf_path=path, index_path=self.index_path,
+                                 matrix_path=os.path.join(path, 'tfidf.bin'))
+        self.open_planner()
+
+    def open_planner(self):
+        manifest = read_manifest(self.directory)
+        all_docs = np.arange(self.shard_id, manifest['num_docs'], manifest['shards'], dtype=np.int64)
+        self.planner = QueryPlanner(BinaryInvertedIndex(self.index_path), len(all_docs), all_docs,
+                                    positions=open_positional_index(self.positional_path))
+
+    def reload(self, force=False):
+        reloaded = self.index.reload(force=force)
+        if reloaded:
+            self.open_planner()
+        return reloaded
+
+    def handle(self, request):
+        op = request['op']
+        if op == 'search':
+            return self.index.search(request['tokens'], request['top_n'])
+        if op == 'candidates':
+            return sorted(self.index.candidates(request['tokens']))
+        if op == 'boolean':
+            return self.planner.evaluate(node_from_json(request['query'])).tolist()
+        if op == 'reload':
+            return self.reload(request.get('force', False))
+        raise ValueError(f"неизвестная операция '{op}'")
+
+class InlineTransport:
+
+    def __init__(self, directory, num_shards):
+        self.shards = [Shard(directory, shard_id) for shard_id in range(num_shards)]
+
+    def scatter(self, request):
+        return [shard.handle(request) for shard in self.shards]
+
+    def close(self):
+        pass
+
+# Шард в процессе пула: один процесс на шард, шард загружается при его старте
+_worker_shard = None
+
+def _init_worker(directory, shard_id):
+    global _worker_shard
+    _worker_shard = Shard(directory, shard_id)
+
+def _worker_handle(request):
+    return _worker_shard.handle(request)
+
+class ProcessTransport:
+    # Процессы запускаются при первом запросе, поэтому координатор можно
+    # создать до fork (serve.py): у каждого рабочего будут свои шарды
+
+    def __init__(self, directory, num_shards):
+        self.executors = [
+            concurrent.futures.ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                                   initargs=(directory, shard_id))
+            for shard_id in range(num_shards)
+        ]
+
+    def scatter(self, request):
+        futures = [executor.submit(_worker_handle, request) for executor in self.executors]
+        return [future.result() for future in futures]
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown(cancel_futures=True)
+
+class SocketTransport:
+    # Запрос уходит во все соединения сразу, затем читаются ответы, так что
+    # шарды считают параллельно. Соединения свои у каждого потока.
+
+    def __init__(self, directory, num_shards, addresses=None):
+        self.processes = []
+        if addresses is None:
+            addresses = [self.spawn(directory, shard_id) for shard_id in range(num_shards)]
+        self.addresses = addresses
+        self._local = threading.local()
+        self._sockets = []
+        self._lock = threading.Lock()
+
+    def spawn(self, directory, shard_id):
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), 'serve', '--directory', os.path.abspath(directory),
+             '--shard', str(shard_id), '--port', '0'],
+            stdout=subprocess.PIPE, text=True)
+        self.processes.append(process)
+        line = process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"шард {shard_id} не запустился")
+        host, port = line.split()
+        return host, int(port)
+
+    def connections(self):
+        files = getattr(self._local, 'files', None)
+        if files is None:
+            files = []
+            for address in self.addresses:
+                sock = socket.create_connection(address)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with self._lock:
+                    self._sockets.append(sock)
+                files.append(sock.makefile('rwb'))
+            self._local.files = files
+        return files
+
+    def scatter(self, request):
+        line = (json.dumps(request) + '\n').encode('utf-8')
+        files = self.connections()
+        for f in files:
+            f.write(line)
+            f.flush()
+        responses = [json.loads(f.readline()) for f in files]
+        for response in responses:
+            if 'error' in response:
+                raise RuntimeError(f"ошибка шарда: {response['error']}")
+        return [response['result'] for response in responses]
+
+    def close(self):
+        with self._lock:
+            for sock in self._sockets:
+                sock.close()
+            self._sockets.clear()
+        for process in self.processes:
+            process.terminate()
+            process.wait()
+        self.processes.clear()
+
+class ShardRequestHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = {'result': self.server.shard.handle(json.loads(line))}
+            except Exception as e:
+                response = {'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+class ShardServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def serve(directory, shard_id, host='127.0.0.1', port=0):
+    shard = Shard(directory, shard_id)
+    with ShardServer((host, port), ShardRequestHandler) as server:
+        server.shard = shard
+        # Первая строка вывода — адрес, по ней координатор узнаёт порт
+        print(f"{server.server_address[0]} {server.server_address[1]}", flush=True)
+        server.serve_forever()
+
+TRANSPORTS = {'inline': InlineTransport, 'process': ProcessTransport, 'socket': SocketTransport}
+
+class ShardedSearch:
+    # Координатор с тем же интерфейсом, что у SearchIndex: search, candidates,
+    # reload, version, num_docs; плюс boolean_search для булевых запросов
+
+    def __init__(self, directory=SHARDS_PATH, transport='process', addresses=None):
+        manifest = read_manifest(directory)
+        self.directory = directory
+        self.num_shards = manifest['shards']
+        self.num_docs = manifest['num_docs']
+        self.version = 1
+        if transport not in TRANSPORTS:
+            raise ValueError(f"transport должен быть одним из: {', '.join(TRANSPORTS)}")
+        if transport == 'socket':
+            self.transport = SocketTransport(directory, self.num_shards, addresses)
+        else:
+            self.transport = TRANSPORTS[transport](directory, self.num_shards)
+        atexit.register(self.close)
+
+    def search(self, query_tokens, top_n=10):
+        metrics.inc('search_queries_total', engine='sharded')
+        if top_n <= 0:
+            return []
+        with metrics.stage('scatter'):
+            parts = self.transport.scatter({'op': 'search', 'tokens': list(query_tokens), 'top_n': top_n})
+        with metrics.stage('merge'):
+            merged = heapq.merge(*parts, key=lambda item: (-item[1], item[0]))
+            return [(int(doc_id), float(score)) for doc_id, score in itertools.islice(merged, top_n)]
+
+    def candidates(self, query_tokens):
+        parts = self.transport.scatter({'op': 'candidates', 'tokens': list(query_tokens)})
+        return set(itertools.chain.from_iterable(parts))
+
+    def boolean_search(self, query, normalize=None, normalize_phrase=None):
+        node = parse_query(query, normalize, normalize_phrase)
+        with metrics.stage('scatter'):
+            parts = self.transport.scatter({'op': 'boolean', 'query': node_to_json(node)})
+        return set(itertools.chain.from_iterable(parts))
+
+    def reload(self, force=False):
+        reloaded = any(self.transport.scatter({'op': 'reload', 'force': force}))
+        if reloaded:
+            self.num_docs = read_manifest(self.directory)['num_docs']
+            self.version += 1
+        return reloaded
+
+    def close(self):
+        self.transport.close()
+
+def random_boolean_query(rng, terms, positional=False):
+    a, b, c = rng.sample(terms, 3)
+    choices = [f"{a} AND {b}", f"{a} OR {b}", f"{a} AND NOT {b}", f"NOT {a}",
+               f"({a} OR {b}) AND NOT {c}", f"NOT {a} OR {b}", f"{a} OR NOT ({b} AND {c})",
+               f"{a[:3]}* AND NOT {b}", f"{a[:2]}?{a[3:]}* OR {c}"]
+    if positional:
+        choices += [f'"{a} {b}"', f"{a} NEAR/10 {b}", f'"{a} {b}" OR {c} NEAR/3 {a}']
+    return rng.choice(choices)
+
+# Сравнение с общим индексом: результаты должны совпадать в точности
+def check(directory, transport, num_queries, top_n=10, seed=0):
+    reference = SearchIndex()
+    postings = open_inverted_index(resolve_index_path(INDEX_PATH))
+    postings = {term: np.asarray(docs, dtype=np.int64) for term, docs in postings.items()}
+    positional = open_positional_index()
+    planner = QueryPlanner(postings, reference.num_docs, positions=positional)
+    sharded = ShardedSearch(directory, transport)
+    rng = random.Random(seed)
+    terms = sorted(postings)
+    vector_queries = [rng.sample(terms, rng.randint(1, 3)) for _ in range(num_queries)]
+    boolean_queries = [random_boolean_query(rng, terms, positional is not None) for _ in range(num_queries)]
+    try:
+        for name, queries, expected_fn, actual_fn in (
+                ('векторный', vector_queries,
+                 lambda q: reference.search(q, top_n), lambda q: sharded.search(q, top_n)),
+                ('булев', boolean_queries,
+                 lambda q: set(planner.evaluate(parse_query(q)).tolist()), sharded.boolean_search)):
+            mismatches = 0
+            timings = {'общий': 0.0, 'шарды': 0.0}
+            for query in queries:
+                start = time.perf_counter()
+                expected = expected_fn(query)
+                timings['общий'] += time.perf_counter() - start
+                start = time.perf_counter()
+                actual = actual_fn(query)
+                timings['шарды'] += time.perf_counter() - start
+                if actual != expected:
+                    mismatches += 1
+                    if mismatches <= 3:
+                        print(f"  расхождение: {query}")
+            times = ', '.join(f"{key} {value / len(queries) * 1000:.3f} мс" for key, value in timings.items())
+            print(f"{name}: {len(queries)} запросов, расхождений {mismatches}; {times}")
+    finally:
+        sharded.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Шардированный индекс")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="разрезать индекс task_3/task_4 на шарды")
+    build_parser.add_argument('--shards', type=int, default=4)
+    build_parser.add_argument('--directory', default=SHARDS_PATH)
+    serve_parser = subparsers.add_parser('serve', help="процесс одного шарда (TCP, строки JSON)")
+    serve_parser.add_argument('--shard', type=int, required=True)
+    serve_parser.add_argument('--directory', default=SHARDS_PATH)
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=0)
+    check_parser = subparsers.add_parser('check', help="сравнить с общим индексом")
+    check_parser.add_argument('--directory', default=SHARDS_PATH)
+    check_parser.add_argument('--transport', choices=sorted(TRANSPORTS), default='process')
+    check_parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        docs = build_shards(args.shards, args.directory)
+        print(f"Документов: {docs}, шардов: {args.shards}, за {time.perf_counter() - start:.2f} с -> {args.directory}")
+    elif args.command == 'serve':
+        serve(args.directory, args.shard, args.host, args.port)
+    else:
+        check(args.directory, args.transport, args.queries)
+
+if __name__ == '__main__':
+    main()
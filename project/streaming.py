@@ -0,0 +1,171 @@
+import os
+import queue
+import threading
+import time
+from bs4 import BeautifulSoup
+
+# Потоковая индексация: страница проходит стадии
+#   extract   (разбор HTML, токенизация) ->
+#   lemmatize (леммы через кэш, файлы tokens/lemmas task_2) ->
+#   index     (пакет документов -> новый сегмент SegmentedIndex)
+# Между стадиями ограниченные очереди: если индексация не успевает,
+# submit() блокируется и обход притормаживает, а не копит страницы в памяти.
+# Индексатор коммитит пакет, когда набралось batch_size страниц или прошло
+# flush_seconds с первой страницы пакета, так что новая страница становится
+# доступной для поиска через секунды после скачивания: SearchIndex с
+# segments_path (веб-приложение, task_5) и BooleanSearchEngine.from_segments
+# (task_3) перечитывают сегменты при reload()/refresh(); приложение делает это
+# раз в SEARCH_RELOAD_INTERVAL секунд.
+
+STOP = object()
+
+class StreamingIndexer:
+
+    # tokenize_positions (текст -> [(позиция, термин)]) — позиции слов для
+    # фраз и NEAR; без неё сегменты пишутся без позиционного индекса
+    def __init__(self, index, tokenize, lemma_cache=None, tokens_path=None, lemmas_path=None,
+                 queue_size=64, batch_size=32, flush_seconds=2.0, tokenize_positions=None):
+        self.index = index
+        self.tokenize = tokenize
+        self.tokenize_positions = tokenize_positions
+        self.lemma_cache = lemma_cache
+        self.tokens_path = tokens_path
+        self.lemmas_path = lemmas_path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.extract_queue = queue.Queue(maxsize=queue_size)
+        self.lemmatize_queue = queue.Queue(maxsize=queue_size)
+        self.index_queue = queue.Queue(maxsize=queue_size)
+        self.stats = {'submitted': 0, 'unchanged': 0, 'indexed': 0, 'commits': 0, 'errors': 0,
+                      'blocked_seconds': 0.0, 'latency_total': 0.0, 'latency_max': 0.0}
+        self.stats_lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self.run_stage, args=(self.extract_queue, self.lemmatize_queue, self.extract),
+                             name='extract', daemon=True),
+            threading.Thread(target=self.run_stage, args=(self.lemmatize_queue, self.index_queue, self.lemmatize),
+                             name='lemmatize', daemon=True),
+            threading.Thread(target=self.run_index, name='index', daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    # Блокируется, пока в первой очереди нет места
+    def submit(self, doc_id, content, content_hash):
+        start = time.perf_counter()
+        self.extract_queue.put({'doc_id': doc_id, 'content': content, 'hash': content_hash,
+                                'submitted_at': time.time()})
+        with self.stats_lock:
+            self.stats['submitted'] += 1
+            self.stats['blocked_seconds'] += time.perf_counter() - start
+
+    def close(self):
+        self.extract_queue.put(STOP)
+        for thread in self.threads:
+            thread.join()
+        if self.lemma_cache is not None:
+            self.lemma_cache.save()
+
+    def count(self, key, value=1):
+        with self.stats_lock:
+            self.stats[key] += value
+
+    def run_stage(self, source, target, handler):
+        while True:
+            document = source.get()
+            if document is STOP:
+                target.put(STOP)
+                return
+            try:
+                document = handler(document)
+            except Exception as error:
+                self.count('errors')
+                print(f"Ошибка обработки страницы {document['doc_id']}: {error}")
+                continue
+            if document is not None:
+                target.put(document)
+
+    def extract(self, document):
+        if self.index.content_hash(document['doc_id']) == document['hash']:
+            self.count('unchanged')
+            return None
+        soup = BeautifulSoup(document.pop('content').decode('utf-8'), 'html.parser')
+        text = soup.get_text(separator=' ', strip=True)
+        if self.tokenize_positions is None:
+            document['tokens'] = sorted(self.tokenize(text))
+        else:
+            document['positions'] = self.tokenize_positions(text)
+            document['tokens'] = sorted({token for _, token in document['positions']})
+        return document
+
+    def lemmatize(self, document):
+        if self.lemma_cache is None:
+            return document
+        tokens = document['tokens']
+        token_lemmas = self.lemma_cache.lemmatize_batch(tokens)
+        if self.tokens_path and self.lemmas_path:
+            write_outputs(document['doc_id'], tokens, token_lemmas, self.tokens_path, self.lemmas_path)
+        return document
+
+    def run_index(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                document = self.index_queue.get(timeout=timeout)
+            except queue.Empty:
+                document = None
+            if document is STOP:
+                self.commit(batch)
+                return
+            if document is not None:
+                batch.append(document)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_seconds
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self.commit(batch)
+                batch = []
+                deadline = None
+
+    def commit(self, batch):
+        if not batch:
+            return
+        # Одна страница могла прийти дважды за пакет: берём последнюю версию
+        latest = {document['doc_id']: document for document in batch}
+        try:
+            self.index.add_documents([(d['doc_id'], d['tokens'], d['hash'], d.get('positions'))
+                                      for d in latest.values()])
+        except Exception as error:
+            self.count('errors', len(latest))
+            print(f"Ошибка записи сегмента: {error}")
+            return
+        self.index.merge_in_background()
+        now = time.time()
+        latencies = [now - d['submitted_at'] for d in latest.values()]
+        with self.stats_lock:
+            self.stats['indexed'] += len(latest)
+            self.stats['commits'] += 1
+            self.stats['latency_total'] += sum(latencies)
+            self.stats['latency_max'] = max(self.stats['latency_max'], max(latencies))
+
+    def report(self):
+        stats = dict(self.stats)
+        average = stats['latency_total'] / stats['indexed'] if stats['indexed'] else 0.0
+        print(f"Потоковая индексация: принято {stats['submitted']}, проиндексировано {stats['indexed']} "
+              f"({stats['commits']} сегментов), без изменений {stats['unchanged']}, ошибок {stats['errors']}")
+        print(f"  от скачивания до поиска: в среднем {average:.2f} с, максимум {stats['latency_max']:.2f} с; "
+              f"ожидание места в очереди {stats['blocked_seconds']:.2f} с")
+
+def write_outputs(doc_id, tokens, token_lemmas, tokens_path, lemmas_path):
+    # Тот же формат, что у task_2/process_pages.py
+    lemmas = {}
+    for token in tokens:
+        lemmas.setdefault(token_lemmas[token], set()).add(token)
+    os.makedirs(os.path.dirname(tokens_path) or '.', exist_ok=True)
+    os.makedirs(os.path.dirname(lemmas_path) or '.', exist_ok=True)
+    with open(f"{tokens_path}_{doc_id}.txt", "w", encoding="utf-8") as f:
+        for token in tokens:
+            f.write(f"{token}\n")
+    with open(f"{lemmas_path}_{doc_id}.txt", "w", encoding="utf-8") as f:
+        for lemma, words in sorted(lemmas.items()):
+            f.write(f"{lemma}: {' '.join(sorted(words))}\n")
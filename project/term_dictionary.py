@@ -0,0 +1,366 @@
+import bisect
+import re
+import sys
+import time
+import tracemalloc
+import numpy as np
+from binary_index import decode_varint, encode_varint
+from metrics import metrics
+
+# Сжатый словарь терминов вместо dict {строка: id}:
+#   термины отсортированы по байтам UTF-8 и разбиты на блоки по BLOCK_SIZE;
+#   первый термин блока хранится целиком (длина varint + байты), остальные —
+#   длиной общего префикса с предыдущим и остатком (front coding).
+# Номер термина в сортировке — его id в словаре; ids (если задан) переводит
+# его в id столбца матрицы. Поиск — бинарный по первым терминам блоков и
+# проход по одному блоку; в памяти держатся только первые термины блоков
+# (каждый BLOCK_SIZE-й), они декодируются при первом поиске.
+# Шаблоны в запросах: * — любая последовательность символов, ? — один символ.
+# Кандидаты берутся из диапазона терминов с префиксом до первого * или ?.
+
+BLOCK_SIZE = 16
+WILDCARDS = '*?'
+# Сколько терминов подставляется вместо шаблона в векторном поиске
+MAX_EXPANSIONS = 64
+# Слово запроса: буквы и *, ? внутри слова; ? в конце — знак вопроса, а не шаблон
+QUERY_TOKEN = re.compile(r'[\w*]+(?:\?+[\w*]+)*')
+
+def common_prefix_length(left, right):
+    limit = min(len(left), len(right))
+    length = 0
+    while length < limit and left[length] == right[length]:
+        length += 1
+    return length
+
+def encode_terms(terms):
+    # terms — по возрастанию байтов UTF-8; возвращает блоки и смещения блоков
+    blob = bytearray()
+    offsets = []
+    previous = b''
+    for i, term in enumerate(terms):
+        encoded = term.encode('utf-8')
+        if i % BLOCK_SIZE == 0:
+            offsets.append(len(blob))
+            encode_varint(len(encoded), blob)
+            blob += encoded
+        else:
+            shared = common_prefix_length(previous, encoded)
+            encode_varint(shared, blob)
+            encode_varint(len(encoded) - shared, blob)
+            blob += encoded[shared:]
+        previous = encoded
+    return bytes(blob), np.array(offsets, dtype=np.int64)
+
+class TermDictionary:
+    # Словарь термин -> id с интерфейсом dict (get, in, [], items)
+
+    def __init__(self, blob, block_offsets, count, ids=None):
+        self.blob = blob
+        self.block_offsets = block_offsets
+        self.count = count
+        self.ids = ids
+        self._firsts = None
+
+    @classmethod
+    def from_terms(cls, terms):
+        # terms по порядку id; если они не отсортированы, ids хранит исходные id
+        terms = list(terms)
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        ids = None if all(i == rank for rank, i in enumerate(order)) else np.array(order, dtype=np.int64)
+        blob, offsets = encode_terms([terms[i] for i in order])
+        return cls(blob, offsets, len(terms), ids)
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        # {термин: id}, например словарь, собранный при чтении текстовых файлов
+        items = sorted(mapping.items())
+        blob, offsets = encode_terms([term for term, _ in items])
+        ids = np.array([term_id for _, term_id in items], dtype=np.int64)
+        if np.array_equal(ids, np.arange(len(ids))):
+            ids = None
+        return cls(blob, offsets, len(items), ids)
+
+    @property
+    def nbytes(self):
+        return len(self.blob) + self.block_offsets.nbytes + (0 if self.ids is None else self.ids.nbytes)
+
+    @property
+    def firsts(self):
+        if self._firsts is None:
+            firsts = []
+            for offset in self.block_offsets.tolist():
+                length, position = decode_varint(self.blob, offset)
+                firsts.append(self.blob[position:position + length])
+            self._firsts = firsts
+        return self._firsts
+
+    def _block(self, block, key=None):
+        # Термины блока; с key — только до первого, не меньшего key
+        blob = self.blob
+        position = int(self.block_offsets[block])
+        end = int(self.block_offsets[block + 1]) if block + 1 < len(self.block_offsets) else len(blob)
+        length, position = decode_varint(blob, position)
+        term = blob[position:position + length]
+        position += length
+        terms = [term]
+        while position < end and (key is None or term < key):
+            # Длины почти всегда меньше 128 и занимают один байт
+            shared = blob[position]
+            if shared < 0x80:
+                position += 1
+            else:
+                shared, position = decode_varint(blob, position)
+            length = blob[position]
+            if length < 0x80:
+                position += 1
+            else:
+                length, position = decode_varint(blob, position)
+            term = term[:shared] + blob[position:position + length]
+            position += length
+            terms.append(term)
+        return terms
+
+    def _locate(self, key):
+        # Блок, где должен быть key, его термины до key и место key в блоке
+        block = bisect.bisect_right(self.firsts, key) - 1
+        if block < 0:
+            return 0, [], 0
+        terms = self._block(block, key)
+        return block, terms, bisect.bisect_left(terms, key)
+
+    def rank(self, key):
+        # Номер первого термина, не меньшего key (bytes)
+        block, _, index = self._locate(key)
+        return block * BLOCK_SIZE + index
+
+    def find(self, term):
+        # Номер термина в сортировке или None
+        key = term.encode('utf-8')
+        block, terms, index = self._locate(key)
+        if index < len(terms) and terms[index] == key:
+            return block * BLOCK_SIZE + index
+        return None
+
+    def id_at(self, rank):
+        return rank if self.ids is None else int(self.ids[rank])
+
+    def get(self, term, default=None):
+        rank = self.find(term)
+        return default if rank is None else self.id_at(rank)
+
+    def __getitem__(self, term):
+        rank = self.find(term)
+        if rank is None:
+            raise KeyError(term)
+        return self.id_at(rank)
+
+    def __contains__(self, term):
+        return self.find(term) is not None
+
+    def __len__(self):
+        return self.count
+
+    def term_at(self, rank):
+        return self._block(rank // BLOCK_SIZE)[rank % BLOCK_SIZE].decode('utf-8')
+
+    def terms_in_range(self, low, high):
+        # Термины с номерами [low, high) по порядку; каждый блок декодируется один раз
+        for block in range(low // BLOCK_SIZE, (high + BLOCK_SIZE - 1) // BLOCK_SIZE):
+            start = block * BLOCK_SIZE
+            for term in self._block(block)[max(low - start, 0):high - start]:
+                yield term.decode('utf-8')
+
+    def prefix_range(self, prefix):
+        # Термины с префиксом занимают непрерывный диапазон номеров; байта 0xFF
+        # в UTF-8 не бывает, поэтому prefix + 0xFF больше любого из них
+        key = prefix.encode('utf-8')
+        return self.rank(key), self.rank(key + b'\xff')
+
+    def __iter__(self):
+        return self.terms_in_range(0, self.count)
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        for rank, term in enumerate(self):
+            yield term, self.id_at(rank)
+
+# Словарь внутри бинарного файла (tfidf.bin, analyzer.bin): append(bytes)
+# дописывает массив с выравниванием и возвращает его смещение
+def write_dictionary(dictionary, append):
+    return {
+        'count': len(dictionary),
+        'blob_offset': append(dictionary.blob), 'blob_length': len(dictionary.blob),
+        'blocks_offset': append(dictionary.block_offsets.tobytes()), 'blocks': len(dictionary.block_offsets),
+        'ids_offset': None if dictionary.ids is None else append(dictionary.ids.tobytes()),
+    }
+
+def read_dictionary(buffer, entry):
+    # Смещения блоков и id читаются из buffer (mmap) без копирования
+    start = entry['blob_offset']
+    ids = entry['ids_offset']
+    return TermDictionary(
+        buffer[start:start + entry['blob_length']],
+        np.frombuffer(buffer, dtype=np.int64, count=entry['blocks'], offset=entry['blocks_offset']),
+        entry['count'],
+        None if ids is None else np.frombuffer(buffer, dtype=np.int64, count=entry['count'], offset=ids))
+
+class TermPostings:
+    # Списки doc id по терминам: один массив на все списки, границы по номеру
+    # термина в словаре. Заменяет dict {термин: np.array} текстового индекса.
+
+    def __init__(self, dictionary, offsets, docs):
+        self.dictionary = dictionary
+        self.offsets = offsets
+        self.docs = docs
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        # {термин: отсортированные doc id}. Doc id хранятся в int32 (4 байта
+        # на элемент), пока помещаются в него
+        items = sorted(mapping.items())
+        blob, block_offsets = encode_terms([term for term, _ in items])
+        lengths = [len(docs) for _, docs in items]
+        offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+        docs = np.concatenate([np.asarray(docs, dtype=np.int64) for _, docs in items]) if items \
+            else np.zeros(0, dtype=np.int64)
+        if len(docs) == 0 or (docs.min() >= 0 and docs.max() <= np.iinfo(np.int32).max):
+            docs = docs.astype(np.int32)
+        return cls(TermDictionary(blob, block_offsets, len(items)), offsets, docs)
+
+    @property
+    def nbytes(self):
+        return self.dictionary.nbytes + self.offsets.nbytes + self.docs.nbytes
+
+    def _postings_at(self, rank):
+        return self.docs[self.offsets[rank]:self.offsets[rank + 1]]
+
+    def get(self, term, default=None):
+        rank = self.dictionary.find(term)
+        return default if rank is None else self._postings_at(rank)
+
+    def __getitem__(self, term):
+        rank = self.dictionary.find(term)
+        if rank is None:
+            raise KeyError(term)
+        return self._postings_at(rank)
+
+    def __contains__(self, term):
+        return term in self.dictionary
+
+    def __len__(self):
+        return len(self.dictionary)
+
+    def __iter__(self):
+        return iter(self.dictionary)
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        for rank, term in enumerate(self.dictionary):
+            yield term, self._postings_at(rank)
+
+    def prefix_range(self, prefix):
+        return self.dictionary.prefix_range(prefix)
+
+    def terms_in_range(self, low, high):
+        return self.dictionary.terms_in_range(low, high)
+
+def split_query(text):
+    return QUERY_TOKEN.findall(text.lower())
+
+def is_pattern(token):
+    return any(char in token for char in WILDCARDS)
+
+def pattern_regex(pattern):
+    return re.compile(''.join('.*' if char == '*' else '.' if char == '?' else re.escape(char)
+                              for char in pattern), re.DOTALL)
+
+def expand_pattern(dictionary, pattern, limit=None):
+    # Термины словаря, подходящие под шаблон, в порядке сортировки.
+    # dictionary — всё, у чего есть prefix_range и terms_in_range
+    # (TermDictionary, TermPostings, BinaryInvertedIndex).
+    # Шаблон без единой буквы ("*") ничего не находит, а не весь словарь.
+    if not pattern.strip(WILDCARDS):
+        return []
+    literal = re.split(r'[*?]', pattern, maxsplit=1)[0]
+    low, high = dictionary.prefix_range(literal)
+    # "learn*" — подходит весь диапазон, регулярное выражение не нужно
+    matcher = None if pattern == literal + '*' else pattern_regex(pattern)
+    terms = []
+    for term in dictionary.terms_in_range(low, high):
+        if matcher is None or matcher.fullmatch(term):
+            terms.append(term)
+            if limit is not None and len(terms) >= limit:
+                break
+    metrics.inc('search_wildcard_terms_total', len(terms))
+    return terms
+
+def expand_tokens(tokens, dictionary, limit=MAX_EXPANSIONS):
+    # Шаблоны в токенах запроса заменяются подходящими терминами
+    if not any(is_pattern(token) for token in tokens):
+        return tokens
+    expanded = []
+    for token in tokens:
+        if is_pattern(token):
+            expanded.extend(expand_pattern(dictionary, token, limit))
+        else:
+            expanded.append(token)
+    return expanded
+
+def traced_bytes(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current
+
+def report(path=None):
+    # Память и скорость словаря против dict на терминах индекса task_3
+    from search_index import open_inverted_index, INDEX_PATH
+    index = open_inverted_index(path or INDEX_PATH)
+    terms = list(index.keys())
+    postings = {term: np.asarray(docs, dtype=np.int64) for term, docs in index.items()}
+    del index
+
+    # Строки копируются заново, чтобы в замер dict попали и они
+    vocab, dict_bytes = traced_bytes(lambda: {term.encode('utf-8').decode('utf-8'): i for i, term in enumerate(terms)})
+    def warm(dictionary):
+        # Вместе с первыми терминами блоков, которые появляются при первом поиске
+        dictionary.find(terms[0])
+        return dictionary
+
+    # Прогрев: разовые выделения памяти модулями не должны попасть в замер
+    warm(TermDictionary.from_terms(terms[:BLOCK_SIZE * 2]))
+    dictionary, compact_bytes = traced_bytes(lambda: warm(TermDictionary.from_terms(terms)))
+    print(f"Терминов: {len(terms)}")
+    print(f"Словарь: dict {dict_bytes / 1024:.1f} КБ, сжатый {compact_bytes / 1024:.1f} КБ "
+          f"(x{dict_bytes / max(compact_bytes, 1):.1f})")
+    table, table_bytes = traced_bytes(lambda: {term.encode('utf-8').decode('utf-8'): np.array(docs)
+                                               for term, docs in postings.items()})
+    compact_postings, compact_postings_bytes = traced_bytes(lambda: TermPostings.from_mapping(postings))
+    print(f"Словарь со списками: dict {table_bytes / 1024:.1f} КБ, сжатый {compact_postings_bytes / 1024:.1f} КБ "
+          f"(x{table_bytes / max(compact_postings_bytes, 1):.1f})")
+
+    sample = terms[::max(1, len(terms) // 1000)]
+    for name, lookup in (('dict', vocab.get), ('сжатый', dictionary.get)):
+        start = time.perf_counter()
+        for term in sample:
+            lookup(term)
+        print(f"Поиск ({name}): {(time.perf_counter() - start) / max(len(sample), 1) * 1e6:.2f} мкс на термин")
+
+    prefixes = sorted({term[:3] for term in sample})
+    start = time.perf_counter()
+    expanded = sum(len(expand_pattern(dictionary, prefix + '*')) for prefix in prefixes)
+    elapsed = time.perf_counter() - start
+    print(f"Префиксы: {len(prefixes)} шаблонов, {expanded} терминов, "
+          f"{elapsed / max(len(prefixes), 1) * 1000:.3f} мс на шаблон")
+    brute = sum(sum(1 for term in terms if term.startswith(prefix)) for prefix in prefixes)
+    assert brute == expanded, "расширение префиксов не совпадает с перебором"
+
+if __name__ == '__main__':
+    report(*sys.argv[1:2])
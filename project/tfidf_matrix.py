@@ -0,0 +1,163 @@
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import numpy as np
+from scipy import sparse
+from term_dictionary import TermDictionary, read_dictionary, write_dictionary
+
+# Бинарный файл TF-IDF вместо 2 × N текстовых файлов task_4:
+#   заголовок   MAGIC, версия, смещение оглавления
+#   массивы     на раздел: doc id (int64), IDF (float64), indptr (int64),
+#               indices (int32), data (float64), термины (UTF-8 через '\n'),
+#               сжатый словарь (блоки, смещения блоков int64 и, если термины
+#               не отсортированы, id по порядку сортировки; term_dictionary.py).
+#               Каждый массив выровнен на 8 байт.
+#   оглавление  JSON {имя раздела: {число документов, терминов, ненулевых
+#               и смещения массивов}}; разделы "tokens" и "lemmas"
+# Массивы читаются из mmap без копирования, поэтому загрузка занимает
+# миллисекунды и не зависит от числа документов.
+
+MAGIC = b'TFMX'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIQ')
+
+TFIDF_MATRIX_PATH = 'information-search/task_4/tfidf.bin'
+TFIDF_TEXT_PATH = 'information-search/task_4/tfidf_output'
+
+ARRAYS = (('doc_ids', np.int64), ('idf', np.float64), ('indptr', np.int64),
+          ('indices', np.int32), ('data', np.float64))
+
+def write_tfidf_matrix(sections, path=TFIDF_MATRIX_PATH):
+    # sections: {имя: (термины по порядку id, doc id строк, CSR-матрица, вектор IDF)}
+    tmp_path = path + '.tmp'
+    table = {}
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+
+        def append(blob):
+            offset = f.tell()
+            f.write(blob)
+            f.write(b'\0' * (-len(blob) % 8))
+            return offset
+
+        for name, (terms, doc_ids, matrix, idf) in sections.items():
+            matrix = sparse.csr_matrix(matrix)
+            matrix.sort_indices()
+            arrays = {
+                'doc_ids': np.asarray(doc_ids, dtype=np.int64),
+                'idf': np.asarray(idf, dtype=np.float64),
+                'indptr': matrix.indptr.astype(np.int64),
+                'indices': matrix.indices.astype(np.int32),
+                'data': matrix.data.astype(np.float64),
+            }
+            entry = {'docs': matrix.shape[0], 'terms': len(terms), 'nnz': int(matrix.nnz)}
+            for key, _ in ARRAYS:
+                entry[key] = append(arrays[key].tobytes())
+            encoded = '\n'.join(terms).encode('utf-8')
+            entry['terms_offset'], entry['terms_length'] = append(encoded), len(encoded)
+            entry['dictionary'] = write_dictionary(TermDictionary.from_terms(terms), append)
+            table[name] = entry
+
+        table_offset = append(json.dumps(table).encode('utf-8'))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, table_offset))
+    os.replace(tmp_path, path)
+
+class TfidfMatrix:
+    # Раздел файла: terms, vocab (сжатый словарь термин -> id), doc_ids, matrix (CSR), idf
+
+    def __init__(self, path=TFIDF_MATRIX_PATH, section='tokens'):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, table_offset = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path}: неподдерживаемый формат TF-IDF")
+        table = json.loads(self._mmap[table_offset:].rstrip(b'\0').decode('utf-8'))
+        if section not in table:
+            raise KeyError(f"{path}: нет раздела {section}")
+        entry = table[section]
+        sizes = {'doc_ids': entry['docs'], 'idf': entry['terms'], 'indptr': entry['docs'] + 1,
+                 'indices': entry['nnz'], 'data': entry['nnz']}
+        arrays = {key: np.frombuffer(self._mmap, dtype=dtype, count=sizes[key], offset=entry[key])
+                  for key, dtype in ARRAYS}
+        self._entry = entry
+        if 'dictionary' in entry:
+            self.vocab = read_dictionary(self._mmap, entry['dictionary'])
+        else:
+            # Файл, записанный до появления словаря в формате
+            self.vocab = TermDictionary.from_terms(self.terms)
+        self.doc_ids = arrays['doc_ids']
+        self.idf = arrays['idf']
+        self.matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                        shape=(entry['docs'], entry['terms']), copy=False)
+
+    # Список терминов по порядку id нужен только при переписывании файла
+    # (шарды, LSA), поэтому строки создаются по требованию
+    @property
+    def terms(self):
+        start = self._entry['terms_offset']
+        encoded = self._mmap[start:start + self._entry['terms_length']]
+        return encoded.decode('utf-8').split('\n') if self._entry['terms'] else []
+
+    # Матрица, где номер строки совпадает с doc id (пропущенные id — пустые строки)
+    def rows_by_doc_id(self):
+        doc_ids = self.doc_ids
+        if len(doc_ids) == 0 or np.array_equal(doc_ids, np.arange(len(doc_ids))):
+            return self.matrix
+        num_rows = int(doc_ids.max()) + 1
+        lengths = np.zeros(num_rows, dtype=np.int64)
+        lengths[doc_ids] = np.diff(self.matrix.indptr)
+        order = np.argsort(doc_ids, kind='stable')
+        rows = self.matrix[order]
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        return sparse.csr_matrix((rows.data, rows.indices, indptr), shape=(num_rows, self.matrix.shape[1]))
+
+# Чтение текстового экспорта task_4 (tfidf_doc_N_<kind>.txt) в раздел файла
+def read_text_section(folder, kind):
+    pattern = re.compile(rf'tfidf_doc_(\d+)_{kind}\.txt$')
+    doc_ids = sorted(int(m.group(1)) for m in map(pattern.match, os.listdir(folder)) if m)
+    rows = []
+    idf_values = {}
+    for doc_id in doc_ids:
+        row = {}
+        with open(os.path.join(folder, f'tfidf_doc_{doc_id}_{kind}.txt'), 'r', encoding='utf-8') as f:
+            for line in f:
+                term, idf, tfidf = line.strip().split()
+                row[term] = float(tfidf)
+                idf_values[term] = float(idf)
+        rows.append(row)
+    terms = sorted(idf_values)
+    vocab = {term: i for i, term in enumerate(terms)}
+    indptr = np.cumsum([0] + [len(row) for row in rows])
+    indices = np.array([vocab[term] for row in rows for term in row], dtype=np.int32)
+    data = np.array([value for row in rows for value in row.values()], dtype=np.float64)
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(rows), len(terms)))
+    idf = np.array([idf_values[term] for term in terms])
+    return terms, doc_ids, matrix, idf
+
+def convert(text_path=TFIDF_TEXT_PATH, path=TFIDF_MATRIX_PATH):
+    start = time.perf_counter()
+    sections = {kind: read_text_section(text_path, kind) for kind in ('tokens', 'lemmas')}
+    text_load = time.perf_counter() - start
+    write_tfidf_matrix(sections, path)
+
+    start = time.perf_counter()
+    loaded = TfidfMatrix(path, 'tokens')
+    binary_open = time.perf_counter() - start
+
+    terms, doc_ids, matrix, _ = sections['tokens']
+    assert loaded.terms == terms and loaded.doc_ids.tolist() == doc_ids
+    assert (loaded.matrix != matrix).nnz == 0, "матрицы не совпадают"
+    text_size = sum(os.path.getsize(os.path.join(text_path, name)) for name in os.listdir(text_path))
+    binary_size = os.path.getsize(path)
+    print(f"Документов: {len(doc_ids)}, терминов: {len(terms)}, лемм: {len(sections['lemmas'][0])}")
+    print(f"Размер: текст {text_size / 1024:.1f} КБ, бинарный {binary_size / 1024:.1f} КБ")
+    print(f"Загрузка: текст {text_load * 1000:.1f} мс, бинарный (mmap) {binary_open * 1000:.2f} мс")
+
+if __name__ == '__main__':
+    convert(*sys.argv[1:3])
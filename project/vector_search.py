@@ -1,112 +1,149 @@
 import os
-import numpy as np
-import math
-from bs4 import BeautifulSoup
-from collections import defaultdict
-import re
-
-DOCS_PATH = 'information-search/task_1/pages'
-TFIDF_PATH = 'information-search/task_4/tfidf_output'
-INDEX_PATH = 'information-search/task_3/inverted_index.txt'
-NUM_DOCS = 111
-
-def load_inverted_index():
-    index = defaultdict(list)
-    with open(INDEX_PATH, 'r', encoding='utf-8') as file:
-        for line in file:
-            term, docs_str = line.strip().split(': ')
-            docs = list(map(int, re.findall(r'\d+', docs_str)))
-            index[term] = docs
-    return index
-
-def load_vocab_and_doc_vectors():
-    vocab = {}
-    doc_vectors = []
-    for i in range(NUM_DOCS):
-        vector = {}
-        file_path = os.path.join(TFIDF_PATH, f'tfidf_doc_{i}_tokens.txt')
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                token, idf, tfidf = line.strip().split()
-                vector[token] = float(tfidf)
-                if token not in vocab:
-                    vocab[token] = len(vocab)
-        doc_vectors.append(vector)
-    return vocab, doc_vectors
-
-def load_idf():
-    idf_values = {}
-    for i in range(NUM_DOCS):
-        file_path = os.path.join(TFIDF_PATH, f'tfidf_doc_{i}_tokens.txt')
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                token, idf, _ = line.strip().split()
-                idf_values[token] = float(idf)
-    return idf_values
-
-def vectorize(tokens, vocab, idf_values):
-    tf = defaultdict(int)
-    for token in tokens:
-        tf[token] += 1
-    total = len(tokens)
-    vec = np.zeros(len(vocab))
-    for token, count in tf.items():
-        if token in vocab and token in idf_values:
-            tfidf = (count / total) * idf_values[token]
-            vec[vocab[token]] = tfidf
-    return vec
-
-def get_document_vector(doc_vec, vocab):
-    vec = np.zeros(len(vocab))
-    for token, tfidf in doc_vec.items():
-        if token in vocab:
-            vec[vocab[token]] = tfidf
-    return vec
-
-def cosine_similarity(vec1, vec2):
-    if np.linalg.norm(vec1) == 0 or np.linalg.norm(vec2) == 0:
-        return 0.0
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
-
-def extract_title_from_html(doc_id):
-    path = os.path.join(DOCS_PATH, f'page_{doc_id}.html')
-    try:
-        with open(path, 'r', encoding='utf-8') as file:
-            soup = BeautifulSoup(file, 'html.parser')
-            title = soup.title.string if soup.title else f"Документ {doc_id}"
-            return title.strip()
-    except Exception as e:
-        print(f"Ошибка при чтении {doc_id}: {e}")
-        return f"Документ {doc_id}"
-
-def search(query_tokens, top_n=10, return_results=False):
-    vocab, doc_vectors = load_vocab_and_doc_vectors()
-    idf_values = load_idf()
-    index = load_inverted_index()
-
-    query_vector = vectorize(query_tokens, vocab, idf_values)
-
-    relevant_docs = set()
-    for token in query_tokens:
-        relevant_docs.update(index.get(token, []))
-
-    scores = []
-    for doc_id in relevant_docs:
-        doc_vector = get_document_vector(doc_vectors[doc_id], vocab)
-        score = cosine_similarity(query_vector, doc_vector)
-        if score > 0:
-            scores.append((doc_id, score))
-
-    scores.sort(key=lambda x: x[1], reverse=True)
-    
+import threading
+from search_index import (
+    DOCS_PATH, TFIDF_PATH, INDEX_PATH,
+    SearchIndex, load_inverted_index, load_tfidf_vectors,
+    vectorize, get_document_vector, cosine_similarity, extract_title_from_html,
+)
+from result_store import RESULT_STORE_PATH, ResultStore, make_snippet
+from query_cache import QueryCache
+from semantic_index import LSA_PATH, SemanticIndex
+from tfidf_matrix import TFIDF_MATRIX_PATH
+from segments import SEGMENTS_PATH
+from metrics import metrics
+
+# Индекс загружается один раз на процесс и переиспользуется всеми запросами
+_index = None
+_index_lock = threading.Lock()
+_result_store = None
+_semantic_index = None
+_lemma_index = None
+# Размер и время жизни задаются переменными окружения SEARCH_CACHE_SIZE и SEARCH_CACHE_TTL
+query_cache = QueryCache(int(os.environ.get('SEARCH_CACHE_SIZE', 1024)),
+                         float(os.environ.get('SEARCH_CACHE_TTL', 300)))
+# Семантический режим (LSA, project/semantic_index.py) кэшируется отдельно
+semantic_cache = QueryCache(query_cache.maxsize, query_cache.ttl)
+# Поиск по леммам (SearchIndex(space='lemmas')) — тоже со своим кэшем
+lemma_cache = QueryCache(query_cache.maxsize, query_cache.ttl)
+SEARCH_MODES = ('tfidf', 'lemmas', 'semantic')
+
+# SEARCH_SHARDS=process|socket — искать по шардам из project/sharding.py
+SEARCH_SHARDS = os.environ.get('SEARCH_SHARDS')
+# SEARCH_PRECISION=float32|float16|int8 — сжатые веса (project/quantization.py)
+SEARCH_PRECISION = os.environ.get('SEARCH_PRECISION', 'float64')
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if SEARCH_SHARDS:
+                    from sharding import ShardedSearch
+                    _index = ShardedSearch(transport=SEARCH_SHARDS)
+                else:
+                    # Если update_index.py или потоковая индексация уже вели
+                    # сегменты task_3, поиск идёт по ним
+                    _index = SearchIndex(precision=SEARCH_PRECISION, segments_path=SEGMENTS_PATH)
+    return _index
+
+def get_result_store():
+    # Хранилище выдачи открывается один раз; False — файла нет
+    global _result_store
+    if _result_store is None:
+        _result_store = ResultStore(RESULT_STORE_PATH) if os.path.exists(RESULT_STORE_PATH) else False
+    return _result_store or None
+
+def get_semantic_index():
+    # Семантический индекс строится отдельно и может отсутствовать; False — файла нет
+    global _semantic_index
+    if _semantic_index is None:
+        _semantic_index = SemanticIndex(LSA_PATH) if os.path.exists(LSA_PATH) else False
+    return _semantic_index or None
+
+def get_lemma_index():
+    # Индекс лемм загружается при первом запросе в этом режиме; False — данных
+    # по леммам нет (старый tfidf.bin без раздела lemmas или нет файлов task_4)
+    global _lemma_index
+    if _lemma_index is None:
+        with _index_lock:
+            if _lemma_index is None:
+                try:
+                    index = SearchIndex(space='lemmas', precision=SEARCH_PRECISION)
+                except (FileNotFoundError, KeyError, ValueError):
+                    index = None
+                _lemma_index = index if index is not None and index.num_docs else False
+    return _lemma_index or None
+
+def available_modes():
+    modes = ['tfidf']
+    if get_lemma_index() is not None:
+        modes.append('lemmas')
+    if get_semantic_index() is not None:
+        modes.append('semantic')
+    return modes
+
+def reload_index(force=False):
+    global _result_store, _semantic_index
+    reloaded = get_index().reload(force=force)
+    if reloaded:
+        _result_store = None
+        _semantic_index = None
+    if _lemma_index:
+        # Индекс лемм может измениться отдельно (task_4/lemma_index.bin)
+        reloaded = _lemma_index.reload(force=force) or reloaded
+    return reloaded
+
+def default_url(doc_id):
+    return f"https://www.scirp.org/journal/paperinformation?paperid={60000 + doc_id}"
+
+def render_results(scores, query_tokens):
+    store = get_result_store()
     results = []
-    for doc_id, score in scores[:top_n]:
-        title = extract_title_from_html(doc_id)
+    for doc_id, score in scores:
+        record = store.get(doc_id) if store is not None else None
+        if record is not None:
+            title, url, text = record
+            snippet = make_snippet(text, query_tokens, match_start=store.first_match(doc_id, query_tokens))
+        else:
+            title, url, snippet = extract_title_from_html(doc_id), None, ''
         results.append({
             'doc_id': doc_id,
-            'title': title,
+            'title': title or f"Документ {doc_id}",
+            'url': url or default_url(doc_id),
+            'snippet': snippet,
             'score': round(score, 4)
         })
+    return results
+
+def select_engine(mode):
+    index = get_index()
+    # Версия читается до поиска: если индекс перезагрузят во время запроса,
+    # результат ляжет под старой версией и не будет выдан после перезагрузки
+    version = index.version
+    if mode == 'semantic':
+        engine, cache = get_semantic_index(), semantic_cache
+        if engine is None:
+            raise FileNotFoundError(f"Семантический индекс не построен: {LSA_PATH}")
+    elif mode == 'lemmas':
+        engine, cache = get_lemma_index(), lemma_cache
+        if engine is None:
+            raise FileNotFoundError(f"Нет данных TF-IDF по леммам: {TFIDF_MATRIX_PATH}")
+        # У индекса лемм своя версия и свой кэш
+        version = engine.version
+    else:
+        engine, cache = index, query_cache
+    return engine, cache, version
+
+def search(query_tokens, top_n=10, return_results=False, mode='tfidf'):
+    engine, cache, version = select_engine(mode)
+    results = cache.get(query_tokens, top_n, version)
+    metrics.inc('search_cache_lookups_total', result='miss' if results is None else 'hit')
+    if results is None:
+        scores = engine.search(query_tokens, top_n)
+        with metrics.stage('render'):
+            results = render_results(scores, query_tokens)
+        cache.put(query_tokens, top_n, version, results)
+    results = list(results)
     
     if return_results:
         return results
@@ -114,5 +151,21 @@ def search(query_tokens, top_n=10, return_results=False):
         for r in results:
             print(f"{r['title']} (doc_{r['doc_id']}.txt) — Score: {r['score']}")
 
-
-
+def search_batch(queries, top_n=10, mode='tfidf'):
+    # Пакет запросов (списков токенов); результаты в том же порядке.
+    # Запросы, которых нет в кэше, оцениваются одним вызовом search_batch
+    # движка (умножение разреженных матриц), если он его поддерживает
+    engine, cache, version = select_engine(mode)
+    results = [cache.get(query_tokens, top_n, version) for query_tokens in queries]
+    misses = [i for i, cached in enumerate(results) if cached is None]
+    metrics.inc('search_cache_lookups_total', len(queries) - len(misses), result='hit')
+    metrics.inc('search_cache_lookups_total', len(misses), result='miss')
+    if misses:
+        batch = getattr(engine, 'search_batch', None)
+        missed = [queries[i] for i in misses]
+        scores = batch(missed, top_n) if batch else [engine.search(query_tokens, top_n) for query_tokens in missed]
+        with metrics.stage('render'):
+            for i, query_scores in zip(misses, scores):
+                results[i] = render_results(query_scores, queries[i])
+                cache.put(queries[i], top_n, version, results[i])
+    return [list(query_results) for query_results in results]
@@ -0,0 +1,53 @@
+import os
+import sys
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.threads import deferToThread
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'project'))
+sys.path.insert(0, os.path.join(ROOT, 'task_3'))
+from lemma_cache import LemmaCache
+from segments import SegmentedIndex
+from streaming import StreamingIndexer
+from search_engine import tokenize_and_clean, tokenize_positions
+
+# Конвейер Scrapy: каждая скачанная страница сразу уходит в потоковую
+# индексацию (project/streaming.py), без повторного обхода папки pages.
+# Пути считаются от корня репозитория, потому что паук запускается из task_1.
+# Включается через run_spider.py --index.
+
+class StreamingIndexPipeline:
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings)
+
+    def open_spider(self, spider=None):
+        settings = self.settings
+        self.indexer = StreamingIndexer(
+            SegmentedIndex(settings.get('STREAM_SEGMENTS_PATH', os.path.join(ROOT, 'task_3', 'segments'))),
+            tokenize_and_clean,
+            lemma_cache=LemmaCache(os.path.join(ROOT, 'task_2', 'lemma_cache.tsv')),
+            tokens_path=os.path.join(ROOT, 'task_2', 'tokens', 'tokens'),
+            lemmas_path=os.path.join(ROOT, 'task_2', 'lemmas', 'lemmas'),
+            queue_size=settings.getint('STREAM_QUEUE_SIZE', 64),
+            batch_size=settings.getint('STREAM_BATCH_SIZE', 32),
+            flush_seconds=settings.getfloat('STREAM_FLUSH_SECONDS', 2.0),
+            tokenize_positions=tokenize_positions,
+        )
+
+    # Deferred завершается, когда страница принята в очередь: пока очередь
+    # полна, Scrapy держит ответ в обработке и сам сбавляет скорость скачивания
+    async def process_item(self, item, spider=None):
+        await maybe_deferred_to_future(deferToThread(self.indexer.submit, item['doc_id'], item['content'], item['hash']))
+        return {'doc_id': item['doc_id'], 'url': item['url'], 'hash': item['hash']}
+
+    async def close_spider(self, spider=None):
+        await maybe_deferred_to_future(deferToThread(self.close_indexer))
+
+    def close_indexer(self):
+        self.indexer.close()
+        self.indexer.report()
@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import os
+
+# Хранилище скачанных страниц для режима обхода crawl.
+#   objects/ab/<sha1>.gz   содержимое страницы, сжатое gzip; одинаковые
+#                          страницы хранятся один раз (ключ — хеш содержимого)
+#   manifest.tsv           журнал: номер, url, хеш, ETag, Last-Modified.
+#                          Строки только дописываются пачками, при чтении
+#                          последняя запись номера главнее; close() сжимает журнал.
+
+STORE_PATH = 'store'
+MANIFEST_FIELDS = ('url', 'hash', 'etag', 'last_modified')
+
+def content_hash(content):
+    return hashlib.sha1(content).hexdigest()
+
+class PageStore:
+
+    def __init__(self, root=STORE_PATH):
+        self.root = root
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+
+    def object_path(self, page_hash):
+        return os.path.join(self.root, 'objects', page_hash[:2], page_hash + '.gz')
+
+    def __contains__(self, page_hash):
+        return os.path.exists(self.object_path(page_hash))
+
+    # Возвращает (хеш, сжатый размер или 0, если такое содержимое уже было)
+    def put(self, content):
+        page_hash = content_hash(content)
+        path = self.object_path(page_hash)
+        if os.path.exists(path):
+            return page_hash, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = gzip.compress(content, compresslevel=6, mtime=0)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        return page_hash, len(compressed)
+
+    def get(self, page_hash):
+        with open(self.object_path(page_hash), 'rb') as f:
+            return gzip.decompress(f.read())
+
+def read_manifest(path):
+    entries = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) == len(MANIFEST_FIELDS) + 1:
+                    entries[int(parts[0])] = dict(zip(MANIFEST_FIELDS, parts[1:]))
+    return entries
+
+class ManifestWriter:
+    # Единственный писатель манифеста и index.txt: изменения копятся в памяти
+    # и дописываются одним write() раз в flush_every записей, а не открытием
+    # файла на каждый ответ. index.txt пересобирается один раз в close().
+
+    def __init__(self, path, index_path=None, flush_every=100):
+        self.path = path
+        self.index_path = index_path
+        self.flush_every = flush_every
+        self.entries = read_manifest(path)
+        self.buffer = []
+
+    def get(self, file_index):
+        return self.entries.get(file_index)
+
+    def update(self, file_index, url, page_hash='', etag='', last_modified=''):
+        entry = {'url': url, 'hash': page_hash, 'etag': etag or '', 'last_modified': last_modified or ''}
+        self.entries[file_index] = entry
+        fields = [str(file_index)] + [entry[name].replace('\t', ' ').replace('\n', ' ') for name in MANIFEST_FIELDS]
+        self.buffer.append('\t'.join(fields) + '\n')
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self._rewrite(self.path, (
+            '\t'.join([str(i)] + [self.entries[i][name] for name in MANIFEST_FIELDS]) + '\n'
+            for i in sorted(self.entries)))
+        if self.index_path:
+            self._rewrite(self.index_path, (f"{i} {self.entries[i]['url']}\n" for i in sorted(self.entries)))
+
+    def _rewrite(self, path, lines):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, path)
@@ -1,6 +1,40 @@
+import argparse
 from scrapy.crawler import CrawlerProcess
 from text_spider import TextSpider
 
-process = CrawlerProcess()
-process.crawl(TextSpider)
-process.start()
\ No newline at end of file
+parser = argparse.ArgumentParser(description="Скачивание страниц из urls.txt")
+parser.add_argument('--mode', choices=('full', 'crawl'), default='full',
+                    help="crawl: условные запросы, сжатое хранилище с дедупликацией")
+parser.add_argument('--urls', default='urls.txt')
+parser.add_argument('--concurrency', type=int, default=16, help="всего запросов одновременно")
+parser.add_argument('--per-domain', type=int, default=8, help="одновременных запросов на домен")
+parser.add_argument('--delay', type=float, default=0.0, help="пауза между запросами к домену, с")
+parser.add_argument('--autothrottle', action='store_true', help="подстраивать скорость под ответы сервера")
+parser.add_argument('--index', action='store_true',
+                    help="сразу индексировать скачанные страницы в сегментный индекс task_3")
+parser.add_argument('--queue-size', type=int, default=64, help="размер очередей между стадиями индексации")
+parser.add_argument('--batch-size', type=int, default=32, help="страниц в одном сегменте")
+parser.add_argument('--flush-seconds', type=float, default=2.0, help="наибольшая задержка до поиска, с")
+parser.add_argument('--log-level', default='INFO')
+args = parser.parse_args()
+
+settings = {
+    'CONCURRENT_REQUESTS': args.concurrency,
+    'CONCURRENT_REQUESTS_PER_DOMAIN': args.per_domain,
+    'DOWNLOAD_DELAY': args.delay,
+    'AUTOTHROTTLE_ENABLED': args.autothrottle,
+    'AUTOTHROTTLE_TARGET_CONCURRENCY': float(args.per_domain),
+    'COMPRESSION_ENABLED': True,
+    'LOG_LEVEL': args.log_level,
+}
+if args.index:
+    settings.update({
+        'ITEM_PIPELINES': {'index_pipeline.StreamingIndexPipeline': 300},
+        'STREAM_QUEUE_SIZE': args.queue_size,
+        'STREAM_BATCH_SIZE': args.batch_size,
+        'STREAM_FLUSH_SECONDS': args.flush_seconds,
+    })
+
+process = CrawlerProcess(settings)
+process.crawl(TextSpider, mode=args.mode, urls=args.urls)
+process.start()
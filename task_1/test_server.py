@@ -0,0 +1,129 @@
+import argparse
+import gzip
+import hashlib
+import random
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Локальная замена сайта для проверки обхода: генерирует страницы вида
+# /paper?id=N, отдаёт ETag и Last-Modified, отвечает 304 на условные запросы
+# и сжимает ответ gzip. Часть страниц — точные копии других (для дедупликации).
+# POST /mutate?count=K меняет K случайных страниц, GET /stats — счётчики.
+#   python test_server.py --pages 200 --write-urls test_urls.txt
+
+WORDS = ("search index query document vector network data model analysis system method "
+         "result learning retrieval ranking term weight economic energy market price growth "
+         "policy water soil plant climate cell protein gene disease patient treatment image "
+         "signal circuit power control algorithm graph matrix theory equation field particle").split()
+
+class Site:
+
+    def __init__(self, pages, duplicates, seed):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.pages = {}
+        for page_id in range(pages):
+            self.pages[page_id] = self.generate(page_id, 0)
+        for page_id in range(0, pages, duplicates) if duplicates else ():
+            if page_id + 1 < pages:
+                self.pages[page_id + 1] = self.pages[page_id]
+        self.counts = {'200': 0, '304': 0}
+
+    def generate(self, page_id, revision):
+        text = ' '.join(self.random.choice(WORDS) for _ in range(self.random.randint(20, 80)))
+        body = (f"<html><head><title>Paper {page_id}</title></head>"
+                f"<body><h1>Paper {page_id} r{revision}</h1><p>{text}</p></body></html>").encode('utf-8')
+        return {'body': body, 'etag': '"' + hashlib.sha1(body).hexdigest()[:16] + '"',
+                'modified': formatdate(1_600_000_000 + revision * 3600, usegmt=True), 'revision': revision}
+
+    def mutate(self, count):
+        with self.lock:
+            for page_id in self.random.sample(sorted(self.pages), min(count, len(self.pages))):
+                self.pages[page_id] = self.generate(page_id, self.pages[page_id]['revision'] + 1)
+
+def make_handler(site):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != '/mutate':
+                self.send_error(404)
+                return
+            count = int(parse_qs(url.query).get('count', ['1'])[0])
+            site.mutate(count)
+            self.send_response(204)
+            self.end_headers()
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/stats':
+                body = ' '.join(f"{k}={v}" for k, v in site.counts.items()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            try:
+                page = site.pages[int(parse_qs(url.query)['id'][0])]
+            except (KeyError, ValueError):
+                self.send_error(404)
+                return
+
+            if self.not_modified(page):
+                site.counts['304'] += 1
+                self.send_response(304)
+                self.send_header('ETag', page['etag'])
+                self.send_header('Last-Modified', page['modified'])
+                self.end_headers()
+                return
+
+            site.counts['200'] += 1
+            body = page['body']
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('ETag', page['etag'])
+            self.send_header('Last-Modified', page['modified'])
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def not_modified(self, page):
+            etag = self.headers.get('If-None-Match')
+            if etag is not None:
+                return page['etag'] in [tag.strip() for tag in etag.split(',')]
+            since = self.headers.get('If-Modified-Since')
+            if since is not None:
+                try:
+                    return parsedate_to_datetime(page['modified']) <= parsedate_to_datetime(since)
+                except (TypeError, ValueError):
+                    return False
+            return False
+
+    return Handler
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Локальный сайт для проверки обхода")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--duplicates', type=int, default=10, help="каждая N-я страница дублируется")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--write-urls', help="записать список url сайта в файл")
+    args = parser.parse_args()
+
+    site = Site(args.pages, args.duplicates, args.seed)
+    if args.write_urls:
+        with open(args.write_urls, 'w', encoding='utf-8') as f:
+            for page_id in range(args.pages):
+                f.write(f"http://127.0.0.1:{args.port}/paper?id={page_id}\n")
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(site))
+    print(f"Сайт на http://127.0.0.1:{args.port}/, страниц {args.pages}")
+    server.serve_forever()
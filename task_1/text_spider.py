@@ -1,26 +1,100 @@
 import scrapy
 import os
+from page_store import PageStore, ManifestWriter, content_hash
 
 class TextSpider(scrapy.Spider):
-    
+    name = 'text'
+    # 304 нужен в parse: это ответ на условный запрос, страница не изменилась
+    handle_httpstatus_list = [304]
+
+    # mode=full    — скачать все url заново (как раньше)
+    # mode=crawl   — условные запросы по ETag / Last-Modified из манифеста,
+    #                страницы сжаты и дедуплицированы в store/
+    def __init__(self, mode='full', urls='urls.txt', pages='pages', index='index.txt',
+                 store='store', *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if mode not in ('full', 'crawl'):
+            raise ValueError(f"неизвестный режим обхода: {mode}")
+        self.mode = mode
+        self.urls_path = urls
+        self.pages_path = pages
+        self.store = PageStore(store) if mode == 'crawl' else None
+        self.manifest = ManifestWriter(os.path.join(store, 'manifest.tsv'), index)
+        self.stats_counts = {'fetched': 0, 'not_modified': 0, 'new_objects': 0,
+                             'duplicates': 0, 'exported': 0, 'stored_bytes': 0}
+
+    # Scrapy >= 2.13 берёт начальные запросы из start(), старые версии — из start_requests()
+    async def start(self):
+        for request in self.start_requests():
+            yield request
+
     def start_requests(self):
-        with open("urls.txt", "r") as f:
+        with open(self.urls_path, "r") as f:
             urls = [line.strip() for line in f.readlines() if line.strip()]
-        
+
         for i, url in enumerate(urls, start=0):
-            yield scrapy.Request(url=url, callback=self.parse, meta={"file_index": i, "url": url})
-    
+            headers = {}
+            previous = self.manifest.get(i)
+            if self.mode == 'crawl' and previous and previous['url'] == url and previous['hash'] in self.store:
+                if previous['etag']:
+                    headers['If-None-Match'] = previous['etag']
+                if previous['last_modified']:
+                    headers['If-Modified-Since'] = previous['last_modified']
+            yield scrapy.Request(url=url, callback=self.parse, headers=headers,
+                                 meta={"file_index": i, "url": url})
+
     def parse(self, response):
         file_index = response.meta["file_index"]
         url = response.meta["url"]
-        
-        filename = f"pages/page_{file_index}.html"
-        os.makedirs("pages", exist_ok=True)
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(response.text)
-        
-        # Записываем индекс
-        with open("index.txt", "a", encoding="utf-8") as index_file:
-            index_file.write(f"{file_index} {url}\n")
-        
-        self.log(f"Saved {filename}")
+        filename = os.path.join(self.pages_path, f"page_{file_index}.html")
+        previous = self.manifest.get(file_index)
+
+        if response.status == 304:
+            self.stats_counts['not_modified'] += 1
+            # Валидаторы могли обновиться и в ответе 304
+            self.manifest.update(file_index, url, previous['hash'],
+                                 self.header(response, 'ETag') or previous['etag'],
+                                 self.header(response, 'Last-Modified') or previous['last_modified'])
+            if not os.path.exists(filename):
+                self.export(filename, self.store.get(previous['hash']))
+            return
+
+        self.stats_counts['fetched'] += 1
+        content = response.text.encode('utf-8')
+        if self.store is not None:
+            page_hash, stored = self.store.put(content)
+            if stored:
+                self.stats_counts['new_objects'] += 1
+                self.stats_counts['stored_bytes'] += stored
+            else:
+                self.stats_counts['duplicates'] += 1
+        else:
+            page_hash = content_hash(content)
+
+        # pages/ остаётся входом для task_2: файл переписывается только
+        # при изменении содержимого, чтобы не сбрасывать проверку по хешу
+        if previous is None or previous['hash'] != page_hash or not os.path.exists(filename):
+            self.export(filename, content)
+        self.manifest.update(file_index, url, page_hash,
+                             self.header(response, 'ETag'), self.header(response, 'Last-Modified'))
+        # Для потоковой индексации (index_pipeline.py); без конвейера элемент просто отбрасывается
+        yield {'doc_id': file_index, 'url': url, 'content': content, 'hash': page_hash}
+
+    def header(self, response, name):
+        value = response.headers.get(name)
+        return value.decode('latin-1') if value else ''
+
+    def export(self, filename, content):
+        os.makedirs(self.pages_path, exist_ok=True)
+        with open(filename, "wb") as f:
+            f.write(content)
+        self.stats_counts['exported'] += 1
+        self.logger.debug(f"Saved {filename}")
+
+    def closed(self, reason):
+        self.manifest.close()
+        counts = self.stats_counts
+        self.logger.info(
+            f"Обход завершён ({self.mode}): скачано {counts['fetched']}, без изменений (304) {counts['not_modified']}, "
+            f"новых объектов {counts['new_objects']} ({counts['stored_bytes'] / 1024:.1f} КБ сжато), "
+            f"дубликатов {counts['duplicates']}, записано страниц {counts['exported']}")
@@ -1,10 +1,16 @@
+import argparse
 import os
-import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from bs4 import BeautifulSoup
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import wordnet, words, stopwords
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from analyzer import get_word_filter, word_tokenize
+from lemma_cache import LemmaCache
+from docstore import DOCSTORE_PATH, DocumentStoreWriter, open_docstore
+from page_hashes import page_files, page_hashes
 
 #nltk.download('punkt')
 #nltk.download('wordnet')
@@ -13,9 +19,17 @@ from nltk.corpus import wordnet, words, stopwords
 #nltk.download('omw-1.4')
 #nltk.download('stopwords')
 
-lemmatizer = WordNetLemmatizer()
-english_vocab = set(words.words())
-stop_words = set(stopwords.words('english'))
+# Словарь и стоп-слова — из снимка project/analyzer.py (или корпусов NLTK)
+# при первой проверке слова; nltk импортируется при первой токенизации.
+# Кэш лемм (lemma_cache.tsv) тоже читается при первой лемматизации, а не
+# при импорте модуля
+_lemma_cache = None
+
+def get_lemma_cache():
+    global _lemma_cache
+    if _lemma_cache is None:
+        _lemma_cache = LemmaCache()
+    return _lemma_cache
 
 INPUT_FOLDER = "information-search/task_1/pages"
 OUTPUT_TOKENS = "information-search/task_2/tokens/tokens"
@@ -29,35 +43,29 @@ def extract_text_from_html(html_content):
     soup = BeautifulSoup(html_content, "html.parser")
     return soup.get_text()
 
+# Один разбор HTML на все нужды: текст для токенизации, текст с пробелами
+# между тегами (его индексирует task_3) и заголовок для выдачи
+def parse_html(html_content):
+    soup = BeautifulSoup(html_content, "html.parser")
+    title = soup.title.string.strip() if soup.title and soup.title.string else None
+    return soup.get_text(), soup.get_text(separator=" ", strip=True), title
+
 def is_english_word(word):
-    return word.lower() in english_vocab
+    return get_word_filter().is_english_word(word)
 
+# Буквенные слова длиннее одной буквы из словаря, кроме стоп-слов
 def clean_tokens(tokens):
-    return {
-        t.lower()
-        for t in tokens
-        if t.isalpha()
-        and len(t) > 1
-        and is_english_word(t)
-        and t.lower() not in stop_words
-    }
-
-def get_wordnet_pos(word):
-    tag = nltk.pos_tag([word])[0][1]
-    if tag.startswith('V'):
-        return wordnet.VERB
-    elif tag.startswith('N'):
-        return wordnet.NOUN
-    elif tag.startswith('R'):
-        return wordnet.ADV
-    else:
-        return wordnet.ADJ
+    word_filter = get_word_filter()
+    return {t.lower() for t in tokens if word_filter.is_index_token(t)}
 
 def lemmatize_tokens(tokens):
+    # Лемматизация с учетом части речи; теги и леммы берутся из кэша
+    return group_lemmas(tokens, get_lemma_cache().lemmatize_batch(tokens))
+
+def group_lemmas(tokens, token_lemmas):
     lemmas = {}
     for token in tokens:
-        pos = get_wordnet_pos(token)
-        lemma = lemmatizer.lemmatize(token, pos)  # Лемматизация с учетом части речи
+        lemma = token_lemmas[token]
         if lemma not in lemmas:
             lemmas[lemma] = set()
         lemmas[lemma].add(token.lower())
@@ -67,32 +75,146 @@ def lemmatize_tokens(tokens):
 
     return lemmas
 
-def process_files():
-    all_tokens = set()
+STAGES = ("parse", "tokenize", "filter", "lemmatize")
+
+CACHE_COUNTERS = ("memory_hits", "disk_hits", "misses", "tagging_seconds")
+
+# Обработка одной страницы; выполняется в рабочем процессе
+def process_page(path):
+    timings = {}
+    lemma_cache = get_lemma_cache()
+    cache_before = lemma_cache.stats()
+    start = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as file:
+        html_content = file.read()
+    text, spaced_text, title = parse_html(html_content)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tokens = word_tokenize(text.lower())  # Токенизация
+    timings["tokenize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    all_tokens = sorted(clean_tokens(tokens))  # Фильтрация
+    timings["filter"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    token_lemmas = lemma_cache.lemmatize_batch(all_tokens)
+    timings["lemmatize"] = time.perf_counter() - start
+
+    record = {
+        "title": title,
+        "text": text,
+        "spaced_text": spaced_text,
+        "tokens": all_tokens,
+        "lemmas": [token_lemmas[token] for token in all_tokens],
+    }
+    # Новые леммы и счётчики кэша уходят в родительский процесс
+    cache_after = lemma_cache.stats()
+    cache_delta = {key: cache_after[key] - cache_before[key] for key in CACHE_COUNTERS}
+    return record, timings, lemma_cache.drain_new_entries(), cache_delta
+
+def write_page(doc_num, all_tokens, lemmas):
+    with open(OUTPUT_TOKENS + "_" + str(doc_num) + ".txt", "w", encoding="utf-8") as f:
+        for token in sorted(all_tokens):
+            f.write(f"{token}\n")
+
+    with open(OUTPUT_LEMMAS + "_" + str(doc_num) + ".txt", "w", encoding="utf-8") as f:
+        for lemma, words in sorted(lemmas.items()):
+            f.write(f"{lemma}: {words}\n")
+
+# Результаты отдаются строго в порядке jobs; одновременно в работе
+# не больше max_in_flight страниц, чтобы не копить их в памяти
+def iter_processed(jobs, workers, max_in_flight):
+    if workers == 1:
+        for job in jobs:
+            yield job, process_page(job[2])
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for job in jobs:
+            pending.append((job, pool.submit(process_page, job[2])))
+            if len(pending) >= max_in_flight:
+                job, future = pending.popleft()
+                yield job, future.result()
+        while pending:
+            job, future = pending.popleft()
+            yield job, future.result()
+
+def outputs_exist(doc_num):
+    return (os.path.exists(OUTPUT_TOKENS + "_" + str(doc_num) + ".txt")
+            and os.path.exists(OUTPUT_LEMMAS + "_" + str(doc_num) + ".txt"))
+
+def process_files(workers=1, max_in_flight=None, report_every=None, force=False):
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or workers * 4
 
     os.makedirs("information-search/task_2/tokens", exist_ok=True)
     os.makedirs("information-search/task_2/lemmas", exist_ok=True)
-    for filename in os.listdir(INPUT_FOLDER):
-        if filename.endswith(".html"):
-            with open(os.path.join(INPUT_FOLDER, filename), "r", encoding="utf-8") as file:
-                all_tokens = set()
-                lemmas = {}
-                html_content = file.read()
-                text = extract_text_from_html(html_content)
-                tokens = word_tokenize(text.lower())  # Токенизация
-                clean_tokens_list = clean_tokens(tokens)  # Фильтрация
-                all_tokens.update(clean_tokens_list)  # Добавляем в общий список
-                lemmas = lemmatize_tokens(all_tokens)
-
-                 # Запись
-                with open(OUTPUT_TOKENS + "_" +  str(int(re.search(r'\d+', filename).group())) + ".txt", "w", encoding="utf-8") as f:
-                    for token in sorted(all_tokens):
-                        f.write(f"{token}\n")
-
-                with open(OUTPUT_LEMMAS + "_" +  str(int(re.search(r'\d+', filename).group())) + ".txt", "w", encoding="utf-8") as f:
-                    for lemma, words in sorted(lemmas.items()):
-                        f.write(f"{lemma}: {words}\n")
-
-
-process_files()
-
+    pages = page_files(INPUT_FOLDER)
+    report_every = report_every or max(1, len(pages) // 20)
+
+    # Страницы, чей HTML не изменился с прошлого запуска, не разбираются:
+    # их записи переносятся из прежнего хранилища документов. Хеши — из
+    # кэша project/page_hashes.py: неизменённые файлы не читаются
+    previous = None if force else open_docstore(DOCSTORE_PATH)
+    hashes = page_hashes(INPUT_FOLDER)
+    writer = DocumentStoreWriter(DOCSTORE_PATH)
+    skipped = 0
+
+    def changed_pages():
+        nonlocal skipped
+        for doc_num in sorted(hashes):
+            page_hash = hashes[doc_num]
+            path = pages[doc_num]
+            if previous is not None and previous.hash(doc_num) == page_hash and outputs_exist(doc_num):
+                writer.copy(previous, doc_num)
+                skipped += 1
+                continue
+            yield doc_num, page_hash, path
+
+    lemma_cache = get_lemma_cache()
+    totals = dict.fromkeys(STAGES + ("write",), 0.0)
+    started = time.perf_counter()
+    done = 0
+    for (doc_num, page_hash, _), result in iter_processed(changed_pages(), workers, max_in_flight):
+        record, timings, learned, cache_delta = result
+        for stage, seconds in timings.items():
+            totals[stage] += seconds
+        lemma_cache.merge(learned)
+        if workers != 1:
+            lemma_cache.add_stats(cache_delta)
+
+        # Запись
+        start = time.perf_counter()
+        writer.add(doc_num, page_hash, record)
+        all_tokens = record["tokens"]
+        write_page(doc_num, all_tokens, group_lemmas(all_tokens, dict(zip(all_tokens, record["lemmas"]))))
+        totals["write"] += time.perf_counter() - start
+
+        done += 1
+        if done % report_every == 0:
+            elapsed = time.perf_counter() - started
+            print(f"Обработано {done + skipped}/{len(pages)} страниц, {done / elapsed:.1f} стр/с")
+
+    start = time.perf_counter()
+    writer.close()
+    totals["write"] += time.perf_counter() - start
+    if previous is not None:
+        previous.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Готово за {elapsed:.2f} с, процессов: {workers}, обработано: {done}, без изменений: {skipped}")
+    print("Время по стадиям (сумма по всем процессам):")
+    for stage, seconds in totals.items():
+        print(f"  {stage:<10} {seconds:8.2f} с")
+    lemma_cache.save()
+    lemma_cache.report()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=1, help="число процессов (0 — по числу ядер)")
+    parser.add_argument('--max-in-flight', type=int, default=None, help="сколько страниц одновременно в работе")
+    parser.add_argument('--force', action='store_true', help="обработать все страницы заново")
+    args = parser.parse_args()
+    process_files(args.workers, args.max_in_flight, force=args.force)
@@ -1,70 +1,220 @@
+import argparse
+import json
 import os
-import re
+import sys
 from collections import defaultdict
-from bs4 import BeautifulSoup
-import nltk
-from nltk.corpus import stopwords, words
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from analyzer import get_word_filter, tokenize_words
+from binary_index import BinaryInvertedIndex, write_binary_index
+from boolean_query import QueryPlanner, QuerySyntaxError, parse_query
+from docstore import open_fresh_docstore
+from page_hashes import file_digest, hashes_signature, page_files, page_hashes
+from positional_index import PositionalIndex, encode_positional_index, open_positional_index, write_positional_index
+from metrics import metrics, profile
+from segments import MANIFEST_NAME as SEGMENTS_MANIFEST, SEGMENTS_PATH, SegmentedIndex
 
 # Загрузка ресурсов NLTK
 # nltk.download('punkt')
 # nltk.download('stopwords')
 # nltk.download('words')
 
-stop_words = set(stopwords.words('english'))
-english_vocab = set(words.words())
+# Ни nltk, ни корпуса слов при импорте не загружаются: словарь и стоп-слова
+# берутся из снимка project/analyzer.py при первой проверке слова, а nltk
+# нужен только для текста со знаками препинания. Процесс, открывший готовый
+# образ индекса (BooleanSearchEngine.open), на запросах из слов его не импортирует.
+
+INDEX_PATH = "information-search/task_3/inverted_index.txt"
+MANIFEST_NAME = "index_manifest.json"
+
+def is_english_word(word):
+    return get_word_filter().is_english_word(word)
+
+def is_index_token(t):
+    return get_word_filter().is_index_token(t)
+
+def clean_tokens(tokens):
+    return {t.lower() for t in tokens if is_index_token(t)}
+
+def tokenize_and_clean(text):
+    tokens = tokenize_words(text.lower())
+    return clean_tokens(tokens)
+
+# Слова индекса с их номерами среди всех токенов текста (для фраз и NEAR)
+def tokenize_positions(text):
+    return [(position, token) for position, token in enumerate(tokenize_words(text.lower()))
+            if is_index_token(token)]
+
+# Отпечаток папки со страницами: номера и хеши содержимого страниц. Хеши
+# берутся из кэша page_hashes.py, так что при запуске читаются только
+# страницы, у которых изменились размер или время изменения; образ остаётся
+# действительным после git clone или копирования страниц
+def pages_signature(folder_path):
+    return hashes_signature(page_hashes(folder_path))
+
+def index_image_paths(index_path):
+    directory = os.path.dirname(index_path)
+    return (os.path.splitext(index_path)[0] + ".bin", os.path.join(directory, "positional_index.bin"),
+            os.path.join(directory, MANIFEST_NAME))
+
+def files_signature(paths):
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns, file_digest(path)])
+    return signature
+
+# Файлы образа те же, что в манифесте: размер совпадает, а SHA-1 считается
+# только у файлов, чьё время изменения отличается от записанного (после
+# копирования). Такие записи получают новое время, чтобы следующий запуск
+# их не хешировал. Возвращает (совпадают, записи изменились)
+def verify_files(entries, paths):
+    if len(entries) != len(paths):
+        return False, False
+    touched = False
+    for entry, path in zip(entries, paths):
+        name, size, mtime_ns, digest = entry
+        stat = os.stat(path)
+        if name != os.path.basename(path) or stat.st_size != size:
+            return False, False
+        if stat.st_mtime_ns != mtime_ns:
+            if file_digest(path) != digest:
+                return False, False
+            entry[2] = stat.st_mtime_ns
+            touched = True
+    return True, touched
 
 class BooleanSearchEngine:
 
-    def __init__(self, documents):
+    # index_path=None — индекс только в памяти (бенчмарки), файлы не пишутся
+    def __init__(self, documents, index_path=INDEX_PATH):
         self.documents = documents
+        self.segments = None
+        self.doc_ids = list(range(len(documents)))
         self.index = self.build_inverted_index(documents)
         self.all_docs = set(range(len(documents)))
-        self.save_index_to_file("information-search/task_3/inverted_index.txt")
+        self.planner = QueryPlanner(self.sorted_postings(), len(documents), positions=self.positions)
+        if index_path is not None:
+            self.save_index_to_file(index_path)
+            self.save_binary_index(os.path.splitext(index_path)[0] + ".bin")
+            self.save_positional_index(os.path.join(os.path.dirname(index_path), "positional_index.bin"))
+
+    @classmethod
+    def open(cls, index_path=INDEX_PATH, source_signature=None):
+        # Готовый образ индекса: бинарный и позиционный индексы через mmap
+        # и манифест с номерами страниц. Время открытия не зависит от числа
+        # документов. None, если образа нет, он перезаписан после манифеста
+        # или собран по другому набору страниц.
+        binary_path, positional_path, manifest_path = index_image_paths(index_path)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["source"] != source_signature:
+                return None
+            valid, touched = verify_files(manifest["files"], (binary_path, positional_path))
+            if not valid:
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if touched:
+            try:
+                write_manifest(manifest_path, manifest)
+            except OSError:
+                # Без прав на запись образ всё равно открывается, только с проверкой хешей
+                pass
+        self = cls.__new__(cls)
+        self.documents = None
+        self.segments = None
+        self.doc_ids = manifest["doc_ids"]
+        self.index = BinaryInvertedIndex(binary_path)
+        self.positions = open_positional_index(positional_path)
+        self.all_docs = range(len(self.doc_ids))
+        self.planner = QueryPlanner(self.index, len(self.doc_ids), positions=self.positions)
+        return self
+
+    @classmethod
+    def from_segments(cls, segments):
+        # Индекс из сегментов task_3 (segments.py), которые ведут
+        # update_index.py и потоковая индексация. Номера документов — номера
+        # страниц, удалённые страницы не находятся. Фразы и NEAR ищутся по
+        # позициям сегментов; если сегмент записан без позиций, они недоступны
+        self = cls.__new__(cls)
+        self.documents = None
+        self.segments = segments
+        self.open_segments()
+        return self
+
+    def open_segments(self):
+        # Списки терминов сливаются по сегментам во время запроса
+        # (SegmentSnapshot), общий индекс не собирается
+        snapshot = self.segments.snapshot()
+        self.index = snapshot
+        self.positions = snapshot.positions()
+        self.all_docs = snapshot.all_docs
+        self.doc_ids = self.all_docs
+        self.planner = QueryPlanner(snapshot, snapshot.num_docs, self.all_docs, positions=self.positions)
+
+    def refresh(self):
+        # Подхватить сегменты и удаления, записанные другим процессом
+        if self.segments is None or not self.segments.refresh():
+            return False
+        self.open_segments()
+        return True
+
+    def page_number(self, doc_id):
+        # В сегментах номер документа уже номер страницы
+        return doc_id if self.segments is not None else self.doc_ids[doc_id]
+
+    def save_manifest(self, index_path, doc_ids, source_signature):
+        # Пишется после файлов индекса и фиксирует их размеры и хеши
+        binary_path, positional_path, manifest_path = index_image_paths(index_path)
+        self.doc_ids = list(doc_ids)
+        manifest = {"doc_ids": self.doc_ids, "source": source_signature,
+                    "files": files_signature((binary_path, positional_path))}
+        write_manifest(manifest_path, manifest)
 
     def is_english_word(self, word):
-        return word.lower() in english_vocab
+        return is_english_word(word)
 
     def clean_tokens(self, tokens):
-        return {
-            t.lower()
-            for t in tokens
-            if t.isalpha()
-            and len(t) > 1
-            and self.is_english_word(t)
-            and t.lower() not in stop_words
-        }
+        return clean_tokens(tokens)
 
     def tokenize_and_clean(self, text):
-        tokens = nltk.word_tokenize(text.lower())
-        return self.clean_tokens(tokens)
+        return tokenize_and_clean(text)
 
+    def tokenize_positions(self, text):
+        return tokenize_positions(text)
+
+    # Текст токенизируется один раз: из позиций слов строится и обычный
+    # индекс, и позиционный (self.positions)
     def build_inverted_index(self, documents):
         index = defaultdict(set)
+        positions = defaultdict(lambda: ([], [], []))
         for doc_id, text in enumerate(documents):
-            for token in self.tokenize_and_clean(text):
+            doc_positions = defaultdict(list)
+            for position, token in self.tokenize_positions(text):
+                doc_positions[token].append(position)
+            for token, token_positions in doc_positions.items():
                 index[token].add(doc_id)
+                doc_ids, counts, flat = positions[token]
+                doc_ids.append(doc_id)
+                counts.append(len(token_positions))
+                flat.extend(token_positions)
+        self.positions = PositionalIndex(encode_positional_index(positions, len(documents)))
         return index
 
-    def parse_query(self, query):
-        def repl(token):
-            token = token.strip()
-            upper_token = token.upper()
-
-            if upper_token in ('AND', 'И'):
-                return '&'
-            elif upper_token in ('OR', 'ИЛИ'):
-                return '|'
-            elif upper_token in ('NOT', 'НЕ'):
-                return 'self.all_docs -'
-            elif token == '(' or token == ')':
-                return token
-            else:
-                cleaned = next(iter(self.tokenize_and_clean(token)), token.lower())
-                return f"self.index.get('{cleaned}', set())"
+    def sorted_postings(self):
+        return {term: np.array(sorted(docs), dtype=np.int64) for term, docs in self.index.items()}
 
-        tokens = re.findall(r'\(|\)|\w+|AND|OR|NOT|И|ИЛИ|НЕ', query)
-        parsed = ' '.join(repl(token) for token in tokens)
-        return parsed
+    def normalize_term(self, token):
+        return next(iter(self.tokenize_and_clean(token)), token.lower())
+
+    def normalize_phrase(self, text):
+        return self.tokenize_positions(text)
+
+    def parse_query(self, query):
+        return parse_query(query, self.normalize_term, self.normalize_phrase)
 
     def save_index_to_file(self, filename):
         with open(filename, "w", encoding="utf-8") as f:
@@ -72,54 +222,140 @@ class BooleanSearchEngine:
                 doc_ids = sorted(self.index[term])
                 f.write(f"{term}: {doc_ids}\n")
 
+    def save_binary_index(self, filename):
+        write_binary_index(self.index, filename)
+
+    def save_positional_index(self, filename):
+        write_positional_index(self.positions.data, filename)
+
     def search(self, query):
+        metrics.inc('search_queries_total', engine='boolean')
         try:
-            parsed_query = self.parse_query(query)
-            result = eval(parsed_query)
-            return result
+            with metrics.stage('parse'):
+                parsed_query = self.parse_query(query)
+            with metrics.stage('evaluate'):
+                result = self.planner.evaluate(parsed_query)
+                if self.segments is not None:
+                    # Позиционный индекс образа не знает об удалениях
+                    result = np.intersect1d(result, self.all_docs, assume_unique=True)
+            return set(result.tolist())
         except Exception as e:
             print(f"Ошибка при обработке запроса: {e}")
             return set()
 
+def write_manifest(manifest_path, manifest):
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def load_page_text(path):
+    from bs4 import BeautifulSoup
+    with open(path, "r", encoding="utf-8") as file:
+        soup = BeautifulSoup(file, "html.parser")
+        return soup.get_text(separator=" ", strip=True)
+
 def load_html_documents_from_folder(folder_path):
-    documents = {}
-    filenames = os.listdir(folder_path)
-    for filename in filenames:
-        if filename.endswith(".html"):
-            match = re.search(r'\d+', filename)
-            if match:
-                doc_id = int(match.group())
-                with open(os.path.join(folder_path, filename), "r", encoding="utf-8") as file:
-                    soup = BeautifulSoup(file, "html.parser")
-                    text = soup.get_text(separator=" ", strip=True)
-                    documents[doc_id] = text
+    return {doc_id: load_page_text(path) for doc_id, path in page_files(folder_path).items()}
+
+# Тексты берутся из хранилища документов task_2, если оно актуально,
+# иначе страницы разбираются заново
+def load_documents(folder_path):
+    store = open_fresh_docstore(folder_path)
+    if store is None:
+        return load_html_documents_from_folder(folder_path)
+    documents = {doc_id: record["spaced_text"] for doc_id, record in store.items()}
+    store.close()
     return documents
 
-# Загрузка документов
-folder_path = "information-search/task_1/pages"
-documents_dict = load_html_documents_from_folder(folder_path)
+class DocumentTexts:
+    # Тексты найденных документов для выдачи. Если индекс открыт из готового
+    # образа, всех текстов в памяти нет: они читаются по одному из хранилища
+    # task_2 или из страницы
+    def __init__(self, folder_path, documents=None):
+        self.folder_path = folder_path
+        self.documents = documents
+        self.store = None
+        self.pages = None
+
+    def __getitem__(self, doc_id):
+        if self.documents is not None:
+            return self.documents[doc_id]
+        if self.store is None:
+            self.store = open_fresh_docstore(self.folder_path) or False
+        if self.store and doc_id in self.store:
+            return self.store.get(doc_id)["spaced_text"]
+        if self.pages is None or doc_id not in self.pages:
+            # Страница могла появиться после запуска (потоковая индексация)
+            self.pages = page_files(self.folder_path)
+        if doc_id not in self.pages:
+            # Страница удалена, а индекс ещё не обновлён
+            return ""
+        return load_page_text(self.pages[doc_id])
 
-documents = [documents_dict[k] for k in sorted(documents_dict.keys())]
-doc_id_map = {i: k for i, k in enumerate(sorted(documents_dict.keys()))}
+def main():
+    parser = argparse.ArgumentParser(description="Булев поиск по страницам task_1")
+    parser.add_argument('--profile', action='store_true', help="печатать время стадий каждого запроса")
+    parser.add_argument('--shards', choices=('inline', 'process', 'socket'),
+                        help="искать по шардам (project/sharding.py build)")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="пересобрать индекс, даже если готовый образ актуален")
+    args = parser.parse_args()
 
-# Инициализация поисковой системы
-engine = BooleanSearchEngine(documents)
+    # Если страницы не менялись с прошлой сборки, индекс открывается из
+    # готового образа; иначе документы загружаются и индекс строится заново
+    folder_path = "information-search/task_1/pages"
+    signature = pages_signature(folder_path)
+    engine = None if args.rebuild else BooleanSearchEngine.open(INDEX_PATH, signature)
+    if engine is not None:
+        texts = DocumentTexts(folder_path)
+        print(f"Индекс открыт из готового образа ({len(engine.doc_ids)} документов)")
+    else:
+        documents_dict = load_documents(folder_path)
+        doc_ids = sorted(documents_dict.keys())
+        engine = BooleanSearchEngine([documents_dict[k] for k in doc_ids])
+        engine.save_manifest(INDEX_PATH, doc_ids, signature)
+        texts = DocumentTexts(folder_path, documents_dict)
+    if os.path.exists(os.path.join(SEGMENTS_PATH, SEGMENTS_MANIFEST)):
+        # Сегменты ведут update_index.py и потоковая индексация: поиск,
+        # включая фразы и NEAR, идёт по ним
+        engine = BooleanSearchEngine.from_segments(SegmentedIndex(SEGMENTS_PATH))
+        texts = DocumentTexts(folder_path)
+        print(f"Поиск по сегментам {SEGMENTS_PATH} ({len(engine.all_docs)} документов)")
+    shards = None
+    if args.shards:
+        from sharding import ShardedSearch
+        shards = ShardedSearch(transport=args.shards)
+
+    # Интерфейс пользователя
+    print("Введите булев запрос (используйте AND, OR, NOT, \"фразы\", NEAR/k и шаблоны learn*). Для выхода введите 'exit'.\n")
+    while True:
+        query = input("Запрос: ").strip()
+        if query.lower() == 'exit':
+            print("Выход из программы.")
+            break
 
-# Интерфейс пользователя
-print("Введите булев запрос (используйте AND, OR, NOT). Для выхода введите 'exit'.\n")
-while True:
-    query = input("Запрос: ").strip()
-    if query.lower() == 'exit':
-        print("Выход из программы.")
-        break
+        with profile() as query_profile:
+            if shards is not None:
+                try:
+                    result = shards.boolean_search(query, engine.normalize_term, engine.normalize_phrase)
+                except QuerySyntaxError as e:
+                    print(f"Ошибка при обработке запроса: {e}")
+                    result = set()
+            else:
+                engine.refresh()
+                result = engine.search(query)
 
-    result = engine.search(query)
+        if result:
+            print("\nНайдены документы:")
+            for idx in sorted(result):
+                doc_num = engine.page_number(idx)  # Преобразуем индекс обратно в номер документа
+                print(f"{doc_num}: {texts[doc_num][:200]}...")
+        else:
+            print("\nНичего не найдено.")
+        if args.profile:
+            print(query_profile.report())
+        print("-" * 50)
 
-    if result:
-        print("\nНайдены документы:")
-        for idx in sorted(result):
-            doc_num = doc_id_map[idx]  # Преобразуем индекс обратно в номер документа
-            print(f"{doc_num}: {documents[idx][:200]}...")
-    else:
-        print("\nНичего не найдено.")
-    print("-" * 50)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from page_hashes import page_files, page_hashes, page_id
+from search_engine import tokenize_positions
+from segments import SegmentedIndex, SEGMENTS_PATH
+
+# Инкрементальное обновление индекса: в новый сегмент попадают только
+# новые и изменившиеся страницы, пропавшие страницы помечаются удалёнными.
+# Хеши страниц берутся из кэша page_hashes.py, так что читаются и
+# разбираются только страницы, у которых изменились размер или время
+# изменения. Список изменённых страниц можно передать явно (--pages), тогда
+# остальные страницы не проверяются вовсе.
+
+def read_page(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+# Термины страницы и их позиции (для фраз и NEAR)
+def extract_tokens(content):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content.decode("utf-8"), "html.parser")
+    text = soup.get_text(separator=" ", strip=True)
+    positions = tokenize_positions(text)
+    return sorted({token for _, token in positions}), positions
+
+def update_index(index, folder_path, paths=None):
+    # paths — изменённые страницы (номер -> путь); без него — вся папка
+    pages = page_files(folder_path) if paths is None else paths
+    hashes = page_hashes(folder_path, paths)
+    changed = []
+    unchanged = 0
+    for doc_id, content_hash in sorted(hashes.items()):
+        if index.content_hash(doc_id) == content_hash:
+            unchanged += 1
+            continue
+        tokens, positions = extract_tokens(read_page(pages[doc_id]))
+        changed.append((doc_id, tokens, content_hash, positions))
+
+    updated = sum(1 for doc_id, *_ in changed if doc_id in index)
+    index.add_documents(changed)
+
+    # Удаляются страницы, которых нет в папке (или в списке, но нет на диске)
+    missing = set(index.locations) - set(hashes) if paths is None else set(pages) - set(hashes)
+    deleted = 0
+    for doc_id in sorted(missing):
+        if index.delete_document(doc_id):
+            deleted += 1
+    return len(changed) - updated, updated, deleted, unchanged
+
+def main():
+    parser = argparse.ArgumentParser(description="Обновить сегменты индекса task_3 по страницам task_1")
+    parser.add_argument('folder', nargs='?', default="information-search/task_1/pages")
+    parser.add_argument('--pages', nargs='+', metavar='PAGE',
+                        help="только эти страницы (например, от обходчика); удалённые файлы убираются из индекса")
+    args = parser.parse_args()
+
+    paths = None
+    if args.pages:
+        paths = {}
+        for path in args.pages:
+            doc_id = page_id(os.path.basename(path))
+            if doc_id is None:
+                parser.error(f"не страница task_1: {path}")
+            paths[doc_id] = path
+
+    start = time.perf_counter()
+    index = SegmentedIndex(SEGMENTS_PATH)
+    added, updated, deleted, unchanged = update_index(index, args.folder, paths)
+    merged = index.maybe_merge()
+    print(f"Добавлено: {added}, обновлено: {updated}, удалено: {deleted}, без изменений: {unchanged}")
+    print(f"Сегментов: {len(index.segments)} (слияний: {merged}), документов: {len(index)}, "
+          f"время: {time.perf_counter() - start:.2f} с")
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,32 @@
+import argparse
 import os
 import re
+import sys
 import math
+import time
 from collections import Counter
+import numpy as np
+from scipy import sparse
 from bs4 import BeautifulSoup
-from nltk.tokenize import word_tokenize
-import nltk
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import wordnet, words, stopwords
 
-lemmatizer = WordNetLemmatizer()
-english_vocab = set(words.words())
-stop_words = set(stopwords.words('english'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from analyzer import get_word_filter, word_tokenize
+from lemma_cache import LemmaCache
+from docstore import open_fresh_docstore
+from tfidf_matrix import TFIDF_MATRIX_PATH, write_tfidf_matrix
+from binary_index import LEMMA_INDEX_PATH, write_binary_index
+
+# Словарь и стоп-слова — из снимка project/analyzer.py (или корпусов NLTK)
+# при первой проверке слова; nltk импортируется при первой токенизации.
+# Кэш лемм (lemma_cache.tsv) тоже читается при первой лемматизации, а не
+# при импорте модуля
+_lemma_cache = None
+
+def get_lemma_cache():
+    global _lemma_cache
+    if _lemma_cache is None:
+        _lemma_cache = LemmaCache()
+    return _lemma_cache
 
 # Загрузка всех документов
 def load_html_documents_from_folder(folder_path):
@@ -25,37 +41,18 @@ def load_html_documents_from_folder(folder_path):
     return documents
 
 def is_english_word(word):
-    return word.lower() in english_vocab
+    return get_word_filter().is_english_word(word)
 
+# Буквенные слова длиннее одной буквы из словаря, кроме стоп-слов
 def clean_tokens(tokens):
-    return {
-        t.lower()
-        for t in tokens
-        if t.isalpha()
-        and len(t) > 1
-        and is_english_word(t)
-        and t.lower() not in stop_words
-    }
-
-def get_wordnet_pos(word):
-    tag = nltk.pos_tag([word])[0][1]
-    if tag.startswith('V'):
-        return wordnet.VERB
-    elif tag.startswith('N'):
-        return wordnet.NOUN
-    elif tag.startswith('R'):
-        return wordnet.ADV
-    else:
-        return wordnet.ADJ
+    word_filter = get_word_filter()
+    return {t.lower() for t in tokens if word_filter.is_index_token(t)}
 
 def lemmatize_tokens(tokens):
-    lemmas = []
-    for token in tokens:
-        if token.isalpha():
-            pos = get_wordnet_pos(token)
-            lemma = lemmatizer.lemmatize(token, pos)  # Лемматизация с учетом части речи
-            lemmas.append(lemma.lower())
-    return lemmas
+    tokens = [token for token in tokens if token.isalpha()]
+    # Лемматизация с учетом части речи; теги и леммы берутся из кэша
+    token_lemmas = get_lemma_cache().lemmatize_batch(tokens)
+    return [token_lemmas[token].lower() for token in tokens]
 
 def preprocess_text(text):
     tokens = word_tokenize(text.lower())
@@ -63,45 +60,53 @@ def preprocess_text(text):
     lemmas = lemmatize_tokens(clean_tokens_list)
     return clean_tokens_list, lemmas
 
-# Подсчет TF
-def compute_tf(tokens):
-    tf = Counter(tokens)
-    total_tokens = len(tokens)
-    for token in tf:
-        tf[token] /= total_tokens
-    return tf
-
-# Подсчет IDF
-def compute_idf(documents, all_tokens):
-    idf = {}
-    total_docs = len(documents)
-    for token in all_tokens:
-        docs_with_term = sum(1 for doc in documents if token in doc)
-        idf[token] = math.log(total_docs / docs_with_term)
+# Словарь терминов корпуса: отсортированный список и термин -> id
+def term_dictionary(*term_collections):
+    terms = sorted(set().union(*(set(terms) for collection in term_collections for terms in collection)))
+    return terms, {term: i for i, term in enumerate(terms)}
+
+# DF за один проход: id терминов всех документов подряд и bincount
+def document_frequencies(documents, term_ids):
+    ids = np.fromiter((term_ids[term] for doc in documents for term in doc), dtype=np.int64)
+    return np.bincount(ids, minlength=len(term_ids))
+
+# Подсчет IDF; логарифм берётся по различным значениям df (их не больше числа
+# документов) через math.log, чтобы значения совпадали с прежним поэлементным
+# расчётом до последнего бита
+def compute_idf(df, total_docs):
+    idf = np.zeros(len(df))
+    present = df > 0
+    values, inverse = np.unique(df[present], return_inverse=True)
+    idf[present] = np.array([math.log(total_docs / value) for value in values.tolist()])[inverse]
     return idf
 
-# Подсчет TF-IDF
-def compute_tfidf(tf, idf):
-    tfidf = {}
-    for token, tf_value in tf.items():
-        tfidf[token] = tf_value * idf.get(token, 0)
-    return tfidf
-
-# Сохранение результатов в файлы
-def save_tfidf_to_file(doc_id, tfidf_tokens, tfidf_lemmas, idf_terms, idf_lemmas, output_dir):
-    # Сохранение для токенов
-    with open(os.path.join(output_dir, f'tfidf_doc_{doc_id}_tokens.txt'), 'w', encoding='utf-8') as file:
-        for token in sorted(tfidf_tokens.keys()):
-            tfidf_value = tfidf_tokens[token]
-            idf_value = idf_terms.get(token, 0)
-            file.write(f"{token} {idf_value} {tfidf_value}\n")
-    
-    # Сохранение для лемм
-    with open(os.path.join(output_dir, f'tfidf_doc_{doc_id}_lemmas.txt'), 'w', encoding='utf-8') as file:
-        for lemma in sorted(tfidf_lemmas.keys()):
-            tfidf_value = tfidf_lemmas[lemma]
-            idf_value = idf_lemmas.get(lemma, 0)
-            file.write(f"{lemma} {idf_value} {tfidf_value}\n")
+# Подсчет TF-IDF: строка на документ, tf = число вхождений / длина документа.
+# Нулевые веса (термин есть во всех документах) остаются явными элементами
+# матрицы, как строки с нулём в текстовых файлах
+def compute_tfidf(documents, term_ids, idf):
+    indptr = [0]
+    indices = []
+    counts = []
+    lengths = []
+    for doc in documents:
+        for term_id, count in sorted((term_ids[term], count) for term, count in Counter(doc).items()):
+            indices.append(term_id)
+            counts.append(count)
+        indptr.append(len(indices))
+        lengths.append(len(doc))
+    indptr = np.array(indptr, dtype=np.int64)
+    indices = np.array(indices, dtype=np.int32)
+    totals = np.repeat(np.array(lengths, dtype=np.float64), np.diff(indptr))
+    data = np.array(counts, dtype=np.float64) / totals * idf[indices]
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(documents), len(term_ids)))
+
+# Текстовый экспорт в прежнем формате "термин idf tfidf" (по файлу на документ)
+def save_tfidf_to_file(doc_id, kind, terms, row, idf, df, output_dir):
+    start, end = row.indptr[0], row.indptr[1]
+    with open(os.path.join(output_dir, f'tfidf_doc_{doc_id}_{kind}.txt'), 'w', encoding='utf-8') as file:
+        for term_id, tfidf_value in zip(row.indices[start:end].tolist(), row.data[start:end].tolist()):
+            idf_value = float(idf[term_id]) if df[term_id] else 0
+            file.write(f"{terms[term_id]} {idf_value} {tfidf_value}\n")
 
 def load_terms_and_lemmas(doc_id, tokens_folder, lemmas_folder):
     # Чтение терминов из файлов для каждого документа
@@ -120,44 +125,79 @@ def load_terms_and_lemmas(doc_id, tokens_folder, lemmas_folder):
     
     return tokens, lemmas
 
-def process_documents(input_folder, output_folder, tokens_folder, lemmas_folder):
-    documents = load_html_documents_from_folder(input_folder)
-    
-    all_tokens = set()
-    all_lemmas = set()
-    
-    documents_lemmas = [] 
-    documents_tokens = [] 
+# Токены и леммы документа: из хранилища task_2, если оно есть, иначе из HTML
+def document_terms(doc_id, documents, store):
+    if store is not None:
+        record = store.get(doc_id)
+        return set(record["tokens"]), [lemma.lower() for lemma in record["lemmas"]]
+    return preprocess_text(documents[doc_id])
+
+# Инвертированный индекс лемм для поиска в пространстве лемм: лемма -> документы
+def lemma_index(doc_ids, tf_lemmas):
+    index = {}
+    for doc_id, lemmas in zip(doc_ids, tf_lemmas):
+        for lemma in set(lemmas):
+            index.setdefault(lemma, []).append(doc_id)
+    return index
+
+def process_documents(input_folder, output_folder, tokens_folder, lemmas_folder,
+                      matrix_path=TFIDF_MATRIX_PATH, export_text=False, lemma_index_path=LEMMA_INDEX_PATH):
+    start = time.perf_counter()
+    store = open_fresh_docstore(input_folder)
+    documents = load_html_documents_from_folder(input_folder) if store is None else dict.fromkeys(store.doc_ids())
     doc_ids = sorted(documents.keys())
-    
+
+    documents_tokens = []
+    documents_lemmas = []
     for doc_id in doc_ids:
         tokens, lemmas = load_terms_and_lemmas(doc_id, tokens_folder, lemmas_folder)
-        documents_lemmas.append(set(lemmas.keys()))
-        documents_tokens.append(set(tokens))
-        all_tokens.update(tokens)
-        all_lemmas.update(lemmas.keys())
-    
-    idf_tokens = compute_idf(documents_tokens, all_tokens)
-    idf_lemmas = compute_idf(documents_lemmas, all_lemmas)
-    
+        documents_tokens.append(tokens)
+        documents_lemmas.append(lemmas.keys())
+
+    tf_tokens = []
+    tf_lemmas = []
     for doc_id in doc_ids:
-        text = documents[doc_id]
-        tokens, lemmatized_tokens = preprocess_text(text)
-        tf_tokens = compute_tf(tokens)
-        tf_lemmas = compute_tf(lemmatized_tokens)
-        tfidf_tokens = compute_tfidf(tf_tokens, idf_tokens)
-        tfidf_lemmas = compute_tfidf(tf_lemmas, idf_lemmas)
-        
-        save_tfidf_to_file(doc_id, tfidf_tokens, tfidf_lemmas, idf_tokens, idf_lemmas, output_folder)
-
-input_folder = "information-search/task_1/pages"  # Папка с HTML документами
-output_folder = "information-search/task_4/tfidf_output"  # Папка для результатов
-tokens_folder = "information-search/task_2/tokens"  # Папка с терминами для каждого документа
-lemmas_folder = "information-search/task_2/lemmas"  # Папка с леммами для каждого документа
-
-# Создание папки для сохранения результатов
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
-
-# Запуск обработки документов
-process_documents(input_folder, output_folder, tokens_folder, lemmas_folder)
+        tokens, lemmatized_tokens = document_terms(doc_id, documents, store)
+        tf_tokens.append(list(tokens))
+        tf_lemmas.append(lemmatized_tokens)
+    read_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sections = {}
+    for kind, df_documents, tf_documents in (("tokens", documents_tokens, tf_tokens),
+                                             ("lemmas", documents_lemmas, tf_lemmas)):
+        # В словарь попадают и термины, которых нет в файлах task_2: их IDF = 0
+        terms, term_ids = term_dictionary(df_documents, tf_documents)
+        df = document_frequencies(df_documents, term_ids)
+        idf = compute_idf(df, len(doc_ids))
+        matrix = compute_tfidf(tf_documents, term_ids, idf)
+        sections[kind] = (terms, doc_ids, matrix, idf)
+        if export_text:
+            for row_number, doc_id in enumerate(doc_ids):
+                save_tfidf_to_file(doc_id, kind, terms, matrix[row_number], idf, df, output_folder)
+    write_tfidf_matrix(sections, matrix_path)
+    write_binary_index(lemma_index(doc_ids, tf_lemmas), lemma_index_path)
+    print(f"TF-IDF: {len(doc_ids)} документов, терминов {len(sections['tokens'][0])}, "
+          f"лемм {len(sections['lemmas'][0])}; чтение {read_seconds:.2f} с, "
+          f"расчёт и запись {time.perf_counter() - start:.2f} с -> {matrix_path}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Расчёт TF-IDF по токенам и леммам")
+    parser.add_argument('--export-text', action='store_true',
+                        help="дополнительно записать текстовые файлы tfidf_doc_N_*.txt")
+    args = parser.parse_args()
+
+    input_folder = "information-search/task_1/pages"  # Папка с HTML документами
+    output_folder = "information-search/task_4/tfidf_output"  # Папка для текстового экспорта
+    tokens_folder = "information-search/task_2/tokens"  # Папка с терминами для каждого документа
+    lemmas_folder = "information-search/task_2/lemmas"  # Папка с леммами для каждого документа
+
+    # Создание папки для сохранения результатов
+    if args.export_text and not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    # Запуск обработки документов
+    process_documents(input_folder, output_folder, tokens_folder, lemmas_folder, export_text=args.export_text)
+    lemma_cache = get_lemma_cache()
+    lemma_cache.save()
+    lemma_cache.report()
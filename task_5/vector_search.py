@@ -1,120 +1,108 @@
+import argparse
+import json
 import os
-import numpy as np
-import math
-from bs4 import BeautifulSoup
-from collections import defaultdict
-import re
-
-# Пути к данным
-DOCS_PATH = 'information-search/task_1/pages'
-TFIDF_PATH = 'information-search/task_4/tfidf_output'
-INDEX_PATH = 'information-search/task_3/inverted_index.txt'
-NUM_DOCS = 111
-
-def load_inverted_index():
-    index = defaultdict(list)
-    with open(INDEX_PATH, 'r', encoding='utf-8') as file:
-        for line in file:
-            term, docs_str = line.strip().split(': ')
-            docs = list(map(int, re.findall(r'\d+', docs_str)))
-            index[term] = docs
-    return index
-
-def load_vocab_and_doc_vectors():
-    vocab = {}
-    doc_vectors = []
-    for i in range(NUM_DOCS):
-        vector = {}
-        file_path = os.path.join(TFIDF_PATH, f'tfidf_doc_{i}_tokens.txt')
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                token, idf, tfidf = line.strip().split()
-                vector[token] = float(tfidf)
-                if token not in vocab:
-                    vocab[token] = len(vocab)
-        doc_vectors.append(vector)
-    return vocab, doc_vectors
-
-def load_idf():
-    idf_values = {}
-    for i in range(NUM_DOCS):
-        file_path = os.path.join(TFIDF_PATH, f'tfidf_doc_{i}_tokens.txt')
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                token, idf, _ = line.strip().split()
-                idf_values[token] = float(idf)
-    return idf_values
-
-def vectorize(tokens, vocab, idf_values):
-    tf = defaultdict(int)
-    for token in tokens:
-        tf[token] += 1
-    total = len(tokens)
-    vec = np.zeros(len(vocab))
-    for token, count in tf.items():
-        if token in vocab and token in idf_values:
-            tfidf = (count / total) * idf_values[token]
-            vec[vocab[token]] = tfidf
-    return vec
-
-def get_document_vector(doc_vec, vocab):
-    vec = np.zeros(len(vocab))
-    for token, tfidf in doc_vec.items():
-        if token in vocab:
-            vec[vocab[token]] = tfidf
-    return vec
-
-def cosine_similarity(vec1, vec2):
-    if np.linalg.norm(vec1) == 0 or np.linalg.norm(vec2) == 0:
-        return 0.0
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
-
-def extract_title_from_html(doc_id):
-    path = os.path.join(DOCS_PATH, f'page_{doc_id}.html')
-    try:
-        with open(path, 'r', encoding='utf-8') as file:
-            soup = BeautifulSoup(file, 'html.parser')
-            title = soup.title.string if soup.title else f"Документ {doc_id}"
-            return title.strip()
-    except Exception as e:
-        print(f"Ошибка при чтении {doc_id}: {e}")
-        return f"Документ {doc_id}"
-
-def search(query_tokens, top_n=10):
-    print("Загружаем данные...")
-    vocab, doc_vectors = load_vocab_and_doc_vectors()
-    idf_values = load_idf()
-    index = load_inverted_index()
-
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from search_index import SearchIndex, extract_title_from_html
+from result_store import RESULT_STORE_PATH, ResultStore
+from metrics import metrics, profile
+from semantic_index import LSA_PATH, SemanticIndex
+from term_dictionary import split_query
+from quantization import PRECISIONS
+from segments import SEGMENTS_PATH
+
+def search(index, query_tokens, top_n=10, store=None, semantic=None):
     print("Обрабатываем запрос...")
-    query_vector = vectorize(query_tokens, vocab, idf_values)
-
-    # Используем индекс для сужения списка документов
-    relevant_docs = set()
-    for token in query_tokens:
-        relevant_docs.update(index.get(token, []))
-
+    relevant_docs = index.candidates(query_tokens)
     print(f"Найдено {len(relevant_docs)} релевантных документов")
 
-    scores = []
-    for doc_id in relevant_docs:
-        doc_vector = get_document_vector(doc_vectors[doc_id], vocab)
-        score = cosine_similarity(query_vector, doc_vector)
-        if score > 0:
-            scores.append((doc_id, score))
-
-    scores.sort(key=lambda x: x[1], reverse=True)
+    if semantic is not None:
+        scores = semantic.search(query_tokens, top_n)
+    else:
+        scores = index.search(query_tokens, top_n)
     print(f"\nТоп-{top_n} результатов:")
-    for doc_id, score in scores[:top_n]:
-        title = extract_title_from_html(doc_id)
+    with metrics.stage('render'):
+        titles = [(store.title(doc_id) if store is not None and doc_id in store else None)
+                  or extract_title_from_html(doc_id) for doc_id, _ in scores]
+    for (doc_id, score), title in zip(scores, titles):
         print(f"{title} (doc_{doc_id}.txt) — Score: {score:.4f}")
 
+def read_queries(lines, chunk_size):
+    # Файл запросов читается построчно, пачками по chunk_size: весь файл в
+    # память не загружается
+    chunk = []
+    for line in lines:
+        query = line.strip()
+        if query:
+            chunk.append(query)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def search_file(engine, lines, output, top_n=10, chunk_size=1024):
+    # Одна строка JSON на запрос: {"query": ..., "results": [[doc_id, score], ...]}
+    batch = getattr(engine, 'search_batch', None)
+    total = 0
+    start = time.perf_counter()
+    for queries in read_queries(lines, chunk_size):
+        tokens = [split_query(query) for query in queries]
+        scores = batch(tokens, top_n) if batch else [engine.search(query_tokens, top_n) for query_tokens in tokens]
+        for query, query_scores in zip(queries, scores):
+            output.write(json.dumps({'query': query, 'results': query_scores}, ensure_ascii=False) + '\n')
+        total += len(queries)
+    seconds = time.perf_counter() - start
+    print(f"Запросов: {total}, за {seconds:.2f} с ({total / seconds if seconds else 0:.0f} запросов/с)", file=sys.stderr)
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Векторный поиск по TF-IDF")
+    parser.add_argument('--profile', action='store_true', help="печатать время стадий каждого запроса")
+    parser.add_argument('--semantic', action='store_true', help="семантический режим (LSA, см. project/semantic_index.py)")
+    parser.add_argument('--lemmas', action='store_true', help="искать по леммам (TF-IDF лемм из task_4)")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="пакетный режим: запросы из файла по одному на строку ('-' — stdin), JSON Lines в stdout")
+    parser.add_argument('--output', help="файл для результатов пакетного режима вместо stdout")
+    parser.add_argument('--top', type=int, default=10, help="результатов на запрос в пакетном режиме")
+    parser.add_argument('--chunk', type=int, default=1024, help="запросов в одном умножении матриц")
+    parser.add_argument('--precision', choices=PRECISIONS, default='float64',
+                        help="хранение весов: float32/float16/int8 экономят память ценой точности оценок")
+    args = parser.parse_args()
+    space = 'lemmas' if args.lemmas else 'tokens'
+
+    if args.batch:
+        index = SearchIndex(space=space, precision=args.precision, segments_path=SEGMENTS_PATH)
+        engine = SemanticIndex(LSA_PATH) if args.semantic else index
+        source = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+        output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        with source, output:
+            search_file(engine, source, output, args.top, args.chunk)
+        sys.exit()
+
+    print("Загружаем данные...")
+    index = SearchIndex(space=space, precision=args.precision, segments_path=SEGMENTS_PATH)
+    store = ResultStore(RESULT_STORE_PATH) if os.path.exists(RESULT_STORE_PATH) else None
+    semantic = SemanticIndex(LSA_PATH) if args.semantic else None
     while True:
-        query = input("\nВведите поисковый запрос (или 'exit'): ").strip()
+        query = input("\nВведите поисковый запрос (или 'exit', 'reload'): ").strip()
         if query.lower() == 'exit':
             break
-        tokens = re.findall(r'\w+', query.lower())
-        search(tokens)
-
-
+        if query.lower() == 'reload':
+            if index.reload():
+                if args.semantic:
+                    semantic = SemanticIndex(LSA_PATH)
+                print(f"Индекс перезагружен (версия {index.version})")
+            else:
+                print("Данные на диске не изменились")
+            continue
+        if index.uses_segments:
+            # Сегменты дописывает потоковая индексация: новые страницы и
+            # удаления видны в следующем же запросе
+            index.reload()
+        tokens = split_query(query)
+        with profile() as query_profile:
+            search(index, tokens, store=store, semantic=semantic)
+        if args.profile:
+            print(query_profile.report())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Модули проекта импортируются так же, как из скриптов task_N: по пути к project/
+# (и к benchmarks/ — синтетический корпус для тестов поиска)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
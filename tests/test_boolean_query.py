@@ -0,0 +1,171 @@
+import fnmatch
+
+import numpy as np
+import pytest
+
+from boolean_query import (And, Near, Not, Or, Phrase, QueryPlanner, QuerySyntaxError, Term, Wildcard,
+                           node_from_json, node_to_json, parse_query)
+from positional_index import PositionalIndex, encode_positional_index
+
+# Маленький корпус: документ — список слов, позиция слова — его номер в списке
+DOCS = [
+    "machine learning for search engines".split(),
+    "deep learning and machine translation".split(),
+    "search engine ranking with learned models".split(),
+    "learning to rank search results".split(),
+    "the art of machine learning".split(),
+    "ranking models learn from clicks".split(),
+    "translation of search queries".split(),
+    "engines of the machine age".split(),
+]
+ALL = set(range(len(DOCS)))
+
+
+def build_planner():
+    postings = {}
+    positions = {}
+    for doc_id, words in enumerate(DOCS):
+        for position, word in enumerate(words):
+            postings.setdefault(word, set()).add(doc_id)
+            doc_ids, counts, flat = positions.setdefault(word, ([], [], []))
+            if not doc_ids or doc_ids[-1] != doc_id:
+                doc_ids.append(doc_id)
+                counts.append(0)
+            counts[-1] += 1
+            flat.append(position)
+    postings = {term: np.array(sorted(docs), dtype=np.int64) for term, docs in postings.items()}
+    return QueryPlanner(postings, len(DOCS), positions=PositionalIndex(encode_positional_index(positions, len(DOCS))))
+
+
+# Эталон: то же дерево запроса, вычисленное перебором по словам документов
+def brute_force(node):
+    if isinstance(node, Term):
+        return {i for i, words in enumerate(DOCS) if node.term in words}
+    if isinstance(node, Wildcard):
+        return {i for i, words in enumerate(DOCS) if any(fnmatch.fnmatchcase(w, node.pattern) for w in words)}
+    if isinstance(node, Phrase):
+        return {i for i, words in enumerate(DOCS)
+                if any(all(0 <= start + offset < len(words) and words[start + offset] == term
+                           for term, offset in zip(node.terms, node.offsets))
+                       for start in range(len(words)))}
+    if isinstance(node, Near):
+        return {i for i, words in enumerate(DOCS)
+                if any(a == node.left and b == node.right and p != q and abs(p - q) <= node.distance
+                       for p, a in enumerate(words) for q, b in enumerate(words))}
+    if isinstance(node, Not):
+        return ALL - brute_force(node.child)
+    if isinstance(node, And):
+        return set.intersection(*(brute_force(child) for child in node.children))
+    return set.union(*(brute_force(child) for child in node.children))
+
+
+def run(query):
+    return set(build_planner().evaluate(parse_query(query)).tolist())
+
+
+def docs_with(word):
+    return {i for i, words in enumerate(DOCS) if word in words}
+
+
+QUERIES = [
+    'machine',
+    'machine AND learning',
+    'machine OR translation',
+    'NOT machine',
+    'NOT NOT machine',
+    'NOT NOT NOT machine',
+    'machine AND NOT learning',
+    'NOT machine AND NOT search',
+    'NOT machine OR NOT search',
+    'NOT machine OR ranking',
+    'machine OR search AND ranking',
+    '(machine OR search) AND ranking',
+    'machine AND (learning OR translation) AND NOT deep',
+    'NOT (machine OR search)',
+    'missing',
+    'missing OR machine',
+    'NOT missing',
+    '"machine learning"',
+    '"learning machine"',
+    '"search engines" OR "search engine"',
+    'NOT "machine learning"',
+    '"machine learning" AND NOT deep',
+    'machine NEAR/1 learning',
+    'deep NEAR/4 translation',
+    'deep NEAR/3 translation',
+    'search NEAR/3 ranking AND NOT models',
+    'learn*',
+    'learn* AND NOT learning',
+    'engine*',
+    'rank?ng OR models',
+    'NOT learn* OR machine',
+    'машина ИЛИ machine И НЕ deep',
+]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_planner_matches_brute_force(query):
+    node = parse_query(query)
+    assert set(build_planner().evaluate(node).tolist()) == brute_force(node)
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_json_round_trip(query):
+    node = parse_query(query)
+    assert node_to_json(node_from_json(node_to_json(node))) == node_to_json(node)
+
+
+def test_precedence_not_and_or():
+    machine, search, ranking = docs_with('machine'), docs_with('search'), docs_with('ranking')
+    # NOT сильнее AND, AND сильнее OR
+    assert run('machine OR search AND ranking') == machine | (search & ranking)
+    assert run('NOT machine AND search') == (ALL - machine) & search
+    assert run('NOT machine OR search AND ranking') == (ALL - machine) | (search & ranking)
+    assert run('(machine OR search) AND ranking') == (machine | search) & ranking
+    assert run('NOT (machine AND search)') == ALL - (machine & search)
+
+
+def test_double_not():
+    assert run('NOT NOT machine') == docs_with('machine')
+    assert run('learning AND NOT NOT deep') == docs_with('learning') & docs_with('deep')
+
+
+def test_case_insensitive_operators_and_terms():
+    assert run('Machine and NOT Learning') == docs_with('machine') - docs_with('learning')
+
+
+def test_phrase_and_near():
+    assert run('"machine learning"') == {0, 4}
+    assert run('"learning machine"') == set()
+    assert run('deep NEAR/4 translation') == {1}
+    assert run('deep NEAR/3 translation') == set()
+
+
+def test_wildcard_expansion():
+    assert run('learn*') == docs_with('learning') | docs_with('learned') | docs_with('learn')
+    assert run('engine?') == docs_with('engines')
+    assert run('xyz*') == set()
+
+
+@pytest.mark.parametrize('query', [
+    '', 'machine AND', 'AND machine', 'machine OR OR search', '(machine', 'machine)',
+    'NOT', '"machine learning', '*', 'machine NEAR/2', '"machine learning" NEAR/2 search',
+    'machine NEAR/2 (search)',
+])
+def test_syntax_errors(query):
+    with pytest.raises(QuerySyntaxError):
+        run(query)
+
+
+def test_phrase_without_positions_is_an_error():
+    planner = build_planner()
+    planner.positions = None
+    with pytest.raises(QuerySyntaxError):
+        planner.evaluate(parse_query('"machine learning"'))
+
+
+def test_complement_uses_live_docs():
+    # Удалённые документы (нет в all_docs) не попадают в NOT
+    planner = build_planner()
+    planner.all_docs = np.array([0, 1, 2, 3], dtype=np.int64)
+    assert set(planner.evaluate(parse_query('NOT machine')).tolist()) == {2, 3}
@@ -0,0 +1,79 @@
+import os
+
+import page_hashes
+from page_hashes import page_files, page_id
+
+
+def write_pages(folder, pages):
+    folder.mkdir(exist_ok=True)
+    for name, text in pages.items():
+        (folder / name).write_text(text, encoding='utf-8')
+
+
+def counting_digest(monkeypatch):
+    calls = []
+    digest = page_hashes.file_digest
+
+    def wrapper(path):
+        calls.append(os.path.basename(path))
+        return digest(path)
+    monkeypatch.setattr(page_hashes, 'file_digest', wrapper)
+    return calls
+
+
+def test_page_id():
+    assert page_id('page_12.html') == 12
+    assert page_id('12.html') == 12
+    assert page_id('page_12.txt') is None
+    assert page_id('index.html') is None
+
+
+def test_only_changed_pages_are_hashed(tmp_path, monkeypatch):
+    folder = tmp_path / 'pages'
+    write_pages(folder, {'page_1.html': 'one', 'page_2.html': 'two', 'notes.txt': 'x'})
+    calls = counting_digest(monkeypatch)
+    first = page_hashes.page_hashes(str(folder))
+    assert sorted(first) == [1, 2] and sorted(calls) == ['page_1.html', 'page_2.html']
+    assert (tmp_path / page_hashes.CACHE_NAME).exists()
+
+    calls.clear()
+    assert page_hashes.page_hashes(str(folder)) == first
+    assert calls == []
+
+    (folder / 'page_2.html').write_text('two, edited', encoding='utf-8')
+    (folder / 'page_1.html').unlink()
+    second = page_hashes.page_hashes(str(folder))
+    assert calls == ['page_2.html']
+    assert sorted(second) == [2] and second[2] != first[2]
+    assert 'page_1.html' not in page_hashes.read_cache(str(tmp_path / page_hashes.CACHE_NAME))
+
+
+def test_touched_page_keeps_its_hash(tmp_path, monkeypatch):
+    # Новое время изменения без новых данных (как после git clone):
+    # страница хешируется заново, хеш тот же
+    folder = tmp_path / 'pages'
+    write_pages(folder, {'page_3.html': 'three'})
+    first = page_hashes.page_hashes(str(folder))
+    stat = os.stat(folder / 'page_3.html')
+    os.utime(folder / 'page_3.html', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    calls = counting_digest(monkeypatch)
+    assert page_hashes.page_hashes(str(folder)) == first
+    assert calls == ['page_3.html']
+
+
+def test_explicit_paths(tmp_path):
+    folder = tmp_path / 'pages'
+    write_pages(folder, {'page_1.html': 'one', 'page_2.html': 'two'})
+    paths = page_files(str(folder))
+    hashes = page_hashes.page_hashes(str(folder), {2: paths[2], 7: str(folder / 'page_7.html')})
+    assert list(hashes) == [2]
+
+
+def test_hashes_signature_depends_on_content_only(tmp_path):
+    folder = tmp_path / 'pages'
+    write_pages(folder, {'page_1.html': 'one', 'page_2.html': 'two'})
+    signature = page_hashes.hashes_signature(page_hashes.page_hashes(str(folder)))
+    os.utime(folder / 'page_1.html', ns=(0, 10 ** 9))
+    assert page_hashes.hashes_signature(page_hashes.page_hashes(str(folder))) == signature
+    (folder / 'page_2.html').write_text('two!', encoding='utf-8')
+    assert page_hashes.hashes_signature(page_hashes.page_hashes(str(folder))) != signature
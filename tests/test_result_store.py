@@ -0,0 +1,61 @@
+from result_store import ResultStore, make_snippet, write_result_store
+
+
+def filler(words):
+    return ' '.join(f"word{i}" for i in range(words))
+
+
+def test_snippet_centres_on_late_match(tmp_path):
+    # Слово запроса далеко от начала страницы: фрагмент всё равно вокруг него
+    text = filler(5000) + ' neural <b>network</b> ' + filler(100)
+    path = str(tmp_path / 'results.bin')
+    write_result_store({3: ('Title', 'https://example.org/3', text)}, path)
+    store = ResultStore(path)
+    try:
+        title, url, stored = store.get(3)
+        assert (title, url) == ('Title', 'https://example.org/3')
+        snippet = store.snippet(3, ['network'])
+    finally:
+        store.close()
+    assert stored.endswith(filler(100))
+    assert snippet.startswith('…') and snippet.endswith('…')
+    assert '<mark>network</mark>' in snippet
+    assert '&lt;b&gt;' in snippet
+
+
+def test_first_match_agrees_with_text_search(tmp_path):
+    text = 'Alpha beta, GAMMA-delta beta; epsilon ' + filler(3000) + ' Zeta alpha-beta zeta'
+    path = str(tmp_path / 'results.bin')
+    write_result_store({0: ('T', None, text)}, path)
+    store = ResultStore(path)
+    try:
+        stored = store.get(0)[2]
+        queries = [['beta'], ['gamma'], ['zeta'], ['delta', 'zeta'], ['word2999'], ['absent'], ['word1', 'zeta']]
+        for query in queries:
+            assert store.snippet(0, query) == make_snippet(stored, query)
+        assert store.first_match(0, ['zeta', 'absent']) == text.index('Zeta')
+        assert store.first_match(0, ['absent']) == -1
+        # Шаблон не слово: фрагмент ищется по тексту
+        assert store.first_match(0, ['gam*']) is None
+    finally:
+        store.close()
+
+
+def test_snippet_without_match_starts_at_beginning():
+    text = filler(200)
+    snippet = make_snippet(text, ['absent'])
+    assert snippet.startswith('word0 ') and snippet.endswith('…')
+    assert '<mark>' not in snippet
+
+
+def test_missing_document(tmp_path):
+    path = str(tmp_path / 'results.bin')
+    write_result_store({0: ('A', None, 'text'), 2: ('B', None, 'more text')}, path)
+    store = ResultStore(path)
+    try:
+        assert 1 not in store and 5 not in store
+        assert store.get(1) is None
+        assert store.snippet(1, ['text']) == ''
+        assert store.get(2) == ('B', '', 'more text')
+    finally:
+        store.close()
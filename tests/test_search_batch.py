@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from search_index import BATCH_LONG_POSTINGS, SearchIndex
+from synthetic_corpus import generate_corpus, generate_queries
+
+# search_batch() должен отвечать ровно то же, что search() по одному запросу:
+# те же документы, в том же порядке, с теми же оценками
+
+NUM_DOCS = 3000
+VOCAB_SIZE = 2000
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    return generate_corpus(NUM_DOCS, VOCAB_SIZE, doc_length=60)
+
+
+@pytest.fixture(scope='module')
+def queries():
+    queries = generate_queries(VOCAB_SIZE, 150, 3, head=5)
+    queries += generate_queries(VOCAB_SIZE, 50, 2, seed=2)
+    # Префиксы, повторы терминов, неизвестные и пустые запросы
+    queries += [['t1*', 't500'], ['t7', 't7', 't40'], ['unknown'], [], ['t0'], ['t1999', 'unknown']]
+    return queries
+
+
+def assert_same(index, queries, top_n, batch_size=64):
+    assert index.search_batch(queries, top_n, batch_size=batch_size) == [index.search(q, top_n) for q in queries]
+
+
+def spy(monkeypatch, name):
+    calls = []
+    method = getattr(SearchIndex, name)
+
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        calls.append((args, result))
+        return result
+    monkeypatch.setattr(SearchIndex, name, wrapper)
+    return calls
+
+
+@pytest.mark.parametrize('top_n', [1, 3, 10, 50])
+def test_pruned_path(corpus, queries, top_n, monkeypatch):
+    vocab, matrix, idf, index = corpus
+    # В корпусе есть длинные списки, которые в произведение не входят
+    assert (np.diff(matrix.tocsc().indptr) > max(BATCH_LONG_POSTINGS, NUM_DOCS // 8)).sum() > 1
+    calls = spy(monkeypatch, '_search_pruned')
+    masked = spy(monkeypatch, '_search_masked')
+    assert_same(SearchIndex.from_matrix(vocab, matrix, idf, index), queries, top_n)
+    assert calls and not masked
+    # Хотя бы часть запросов действительно отсечена по границам, а не ушла в MaxScore
+    pruned = sum(int(((args[3] > 0).sum())) - len(failed) for args, (_, failed) in calls)
+    assert pruned > 0
+
+
+@pytest.mark.parametrize('top_n', [1, 10, 50])
+def test_masked_path_when_postings_miss_weights(corpus, queries, top_n, monkeypatch):
+    vocab, matrix, idf, index = corpus
+    # Списки не покрывают все ненулевые веса: из части списков убраны
+    # документы, и кандидатами search() они быть перестают
+    rng = np.random.default_rng(5)
+    partial = {term: docs[rng.random(len(docs)) > 0.3] if i % 3 == 0 else docs
+               for i, (term, docs) in enumerate(index.items())}
+    search_index = SearchIndex.from_matrix(vocab, matrix, idf, partial)
+    assert not search_index._data.postings_cover_matrix
+    calls = spy(monkeypatch, '_search_masked')
+    pruned = spy(monkeypatch, '_search_pruned')
+    assert_same(search_index, queries, top_n)
+    assert calls and not pruned
+
+
+def test_masked_path_with_quantized_weights(corpus, queries, monkeypatch):
+    vocab, matrix, idf, index = corpus
+    # Сжатые веса: матрицы документов нет, оценки совпадают с search() до
+    # погрешности float32 (суммы складываются в другом порядке)
+    calls = spy(monkeypatch, '_search_masked')
+    search_index = SearchIndex.from_matrix(vocab, matrix, idf, index, precision='float32')
+    batch = search_index.search_batch(queries, 10, batch_size=64)
+    assert calls
+    for result, expected in zip(batch, [search_index.search(q, 10) for q in queries]):
+        assert [doc for doc, _ in result] == [doc for doc, _ in expected]
+        assert [score for _, score in result] == pytest.approx([score for _, score in expected], rel=1e-6)
+
+
+@pytest.mark.parametrize('index_kind', ['postings', 'matrix'])
+def test_ties_are_ordered_by_doc_id(index_kind):
+    # Одинаковые документы дают одинаковые оценки, порядок — по doc id
+    counts = sparse.csr_matrix(np.array([
+        [1, 1, 0, 0],
+        [0, 0, 1, 1],
+        [1, 1, 0, 0],
+        [1, 1, 0, 0],
+        [0, 1, 1, 0],
+        [1, 1, 0, 0],
+        [0, 0, 0, 1],
+    ], dtype=np.float64))
+    num_docs, vocab_size = counts.shape
+    df = np.bincount(counts.indices, minlength=vocab_size)
+    idf = np.log(num_docs / df)
+    matrix = counts.multiply(idf).tocsr()
+    vocab = {f"w{i}": i for i in range(vocab_size)}
+    columns = counts.tocsc()
+    index = {f"w{i}": np.sort(columns.indices[columns.indptr[i]:columns.indptr[i + 1]]).astype(np.int64)
+             for i in range(vocab_size)} if index_kind == 'postings' else None
+    search_index = SearchIndex.from_matrix(vocab, matrix, idf, index)
+    queries = [['w0'], ['w1'], ['w0', 'w1'], ['w2', 'w3'], ['w1', 'w2']]
+    for top_n in (1, 2, 3, 10):
+        assert_same(search_index, queries, top_n, batch_size=2)
+    assert [doc for doc, _ in search_index.search_batch([['w0']], 3)[0]] == [0, 2, 3]
+
+
+def test_top_n_larger_than_candidates(corpus):
+    vocab, matrix, idf, index = corpus
+    search_index = SearchIndex.from_matrix(vocab, matrix, idf, index)
+    rare = [term for term, docs in index.items() if 0 < len(docs) <= 3][:20]
+    queries = [[term] for term in rare] + [rare[:3]]
+    results = search_index.search_batch(queries, NUM_DOCS)
+    assert results == [search_index.search(q, NUM_DOCS) for q in queries]
+    assert all(0 < len(result) <= 9 for result in results)
+
+
+def test_non_positive_top_n(corpus):
+    vocab, matrix, idf, index = corpus
+    search_index = SearchIndex.from_matrix(vocab, matrix, idf, index)
+    assert search_index.search_batch([['t5'], ['t6']], 0) == [[], []]
@@ -0,0 +1,189 @@
+import math
+import os
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from segments import SegmentedIndex
+
+
+def build(directory, num_docs=6):
+    index = SegmentedIndex(str(directory), merge_factor=3)
+    for doc_id in range(num_docs):
+        index.add_document(doc_id, [f"w{doc_id % 3}", "common"], str(doc_id))
+    return index
+
+
+def test_merged_files_are_kept_until_next_merge(tmp_path):
+    writer = build(tmp_path)
+    reader = SegmentedIndex(str(tmp_path))
+    first = writer.merge(writer.segments[:3])
+    # Файлы слитых сегментов ещё на месте: читатель со старым списком их загрузит
+    assert all(os.path.exists(tmp_path / (name + '.npz')) for name, _ in writer.retired)
+    assert reader.refresh()
+    writer.merge([first] + writer.segments[1:3])
+    assert len(writer.retired) == 3
+    assert not any(name.startswith(('segment_000000.', 'segment_000001.', 'segment_000002.'))
+                   for name in os.listdir(tmp_path))
+    assert reader.refresh()
+    assert reader.all_docs().tolist() == writer.all_docs().tolist()
+
+
+def test_refresh_rereads_manifest_when_segment_disappears(tmp_path):
+    reader = SegmentedIndex(str(tmp_path))
+    writer = build(tmp_path)
+    stale = writer.read_manifest()
+    writer.add_document(10, ["late"], "10")
+    writer.merge(writer.segments[-4:])
+    writer.merge(writer.segments[:3])
+    # Первое чтение возвращает список, сегменты которого уже удалены
+    manifests = [stale]
+    read_manifest = reader.read_manifest
+    reader.read_manifest = lambda: manifests.pop() if manifests else read_manifest()
+    assert reader.refresh()
+    assert not manifests
+    assert reader.all_docs().tolist() == writer.all_docs().tolist() == [0, 1, 2, 3, 4, 5, 10]
+
+
+def test_deletes_during_merge_survive(tmp_path):
+    writer = build(tmp_path)
+    writer.delete_document(1)
+    merged = writer.merge(writer.segments[:3])
+    assert 1 not in writer and merged.live_count() == 2
+    reopened = SegmentedIndex(str(tmp_path))
+    assert reopened.all_docs().tolist() == [0, 2, 3, 4, 5]
+    assert reopened.document_frequency('common') == 5
+
+
+def add_text(index, doc_id, text):
+    positions = list(enumerate(text.split()))
+    index.add_document(doc_id, sorted({token for _, token in positions}), text, positions)
+
+
+def phrase_docs(index, query):
+    from boolean_query import QueryPlanner, parse_query
+    snapshot = index.snapshot()
+    planner = QueryPlanner(snapshot, snapshot.num_docs, snapshot.all_docs, positions=snapshot.positions())
+    return planner.evaluate(parse_query(query)).tolist()
+
+
+def test_phrases_follow_updates_and_merges(tmp_path):
+    index = SegmentedIndex(str(tmp_path), merge_factor=3)
+    add_text(index, 0, "machine learning for search")
+    add_text(index, 1, "search engines and machine translation")
+    add_text(index, 2, "learning machine")
+    assert phrase_docs(index, '"machine learning"') == [0]
+    # Изменённая страница: старые позиции больше не находятся, новые — находятся
+    add_text(index, 0, "deep learning machine")
+    add_text(index, 3, "applied machine learning")
+    assert phrase_docs(index, '"machine learning"') == [3]
+    assert phrase_docs(index, '"learning machine"') == [0, 2]
+    assert phrase_docs(index, 'machine NEAR/1 translation') == [1]
+    index.delete_document(2)
+    assert phrase_docs(index, '"learning machine"') == [0]
+
+    index.merge(list(index.segments))
+    reopened = SegmentedIndex(str(tmp_path))
+    assert len(reopened.segments) == 1
+    assert phrase_docs(reopened, '"learning machine"') == [0]
+    assert phrase_docs(reopened, '"machine learning" OR "search engines"') == [1, 3]
+
+
+def test_segments_without_positions_disable_phrases(tmp_path):
+    index = SegmentedIndex(str(tmp_path))
+    add_text(index, 0, "machine learning")
+    index.add_document(1, ["machine", "learning"], "1")
+    assert index.live_positions() is None
+    index.delete_document(1)
+    assert index.live_positions() is not None
+
+
+TEXTS = [
+    "machine learning for search engines",
+    "deep learning and machine translation",
+    "search engine ranking with learned models",
+    "learning to rank search results search",
+    "the art of machine learning",
+    "ranking models learn from clicks",
+]
+
+
+def build_texts(directory):
+    index = SegmentedIndex(str(directory), merge_factor=3)
+    for doc_id, text in enumerate(TEXTS):
+        add_text(index, doc_id * 2, text)
+    index.delete_document(4)
+    add_text(index, 6, "machine learning models learn ranking")
+    return index
+
+
+def brute_force_cosine(documents, query):
+    # TF-IDF по живым документам: tf = вхождения / длина, idf = log(N / df)
+    df = Counter(term for words in documents.values() for term in set(words))
+    idf = {term: math.log(len(documents) / count) for term, count in df.items()}
+
+    def vector(words):
+        counts = Counter(words)
+        return {term: count / len(words) * idf[term] for term, count in counts.items() if term in idf}
+    query_vector = vector(query)
+    query_norm = math.sqrt(sum(w * w for w in query_vector.values()))
+    scores = {}
+    for doc_id, words in documents.items():
+        doc_vector = vector(words)
+        dot = sum(w * doc_vector.get(term, 0.0) for term, w in query_vector.items())
+        norm = math.sqrt(sum(w * w for w in doc_vector.values()))
+        if dot > 0:
+            scores[doc_id] = dot / (norm * query_norm)
+    return scores
+
+
+@pytest.mark.parametrize('query', [['machine'], ['machine', 'learning'], ['search', 'search', 'ranking'],
+                                   ['learn', 'clicks', 'nosuch'], ['the']])
+def test_snapshot_scores_match_tfidf_cosine(tmp_path, query):
+    index = build_texts(tmp_path)
+    # В сегментах хранятся множества терминов (tf по уникальным словам)
+    live = {0: TEXTS[0], 2: TEXTS[1], 6: "machine learning models learn ranking", 8: TEXTS[4], 10: TEXTS[5]}
+    documents = {doc_id: sorted(set(text.split())) for doc_id, text in live.items()}
+    snapshot = index.snapshot()
+    doc_ids, cosine = snapshot.score(*snapshot.query_weights(query))
+    expected = brute_force_cosine(documents, query)
+    assert dict(zip(doc_ids.tolist(), cosine.tolist())) == pytest.approx(expected)
+
+
+def test_snapshot_postings_and_wildcards(tmp_path):
+    index = build_texts(tmp_path)
+    snapshot = index.snapshot()
+    assert snapshot.get('machine').tolist() == [0, 2, 6, 8]
+    assert snapshot.get('search').tolist() == [0]
+    assert snapshot.get('nosuch') is None and 'nosuch' not in snapshot
+    # У удалённого документа 4 были "engine" и "with": живых документов с ними нет
+    assert 'with' not in snapshot
+    from term_dictionary import expand_pattern
+    assert expand_pattern(snapshot, 'learn*') == ['learn', 'learning']
+    assert expand_pattern(snapshot, 'eng*') == ['engines']
+    assert index.snapshot() is snapshot
+    index.delete_document(0)
+    assert index.snapshot() is not snapshot
+
+
+def test_refresh_matches_fresh_open(tmp_path):
+    writer = build_texts(tmp_path)
+    reader = SegmentedIndex(str(tmp_path))
+    add_text(writer, 20, "new page about machine search")
+    writer.delete_document(2)
+    writer.merge(writer.segments[:3])
+    add_text(writer, 0, "replaced first page")
+    assert reader.refresh()
+    fresh = SegmentedIndex(str(tmp_path))
+    for index in (reader, writer):
+        assert index.all_docs().tolist() == fresh.all_docs().tolist()
+        assert {doc_id: segment.name for doc_id, (segment, _) in index.locations.items()} == \
+            {doc_id: segment.name for doc_id, (segment, _) in fresh.locations.items()}
+        for term in fresh.term_ids:
+            assert index.document_frequency(term) == fresh.document_frequency(term)
+        snapshot, expected = index.snapshot(), fresh.snapshot()
+        for query in (['machine'], ['page', 'search'], ['ranking', 'learn']):
+            got, want = snapshot.score(*snapshot.query_weights(query)), expected.score(*expected.query_weights(query))
+            assert got[0].tolist() == want[0].tolist()
+            assert np.allclose(got[1], want[1])